@@ -0,0 +1,1604 @@
+#!/usr/bin/env python
+
+# (C) 2015 Andrew Vaught
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY
+# WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+# Benchmarks for the SSE compiler.  Run as
+#
+#     python bench.py <name> [ <name> ... ]
+#
+# where each name is one of the bench_*() functions below, without the
+# prefix.  The inputs are synthetic kernels generated on the fly, in
+# the style of machine-written code.
+
+import os, sys, tempfile, time
+
+from kw import tok_eof, word, constant
+
+
+# The directory of the compiler.  Benchmarks that start the compiler
+# in another process run its scripts from here, and run Python there,
+# so that they work from any directory.
+
+source_dir = os.path.dirname(os.path.abspath(__file__))
+
+
+# script()-- Return the path of one of the compiler's scripts.
+
+def script(name):
+    return os.path.join(source_dir, name)
+
+
+# timed()-- Call a function, returning the best wall time of several
+# runs along with the function's last return value.
+
+def timed(func, repeat=3):
+    best = None
+
+    for i in range(repeat):
+        t = time.time()
+        result = func()
+        t = time.time() - t
+
+        if best is None or t < best:
+            best = t
+            pass
+
+        pass
+
+    return best, result
+
+
+# temp_source()-- Write source text to a temporary file, returning the
+# filename.  The caller removes it.
+
+def temp_source(text):
+    fd, filename = tempfile.mkstemp(suffix='.sse')
+    os.write(fd, text)
+    os.close(fd)
+    return filename
+
+
+# statement_text()-- Return the text of a synthetic statement.
+
+def statement_text(n):
+    return 'v%d = (v%d + %d.5) * v%d - %d;' % (n % 7, (n+1) % 7, n, (n+3) % 7, n)
+
+
+# long_line_source()-- Source consisting of a few very long lines.
+
+def long_line_source(lines=40, width=20000):
+    result = []
+
+    for i in range(lines):
+        line = []
+        w = 0
+        n = 0
+
+        while w < width:
+            st = statement_text(n)
+            line.append(st)
+            w += len(st) + 1
+            n += 1
+            pass
+
+        result.append(' '.join(line))
+        pass
+
+    return '\n'.join(result) + '\n'
+
+
+# many_line_source()-- Source consisting of many short lines, with some
+# comments thrown in.
+
+def many_line_source(lines=100000):
+    result = []
+
+    for n in range(lines):
+        if n % 10 == 0:
+            result.append('/* block %d */' % n)
+
+        elif n % 10 == 5:
+            result.append('    ' + statement_text(n) + '   // note')
+
+        else:
+            result.append('    ' + statement_text(n))
+            pass
+
+        pass
+
+    return '\n'.join(result) + '\n'
+
+
+# kernel_source()-- A procedure of generated arithmetic, in the style
+# of an unrolled kernel.  Every variable is assigned before it is used.
+
+def kernel_source(statements=1000, nvars=16, name='kernel'):
+    names = [ 'v%d' % i for i in range(nvars) ]
+
+    result = [ 'int4 %s() {' % name, '    int4 %s;' % ', '.join(names) ]
+
+    for i, v in enumerate(names):
+        result.append('    %s = %d;' % (v, i+1))
+        pass
+
+    for n in range(statements):
+        a = names[n % nvars]
+        b = names[(7*n + 3) % nvars]
+        c = names[(5*n + 1) % nvars]
+
+        result.append('    %s = (%s + %d) * %s - %s;' % (a, b, n % 8, c, a))
+        pass
+
+    result.append('    return %s;' % names[0])
+    result.append('}')
+
+    return '\n'.join(result) + '\n'
+
+
+# loop_source()-- A procedure with a loop, using only the operations
+# that the back end can generate code for.
+
+def loop_source(statements=20, name='loop'):
+    result = [ 'int4 %s(int4 z) {' % name, '    int4 c, d, e;',
+               '    z = 3;', '    c = 10;', '    d = 0;', '    e = 1;',
+               '    while (c > 0) {' ]
+
+    for n in range(statements):
+        if n % 2 == 0:
+            result.append('        d = d + c;')
+
+        else:
+            result.append('        e = e - d;')
+            pass
+
+        pass
+
+    result.extend([ '        c = c - 1;', '    }', '    return d;', '}' ])
+    return '\n'.join(result) + '\n'
+
+
+# straight_source()-- A procedure of straight-line code, using only
+# the operations that the back end can generate code for.
+
+def straight_source(statements=1000, name='straight'):
+    result = [ 'int4 %s(int4 z) {' % name, '    int4 c, d, e;',
+               '    z = 3;', '    c = 10;', '    d = 0;', '    e = 1;' ]
+
+    for n in range(statements):
+        result.append([ '    d = d + c;', '    e = e - d;',
+                        '    c = c + (e - z);' ][n % 3])
+        pass
+
+    result.extend([ '    return d;', '}' ])
+    return '\n'.join(result) + '\n'
+
+
+# nest_source()-- A procedure with nested loops and a condition, whose
+# loop body works through temporaries that are dead outside of it.
+
+def nest_source(temps=6, name='nest'):
+    names = [ 't%d' % i for i in range(temps) ]
+
+    result = [ 'int4 %s(int4 z) {' % name,
+               '    int4 c, d, e, %s;' % ', '.join(names),
+               '    c = 10;', '    d = 0;', '    e = 1;' ]
+
+    for t in names:
+        result.append('    %s = 0;' % t)
+        pass
+
+    result.extend([ '    while (c > 0) {', '        e = c;',
+                    '        while (e > 0) {',
+                    '            %s = e - c;' % names[0] ])
+
+    for i in range(1, temps):
+        result.append('            %s = %s + %s;' % (names[i], names[i-1],
+                                                     [ 'c', 'e' ][i % 2]))
+        pass
+
+    result.extend([ '            d = d + %s;' % names[-1],
+                    '            e = e - 1;', '        }',
+                    '        if (d > 100) {', '            d = 0;', '        }',
+                    '        c = c - 1;', '    }', '    return d;', '}' ])
+
+    return '\n'.join(result) + '\n'
+
+
+# cond_source()-- A loop holding an inner loop and a condition.  The
+# variable 'e' is dead at the top of the outer loop, which in the
+# minimal form leaves a dead phi function there.
+
+def cond_source(name='cond'):
+    return '\n'.join([ 'int4 %s(int4 z) {' % name,
+                       '    int4 c, d, e;',
+                       '    c = 10;', '    d = 0;', '    e = 1;',
+                       '    while (c > 0) {', '        e = c;',
+                       '        while (e > 0) {',
+                       '            d = d + (e - c);',
+                       '            e = e - 1;', '        }',
+                       '        if (d > 100) {', '            d = 0;',
+                       '        }', '        c = c - 1;', '    }',
+                       '    return d;', '}' ]) + '\n'
+
+
+# deep_source()-- A procedure assigning a chain of additions and
+# subtractions, which parses as an expression nested to the depth of
+# the chain.  The back end splits it into temporaries in front of the
+# assignment, inside a block that already exists.
+
+def deep_source(depth=100, name='deep'):
+    e = 'c'
+
+    for n in range(depth):
+        e += ' %s %d' % ('+-'[n % 2], n)
+        pass
+
+    return '\n'.join([ 'int4 %s(int4 z) {' % name, '    int4 c, d;',
+                       '    c = 10;', '    d = %s;' % e, '    return d;',
+                       '}' ]) + '\n'
+
+
+### Lexer benchmarks
+
+def count_tokens(lex):
+    n = 0
+    while lex.next_token() is not tok_eof:
+        n += 1
+        pass
+
+    return n
+
+
+# bench_lexer()-- Compare the whole-file and line-at-a-time scanners
+# on long-line and many-line inputs.
+
+def bench_lexer():
+    import lexer
+
+    for name, text in [ ('long lines', long_line_source()),
+                        ('many lines', many_line_source()) ]:
+        filename = temp_source(text)
+
+        print '%s: %d bytes' % (name, len(text))
+
+        for mode, whole_file in [ ('line-at-a-time', False),
+                                  ('whole-file', True) ]:
+
+            t, n = timed(lambda: count_tokens(lexer.lexer(filename, whole_file)))
+            print '    %-16s %8d tokens  %7.3fs  %10.0f tokens/s' % \
+                (mode, n, t, n / t)
+            pass
+
+        os.remove(filename)
+        pass
+
+    return
+
+
+# bench_lexer_init()-- Per-instance cost of creating a lexer on a tiny
+# kernel.  Before the dispatch tables were shared, each instance built
+# them itself, which is what init_tables() does now.
+
+def bench_lexer_init(count=20000):
+    import lexer
+
+    text = 'void f() { }'
+
+    def shared():
+        for i in xrange(count):
+            lexer.lexer('<bench>', source=text)
+            pass
+
+        return
+
+    def per_instance():
+        for i in xrange(count):
+            lexer.init_tables()
+            lexer.lexer('<bench>', source=text)
+            pass
+
+        return
+
+    for name, func in [ ('tables per instance', per_instance),
+                        ('shared tables', shared) ]:
+        t, r = timed(func)
+        print '%-20s %8.2f us/lexer' % (name, 1e6 * t / count)
+        pass
+
+    return
+
+
+# object_size()-- Size of an instance, including its dictionary and
+# the value it holds.
+
+def object_size(obj):
+    size = sys.getsizeof(obj) + sys.getsizeof(obj.__dict__)
+
+    if isinstance(obj, word):
+        size += sys.getsizeof(obj.name)
+
+    elif isinstance(obj, constant):
+        size += sys.getsizeof(obj.value) + object_size(obj.type)
+        pass
+
+    return size
+
+
+# bench_intern()-- Allocation and memory savings from interning the
+# identifiers and literals of a large kernel.  Without interning,
+# every occurrence was a new object.
+
+def bench_intern(statements=100000):
+    import lexer
+
+    lex = lexer.lexer('<bench>', source=kernel_source(statements))
+
+    occurrences = 0
+    before = after = 0
+    seen = {}
+
+    while True:
+        t = lex.next_token()
+        if t is tok_eof:
+            break
+
+        if not isinstance(t, (word, constant)):
+            continue
+
+        size = object_size(t)
+
+        occurrences += 1
+        before += size
+
+        if id(t) not in seen:
+            seen[id(t)] = t
+            after += size
+            pass
+
+        pass
+
+    print 'Names and literals: %d occurrences, %d distinct objects' % \
+        (occurrences, len(seen))
+
+    print 'Memory: %.1f MB allocated before, %.3f MB after' % \
+        (before / 1e6, after / 1e6)
+
+    return
+
+
+# bench_incremental()-- Cost of re-lexing a 5000 line kernel after a
+# one line edit, against scanning the whole text again.
+
+def bench_incremental(statements=5000):
+    import lexer
+
+    text = kernel_source(statements)
+    inc = lexer.incremental_lexer('<bench>', text)
+    line = statements / 2
+
+    def full():
+        return len(lexer.incremental_lexer('<bench>', text).tokens())
+
+    def edit():
+        return inc.edit(line, 5, line, 7, 'v3')
+
+    def open_comment():
+        inc.edit(line, 1, line, 1, '/*')
+        return inc.edit(line, 1, line, 3, '')
+
+    for name, func in [ ('full rescan', full), ('one line edit', edit),
+                        ('comment in, out', open_comment) ]:
+        t, r = timed(func)
+        print '%-16s %10.3f ms' % (name, 1e3 * t)
+        pass
+
+    return
+
+
+# expression_source()-- A procedure whose statements are deep
+# expressions using most of the operators.
+
+def expression_source(statements=1000, nvars=16, name='expressions'):
+    names = [ 'v%d' % i for i in range(nvars) ]
+
+    result = [ 'int4 %s() {' % name, '    int4 %s;' % ', '.join(names) ]
+
+    for i, v in enumerate(names):
+        result.append('    %s = %d;' % (v, i+1))
+        pass
+
+    for n in range(statements):
+        v = [ names[(k*n + k) % nvars] for k in range(1, 10) ]
+
+        result.append('    %s = ((%s + %d) * (%s - %s) << 2) | (%s & %s) ^ '
+                      '(%s > %s) + -%s / ~%s + (%s == %s && %s != %d);' %
+                      (v[0], v[1], n % 8, v[2], v[3], v[4], v[5], v[6],
+                       v[7], v[8], v[0], v[1], v[2], v[3], n % 5))
+        pass
+
+    result.append('    return %s;' % names[0])
+    result.append('}')
+
+    return '\n'.join(result) + '\n'
+
+
+# bench_parser()-- Parse throughput on expression-heavy input.
+
+def bench_parser(statements=20000):
+    import lexer, parser
+
+    text = expression_source(statements)
+    tokens = count_tokens(lexer.lexer('<bench>', source=text))
+
+    t, r = timed(lambda: parser.parser('<bench>', source=text))
+
+    print '%d statements, %d tokens' % (statements, tokens)
+    print 'Parse: %.3fs  %10.0f statements/s  %10.0f tokens/s' % \
+        (t, statements / t, tokens / t)
+
+    return
+
+
+# peak_memory()-- Run the compiler on a file in a child process,
+# returning the child's peak resident size in megabytes.
+
+def peak_memory(filename, *options):
+    import subprocess
+
+    script = ('import sys, resource, sse\n'
+              'sse.main(sys.argv)\n'
+              'sys.stderr.write("%d\\n" % '
+              'resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)\n')
+
+    devnull = open(os.devnull, 'w')
+    p = subprocess.Popen([ sys.executable, '-c', script ] + list(options) +
+                         [ filename ], stdout=devnull, stderr=subprocess.PIPE,
+                         cwd=source_dir)
+
+    err = p.communicate()[1]
+    devnull.close()
+
+    return int(err.split()[-1]) / 1024.0
+
+
+# bench_stream()-- Peak memory of compiling a file of many procedures,
+# with and without the streaming driver.
+
+def bench_stream(procedures=10000, statements=20):
+    text = ''.join([ loop_source(statements, 'p%d' % n)
+                     for n in range(procedures) ])
+
+    filename = temp_source(text)
+
+    print '%d procedures, %d bytes' % (procedures, len(text))
+
+    for name, options in [ ('whole program', ()), ('streaming', ('--stream',)) ]:
+        t = time.time()
+        mb = peak_memory(filename, *options)
+        print '%-16s %8.1f MB peak  %7.1fs' % (name, mb, time.time() - t)
+        pass
+
+    os.remove(filename)
+    return
+
+
+# bench_parallel()-- Wall time of compiling many procedures serially
+# and with -j for increasing numbers of processes, up to the number
+# of processors.
+
+def bench_parallel(procedures=2000, statements=20):
+    import multiprocessing, subprocess
+
+    text = ''.join([ loop_source(statements, 'p%d' % n)
+                     for n in range(procedures) ])
+
+    filename = temp_source(text)
+    devnull = open(os.devnull, 'w')
+
+    cpus = multiprocessing.cpu_count()
+    print '%d procedures, %d processors' % (procedures, cpus)
+
+    jobs = [ 1 ]
+    while jobs[-1] < cpus:
+        jobs.append(min(2 * jobs[-1], cpus))
+        pass
+
+    base = None
+
+    for j in jobs:
+        options = [ '--stream' ] if j == 1 else [ '-j', str(j) ]
+        command = [ sys.executable, 'sse.py' ] + options + [ filename ]
+
+        t, r = timed(lambda: subprocess.call(command, stdout=devnull), 1)
+        if base is None:
+            base = t
+            pass
+
+        print '-j %-3d %8.2fs  %5.2fx' % (j, t, base / t)
+        pass
+
+    devnull.close()
+    os.remove(filename)
+    return
+
+
+# bench_import()-- Cold start: the time to import the compiler in a
+# fresh interpreter, over the time to start one.
+
+def bench_import(repeat=20):
+    import subprocess
+
+    def start(statement):
+        return timed(lambda: subprocess.call([ sys.executable, '-S', '-c',
+                                               statement ], cwd=source_dir),
+                     repeat)[0]
+
+    base = start('pass')
+
+    for statement in [ 'import sse', 'import sse; sse.compile("")' ]:
+        print '%-30s %6.1f ms' % (statement, 1e3 * (start(statement) - base))
+        pass
+
+    return
+
+
+
+# bench_cache_put()-- Storing entries in a disk cache, first with room
+# for all of them, then in one that only holds a quarter of them.  The
+# second must stay within its limit.
+
+def bench_cache_put(counts=(1000, 4000), size=1000):
+    import shutil, cache
+
+    data = 'x' * size
+
+    print '%8s %12s %12s %10s' % ('Puts', 'Roomy (s)', 'Evicting (s)',
+                                  'Size')
+
+    for count in counts:
+        times = []
+
+        for limit in [ 2 * count * size, count * size / 4 ]:
+            directory = tempfile.mkdtemp(prefix='sse-cache')
+            c = cache.disk_cache(directory, limit)
+
+            def run():
+                for i in range(count):
+                    c.put('k%d' % i, data)
+                    pass
+
+                return c.stats()['size']
+
+            t, total = timed(run, 1)
+            times.append(t)
+            shutil.rmtree(directory)
+
+            if total > limit:
+                raise SystemExit, 'Cache of %d bytes holds %d' % (limit, total)
+
+            pass
+
+        print '%8d %12.3f %12.3f %10d' % (count, times[0], times[1], total)
+        pass
+
+    return
+
+
+# bench_asm_cache()-- Compiling a file of kernels with an empty
+# assembly cache, then again with every kernel in the cache.
+
+def bench_asm_cache(procedures=1000, statements=20):
+    import shutil, sse
+
+    text = ''.join([ loop_source(statements, 'k%d' % n)
+                     for n in range(procedures) ])
+
+    directory = tempfile.mkdtemp(prefix='sse-asm')
+    opts = sse.options(asm_cache=directory, cache_size=256)
+
+    print '%d procedures' % procedures
+
+    for name in [ 'cold', 'warm' ]:
+        t, r = timed(lambda: sse.compile(text, opts), 1)
+        print '%-6s %8.3fs  %6.1f us per procedure  %d hits' \
+            % (name, t, 1e6 * t / procedures, r.asm_cache_stats['hits'])
+        pass
+
+    shutil.rmtree(directory)
+    return
+
+
+# bench_rebuild()-- Building a file of kernels into an assembler file,
+# then building it again after changing one kernel.
+
+def bench_rebuild(procedures=1000, statements=20):
+    import shutil, sse
+
+    directory = tempfile.mkdtemp(prefix='sse-build')
+    filename = os.path.join(directory, 'kernels.sse')
+    output = os.path.join(directory, 'kernels.s')
+
+    text = ''.join([ loop_source(statements, 'k%d' % n)
+                     for n in range(procedures) ])
+
+    opts = sse.options(filename)
+
+    for name in [ 'full', 'one changed' ]:
+        open(filename, 'w').write(text)
+
+        t, r = timed(lambda: sse.build(opts, output), 1)
+        print '%-12s %8.3fs  %d of %d procedures compiled' \
+            % ((name, t) + r)
+
+        i = text.index('k%d(' % (procedures / 2))
+        text = text[:i] + text[i:].replace('c = 10;', 'c = 11;', 1)
+        pass
+
+    shutil.rmtree(directory)
+    return
+
+
+# bench_rebuild_debug()-- Building from the command line without -q,
+# which prints what the passes do, then again after changing one
+# kernel.  The second build must only compile that kernel, and the
+# assembler must match a quiet build.  Exits with an error otherwise.
+
+def bench_rebuild_debug(procedures=100, statements=20):
+    import shutil, subprocess, cache
+
+    directory = tempfile.mkdtemp(prefix='sse-build')
+    filename = os.path.join(directory, 'kernels.sse')
+    output = os.path.join(directory, 'kernels.s')
+    quiet = os.path.join(directory, 'quiet.s')
+
+    text = ''.join([ loop_source(statements, 'k%d' % n)
+                     for n in range(procedures) ])
+
+    def run(*options):
+        command = [ sys.executable, script('sse.py') ] + list(options) + \
+                  [ filename ]
+        return subprocess.Popen(command,
+                                stdout=subprocess.PIPE).communicate()[0]
+
+    failed = []
+
+    for name, expected in [ ('full', procedures), ('one changed', 1) ]:
+        open(filename, 'w').write(text)
+
+        t, out = timed(lambda: run('-o', output), 1)
+        compiled = out.count('Procedure\n')
+        entries = len(cache.build_state(output + '.state').entries)
+
+        print '%-12s %8.3fs  %d of %d procedures compiled, %d in state' \
+            % (name, t, compiled, procedures, entries)
+
+        run('-q', '-o', quiet)
+
+        if compiled != expected or entries != procedures or \
+           open(output).read() != open(quiet).read():
+            failed.append(name)
+            pass
+
+        i = text.index('k%d(' % (procedures / 2))
+        text = text[:i] + text[i:].replace('c = 10;', 'c = 11;', 1)
+        pass
+
+    shutil.rmtree(directory)
+
+    if failed:
+        raise SystemExit, 'Debug build failed: ' + ', '.join(failed)
+
+    return
+
+
+# bench_server()-- Per-kernel wall time of the command line against the
+# client of a running compile server, then the throughput of the
+# server with several clients at once.
+
+def bench_server(kernels=50, clients=8):
+    import subprocess, threading, client
+
+    filename = temp_source(loop_source(20, 'kernel'))
+    text = open(filename).read()
+
+    path = tempfile.mktemp(prefix='sse-bench', suffix='.sock')
+    env = dict(os.environ, SSE_SOCKET=path)
+    devnull = open(os.devnull, 'w')
+
+    server = subprocess.Popen([ sys.executable, script('server.py') ],
+                              env=env, stderr=devnull)
+
+    while not os.path.exists(path):
+        time.sleep(0.05)
+        pass
+
+    for name in [ 'sse.py', 'client.py' ]:
+        command = [ sys.executable, script(name), '-q', filename ]
+        t, r = timed(lambda: [ subprocess.call(command, env=env,
+                                               stdout=devnull)
+                               for n in range(kernels) ], 1)
+
+        print '%-10s %8.1f ms per kernel' % (name, 1e3 * t / kernels)
+        pass
+
+    def work():
+        for n in range(kernels):
+            client.compile(text, path, filename='kernel.sse')
+            pass
+
+        return
+
+    threads = [ threading.Thread(target=work) for n in range(clients) ]
+
+    start = time.time()
+
+    for t in threads:
+        t.start()
+        pass
+
+    for t in threads:
+        t.join()
+        pass
+
+    elapsed = time.time() - start
+
+    print '%d clients: %.1f requests/s' % (clients,
+                                           clients * kernels / elapsed)
+    print 'server: %(requests)d requests, p50 %(p50_ms).2f ms, ' \
+        'p99 %(p99_ms).2f ms' % client.stats(path)
+
+    client.request({ 'command': 'shutdown' }, path)
+    server.wait()
+
+    devnull.close()
+    os.remove(filename)
+    return
+
+
+# bench_analyses()-- Time of the analyses on kernels of growing size,
+# along with the number of nodes and basic blocks that they work on.
+
+def bench_analyses(sizes=(100, 200, 400, 800)):
+    import sse, cfg, parser
+
+    names = [ 'cfg', 'dominators', 'dominance_tree', 'dominance_frontier',
+              'block_liveness', 'liveness', 'interference' ]
+
+    print '%-6s %6s %6s' % ('stmts', 'nodes', 'blocks') + \
+        ''.join([ ' %18s' % n for n in names ])
+
+    for statements in sizes:
+        text = loop_source(statements)
+        opts = sse.options(time_passes=True)
+
+        t, r = timed(lambda: sse.compile(text, opts), 1)
+
+        seconds = {}
+        for rec in r.pass_timer.records:
+            seconds[rec.name] = seconds.get(rec.name, 0.0) + rec.seconds
+            if rec.name == 'cfg':
+                nodes = rec.nodes_before
+                pass
+
+            pass
+
+        v = parser.load_program('<bench>', text).values()[0]
+
+        blocks = len(cfg.build_cfg(v.block.flatten0()))
+
+        print '%-6d %6d %6d' % (statements, nodes, blocks) + \
+            ''.join([ ' %16.2fms' % (1e3 * seconds.get(n, 0.0))
+                      for n in names ])
+        pass
+
+    return
+
+
+# ir_size()-- Bytes taken by an IR object and the expressions under
+# it, not counting variables, which are shared.
+
+def ir_size(obj):
+    import ir_nodes
+
+    size = sys.getsizeof(obj)
+
+    if hasattr(obj, '__dict__'):
+        size += sys.getsizeof(obj.__dict__)
+        pass
+
+    for name in [ 'a', 'b', 'arg', 'value', 'cond', 'predicate' ]:
+        e = getattr(obj, name, None)
+        if isinstance(e, ir_nodes.expr):
+            size += ir_size(e)
+            pass
+
+        pass
+
+    return size
+
+
+# bench_ir()-- Memory per node and the time of the passes and
+# analyses before renaming, on a long straight-line procedure.  The
+# renaming passes still recurse once per statement.  Importing regalloc
+# registers the liveness analysis.
+
+def bench_ir(statements=100000):
+    import parser, ssa, regalloc, passes, ir_nodes
+
+    text = straight_source(statements)
+    t, namespace = timed(lambda: parser.load_program('<bench>', text), 1)
+    v = namespace.values()[0]
+    print '%d statements, parsed in %.1fs' % (statements, t)
+
+    ctx = ir_nodes.compile_context(v.name)
+    ctx.proc = v
+    ctx.timer = passes.pass_timer()
+    ir_nodes.enter_context(ctx)
+
+    try:
+        graph = passes.run_pass('flatten', lambda st: v.block.flatten0(), None)
+
+        nodes = size = 0
+        st = graph
+        while st is not None:
+            nodes += 1
+            size += ir_size(st)
+            st = st.next
+            pass
+
+        print '%d nodes, %.1f bytes per node' % (nodes, float(size) / nodes)
+
+        pipeline = [ p for p in ssa.ssa_passes if p[0] not in
+                     [ 'ssa_rename', 'ssa_expr' ] ]
+
+        graph = passes.run_passes(pipeline, graph)
+
+        for a in ssa.dominance + [ 'liveness' ]:
+            passes.require(a, graph)
+            pass
+
+    finally:
+        ir_nodes.leave_context()
+        pass
+
+    total = 0.0
+
+    for r in ctx.timer.records:
+        print '    %-20s %8.1f ms' % (r.name, 1e3 * r.seconds)
+        total += r.seconds
+        pass
+
+    print '    %-20s %8.1f ms' % ('Total', 1e3 * total)
+
+    return
+
+
+# bench_ssa_stress()-- Convert a very long straight-line procedure to
+# ssa form and allocate its registers, at the default recursion limit.
+# Each statement is a level of the dominator tree, so a traversal
+# that recursed would run out of stack a thousand statements in.
+
+def bench_ssa_stress(statements=200000):
+    import parser, ssa, regalloc, passes, ir_nodes
+
+    limit = sys.getrecursionlimit()
+
+    text = straight_source(statements)
+    t, namespace = timed(lambda: parser.load_program('<bench>', text), 1)
+    v = namespace.values()[0]
+    print '%d statements, parsed in %.1fs' % (statements, t)
+
+    ctx = ir_nodes.compile_context(v.name)
+    ctx.proc = v
+    ctx.timer = passes.pass_timer()
+    ir_nodes.enter_context(ctx)
+
+    try:
+        graph = ssa.ssa_conversion(v)
+        regalloc.allocate(graph)
+
+    finally:
+        ir_nodes.leave_context()
+        pass
+
+    if sys.getrecursionlimit() != limit:
+        raise SystemExit, 'Recursion limit changed'
+
+    total = 0.0
+
+    for r in ctx.timer.records:
+        print '    %-20s %8.1f ms' % (r.name, 1e3 * r.seconds)
+        total += r.seconds
+        pass
+
+    print '    %-20s %8.1f ms' % ('Total', 1e3 * total)
+    return
+
+
+# random_cfg()-- Return the blocks of a random flow graph.  Each block
+# falls through to the next, so that all are reachable, and a
+# fraction of them also branch to a random block, forwards or back.
+
+def random_cfg(rng, count, branches=0.5):
+    from cfg import basic_block
+
+    blocks = [ basic_block(n, None) for n in range(count) ]
+
+    for n in range(count):
+        targets = []
+
+        if n + 1 < count:
+            targets.append(blocks[n+1])
+            pass
+
+        if rng.random() < branches:
+            targets.append(blocks[rng.randrange(count)])
+            pass
+
+        for t in targets:
+            blocks[n].successors.append(t)
+            t.predecessors.append(blocks[n])
+            pass
+
+        pass
+
+    return blocks
+
+
+# ladder_cfg()-- Return the blocks of an irreducible ladder: two chains
+# running in opposite directions, entered at opposite ends, with rungs
+# both ways between them.  Dominators take the iterative method about
+# as many passes as there are rungs.
+
+def ladder_cfg(count):
+    from cfg import basic_block
+
+    k = max(1, (count - 1) / 2)
+    blocks = [ basic_block(n, None) for n in range(2*k + 1) ]
+
+    def edge(x, y):
+        x.successors.append(y)
+        y.predecessors.append(x)
+        return
+
+    a = blocks[1:k+1]
+    b = blocks[k+1:]
+
+    edge(blocks[0], a[0])
+    edge(blocks[0], b[-1])
+
+    for i in range(k):
+        if i + 1 < k:
+            edge(a[i], a[i+1])
+            edge(b[i+1], b[i])
+            pass
+
+        edge(a[i], b[i])
+        edge(b[i], a[i])
+        pass
+
+    return blocks
+
+
+# run_engine()-- Find dominators of random blocks with an engine,
+# returning the immediate dominator of each block by number.
+
+def run_engine(engine, blocks):
+    for b in blocks:
+        b.dom = None
+        pass
+
+    engine(blocks[0], len(blocks))
+    return [ None if b.dom is None else b.dom.n for b in blocks ]
+
+
+# bench_dominators()-- Check the dominator engines against each other
+# on random flow graphs, then time both on random graphs and ladders of
+# increasing size, reporting which is faster and which one the 'auto'
+# setting picks.  The default iterative_limit of ssa.ssa_options comes
+# from this.
+
+def bench_dominators(sizes=(10, 30, 100, 300, 1000, 3000, 10000),
+                     checks=500):
+    import random, ssa
+
+    lt = ssa.find_dominators
+    chk = ssa.iterative_dominators
+
+    rng = random.Random(1)
+
+    for i in range(checks):
+        blocks = random_cfg(rng, rng.randrange(1, 60), rng.random())
+
+        if run_engine(lt, blocks) != run_engine(chk, blocks):
+            raise SystemExit, 'Dominator engines differ on graph %d' % i
+
+        pass
+
+    print 'Engines agree on %d random graphs' % checks
+    print '%-7s %8s %12s %12s  %-7s %s' % ('Shape', 'Blocks', 'L-T (ms)',
+                                           'C-H-K (ms)', 'Faster', 'Auto')
+
+    for shape in [ 'random', 'ladder' ]:
+        for count in sizes:
+            if shape == 'random':
+                blocks = random_cfg(rng, count)
+
+            else:
+                blocks = ladder_cfg(count)
+                pass
+
+            repeat = max(3, 3000 / count)
+
+            t_lt, r_lt = timed(lambda: run_engine(lt, blocks), repeat)
+            t_chk, r_chk = timed(lambda: run_engine(chk, blocks), repeat)
+
+            if r_lt != r_chk:
+                raise SystemExit, 'Dominator engines differ on a %s of %d ' \
+                    'blocks' % (shape, count)
+
+            auto = ssa.dominator_engine_for(len(blocks))
+
+            print '%-7s %8d %12.3f %12.3f  %-7s %s' % \
+                (shape, len(blocks), 1e3 * t_lt, 1e3 * t_chk,
+                 'L-T' if t_lt < t_chk else 'C-H-K',
+                 'L-T' if auto is lt else 'C-H-K')
+            pass
+
+        pass
+
+    return
+
+
+# repeat_cfg()-- Return the blocks of repeat-until loops nested to a
+# depth: an entry, the loop headers from the outside in, then the
+# latches from the inside out, each branching back to its header.  The
+# inner latches dominate the outer ones, so the dominance frontier of
+# the i'th latch is every header out from the i'th, and the frontiers
+# add up to the square of the depth.
+
+def repeat_cfg(count):
+    from cfg import basic_block
+
+    k = max(1, (count - 1) / 2)
+    blocks = [ basic_block(n, None) for n in range(2*k + 1) ]
+
+    def edge(x, y):
+        x.successors.append(y)
+        y.predecessors.append(x)
+        return
+
+    headers = blocks[1:k+1]
+    latches = blocks[k+1:]
+
+    edge(blocks[0], headers[0])
+
+    for i in range(k):
+        if i + 1 < k:
+            edge(headers[i], headers[i+1])
+            edge(latches[i+1], latches[i])
+            pass
+
+        edge(latches[i], headers[i])
+        pass
+
+    edge(headers[-1], latches[-1])
+    return blocks
+
+
+# dominate_blocks()-- Give synthetic blocks their immediate dominators
+# and dominator tree children, as the dominance_tree analysis would.
+
+def dominate_blocks(blocks):
+    import ssa
+
+    run_engine(ssa.find_dominators, blocks)
+
+    for b in blocks:
+        b.children = []
+        pass
+
+    for b in blocks:
+        if b.dom is not None:
+            b.dom.children.append(b)
+            pass
+
+        pass
+
+    return
+
+
+# place_all()-- Make a phi engine for some blocks and place phi
+# functions for each set of assigning blocks, returning the sorted
+# block numbers of each placement.
+
+def place_all(engine, blocks, defs):
+    e = engine(blocks)
+    return [ sorted([ b.n for b in e.place(d) ]) for d in defs ]
+
+
+# bench_phi_engines()-- Check the phi engines against each other on
+# random flow graphs, then time both on nested repeat-until loops,
+# where the dominance frontiers are quadratic, and on ladders.  Each
+# graph has a number of variables assigned in random blocks, always
+# including the innermost latch.  The 'cytron' time includes building
+# the frontiers, which is what the 'dj_graph' engine saves.
+
+def bench_phi_engines(sizes=(100, 300, 1000, 3000), variables=20,
+                      checks=500):
+    import random, ssa
+
+    cytron = ssa.phi_engines['cytron']
+    dj = ssa.phi_engines['dj_graph']
+
+    rng = random.Random(1)
+
+    for i in range(checks):
+        blocks = random_cfg(rng, rng.randrange(1, 60), rng.random())
+        dominate_blocks(blocks)
+        ssa.block_frontiers(blocks)
+
+        defs = [ rng.sample(blocks, rng.randrange(1, len(blocks) + 1))
+                 for v in range(5) ]
+
+        if place_all(cytron, blocks, defs) != place_all(dj, blocks, defs):
+            raise SystemExit, 'Phi engines differ on graph %d' % i
+
+        pass
+
+    print 'Engines agree on %d random graphs' % checks
+    print '%-7s %8s %10s %14s %14s %8s' % ('Shape', 'Blocks', 'DF size',
+                                           'Cytron (ms)', 'DJ graph (ms)',
+                                           'Phis')
+
+    for shape in [ 'repeat', 'ladder' ]:
+        for count in sizes:
+            if shape == 'repeat':
+                blocks = repeat_cfg(count)
+                inner = blocks[len(blocks) / 2 + 1]
+
+            else:
+                blocks = ladder_cfg(count)
+                inner = blocks[-1]
+                pass
+
+            dominate_blocks(blocks)
+
+            defs = [ [ inner ] + rng.sample(blocks, 2)
+                     for v in range(variables) ]
+
+            def run_cytron():
+                ssa.block_frontiers(blocks)
+                return place_all(cytron, blocks, defs)
+
+            repeat = max(3, 3000 / count)
+
+            t_cytron, r_cytron = timed(run_cytron, repeat)
+            t_dj, r_dj = timed(lambda: place_all(dj, blocks, defs), repeat)
+
+            if r_cytron != r_dj:
+                raise SystemExit, 'Phi engines differ on a %s of %d ' \
+                    'blocks' % (shape, count)
+
+            print '%-7s %8d %10d %14.3f %14.3f %8d' % \
+                (shape, len(blocks), sum([ len(b.DF) for b in blocks ]),
+                 1e3 * t_cytron, 1e3 * t_dj, sum(map(len, r_dj)))
+            pass
+
+        pass
+
+    return
+
+
+# chain_dominates()-- Return True if block a dominates block b, by
+# climbing b's immediate dominators.
+
+def chain_dominates(a, b):
+    while b is not None:
+        if b is a:
+            return True
+
+        b = b.dom
+        pass
+
+    return False
+
+
+# bench_dominance_queries()-- Check cfg.dominates() against climbing the
+# dominator tree on random flow graphs, ladders and nested loops, and
+# time both on random pairs of blocks, along with numbering the tree.
+# Ladders have a shallow tree and nested loops a deep one.  Then do the
+# same on random pairs of nodes in the block of a deep expression,
+# whose temporaries are inserted after the nodes are numbered.
+
+def bench_dominance_queries(sizes=(100, 1000, 10000), queries=20000):
+    import random, cfg, parser, ssa, passes, ir_nodes
+
+    rng = random.Random(1)
+
+    print '%-7s %8s %14s %14s %14s' % ('Shape', 'Blocks', 'Number (ms)',
+                                       'Climb (ms)', 'Interval (ms)')
+
+    for shape in [ 'random', 'ladder', 'repeat' ]:
+        for count in sizes:
+            if shape == 'random':
+                blocks = random_cfg(rng, count)
+
+            elif shape == 'ladder':
+                blocks = ladder_cfg(count)
+
+            else:
+                blocks = repeat_cfg(count)
+                pass
+
+            dominate_blocks(blocks)
+
+            t_number, r = timed(lambda: cfg.number_dominator_tree(blocks))
+
+            pairs = [ (rng.choice(blocks), rng.choice(blocks))
+                      for i in range(queries) ]
+
+            def run(func):
+                return [ func(a, b) for a, b in pairs ]
+
+            t_climb, r_climb = timed(lambda: run(chain_dominates))
+            t_interval, r_interval = timed(lambda: run(cfg.dominates))
+
+            if r_climb != r_interval:
+                raise SystemExit, 'Dominance queries differ on a %s of %d ' \
+                    'blocks' % (shape, count)
+
+            print '%-7s %8d %14.3f %14.3f %14.3f' % \
+                (shape, len(blocks), 1e3 * t_number, 1e3 * t_climb,
+                 1e3 * t_interval)
+            pass
+
+        pass
+
+    print
+    print '%-7s %8s %14s %14s' % ('Depth', 'Nodes', 'Climb (ms)',
+                                  'Order (ms)')
+
+    for depth in [ 10, 100, 300 ]:
+        v = parser.load_program('<bench>', deep_source(depth)).values()[0]
+
+        ctx = ir_nodes.compile_context(v.name)
+        ctx.proc = v
+        ir_nodes.enter_context(ctx)
+
+        try:
+            graph = ssa.ssa_conversion(v)
+            nodes = max([ b.nodes() for b in passes.require('cfg', graph) ],
+                        key=len)
+
+        finally:
+            ir_nodes.leave_context()
+            pass
+
+        pairs = [ (rng.choice(nodes), rng.choice(nodes))
+                  for i in range(queries) ]
+
+        def run(func):
+            return [ func(a, b) for a, b in pairs ]
+
+        t_climb, r_climb = timed(lambda: run(chain_dominates))
+        t_order, r_order = timed(lambda: run(cfg.dominates))
+
+        if r_climb != r_order:
+            raise SystemExit, 'Dominance queries differ on the nodes of ' \
+                'an expression of depth %d' % depth
+
+        print '%-7d %8d %14.3f %14.3f' % (depth, len(nodes), 1e3 * t_climb,
+                                         1e3 * t_order)
+        pass
+
+    return
+
+
+# count_phis()-- Return the number of phi functions in a graph.
+
+def count_phis(graph):
+    import ir_nodes
+
+    count = 0
+
+    st = graph
+    while st is not None:
+        if isinstance(st, ir_nodes.label):
+            count += len(st.phi_list)
+            pass
+
+        st = st.next
+        pass
+
+    return count
+
+
+# bench_ssa_forms()-- Compile a corpus of loop kernels in each ssa
+# form, reporting the number of phi functions placed, the time of the
+# register allocator's passes, the end to end compile time and the
+# number of instructions generated.
+
+def bench_ssa_forms(procedures=100, temps=6):
+    import parser, ssa, regalloc, passes, ir_nodes, sse
+
+    text = ''.join([ [ nest_source(temps, 'n%d' % n),
+                       loop_source(2 + n % 10, 'l%d' % n) ][n % 2]
+                     for n in range(procedures) ])
+
+    print '%-12s %8s %14s %14s %8s' % ('Form', 'Phis', 'Regalloc (s)',
+                                       'Compile (s)', 'Insns')
+
+    for form in ssa.ssa_forms:
+        phis = 0
+
+        for v in parser.load_program('<bench>', text).values():
+            ctx = ir_nodes.compile_context(v.name, False,
+                                           ssa.ssa_options(form))
+            ctx.proc = v
+            ir_nodes.enter_context(ctx)
+
+            try:
+                phis += count_phis(ssa.ssa_conversion(v))
+
+            finally:
+                ir_nodes.leave_context()
+                pass
+
+            pass
+
+        opts = sse.options(time_passes=True, ssa_form=form)
+        t, r = timed(lambda: sse.compile(text, opts))
+
+        allocate = sum([ rec.seconds for rec in r.pass_timer.records
+                         if rec.name in [ 'block_liveness', 'liveness',
+                                          'last_use', 'interference',
+                                          'color_graph', 'phi_merge' ] ])
+
+        insns = sum([ len(insns) for name, insns in r.procedures ])
+
+        print '%-12s %8d %14.3f %14.3f %8d' % (form, phis, allocate, t, insns)
+        pass
+
+    return
+
+
+# run_ir()-- Interpret a procedure's flow graph, returning the last
+# value given to its return variable.  Before register allocation the
+# variables hold values and phi functions are evaluated on each edge,
+# afterwards the registers hold the values and the graph has explicit
+# moves.  Only handles the integer expressions that the kernels use.
+
+ir_ops = {
+    '+':  lambda a, b: a + b,   '-':  lambda a, b: a - b,
+    '*':  lambda a, b: a * b,   '&':  lambda a, b: a & b,
+    '|':  lambda a, b: a | b,   '^':  lambda a, b: a ^ b,
+    '<':  lambda a, b: a < b,   '<=': lambda a, b: a <= b,
+    '>':  lambda a, b: a > b,   '>=': lambda a, b: a >= b,
+    '==': lambda a, b: a == b,  '!=': lambda a, b: a != b,
+}
+
+def run_ir(graph, registers, limit=1000000):
+    import ir_nodes, kw
+
+    values = {}
+
+    def key(v):
+        if not registers:
+            return v
+
+        return getattr(v.register, 'parent', v.register)
+
+    def value(e):
+        if isinstance(e, kw.constant):
+            return e.value
+
+        if isinstance(e, ir_nodes.variable):
+            return values.get(key(e), 0)
+
+        if isinstance(e, ir_nodes.expr_binary):
+            return int(ir_ops[e.op](value(e.a), value(e.b)))
+
+        if isinstance(e, ir_nodes.expr_unary):
+            return -value(e.arg) if e.op == '-' else value(e.arg)
+
+        raise ValueError, 'run_ir() can\'t evaluate ' + e.__class__.__name__
+
+    def enter(st, target):
+        if not registers and isinstance(target, ir_nodes.label):
+            moves = [ (p.lhs, value(arg.var)) for p in target.phi_list
+                      for arg in p.args if arg.node is st ]
+
+            for v, x in moves:
+                values[key(v)] = x
+                pass
+
+            pass
+
+        return target
+
+    result = None
+    st = graph
+
+    while st is not None:
+        limit -= 1
+        if limit == 0:
+            raise ValueError, 'run_ir() ran too long'
+
+        if isinstance(st, ir_nodes.expr_assign):
+            values[key(st.var)] = value(st.value)
+
+            if st.var.name.startswith('.retval'):
+                result = st.var
+                pass
+
+        elif isinstance(st, ir_nodes.swap):
+            a, b = key(st.a), key(st.b)
+            values[a], values[b] = values.get(b, 0), values.get(a, 0)
+
+        elif isinstance(st, ir_nodes.jump):
+            if st.cond is None or value(st.cond):
+                st = enter(st, st.label)
+                continue
+
+            pass
+
+        st = enter(st, st.next)
+        pass
+
+    return None if result is None else values.get(key(result))
+
+
+# bench_ssa_allocation()-- Compile cond_source() and loop kernels with
+# conditions in each ssa form, running each procedure before and after register
+# allocation.  Every form must give the same result, and allocation
+# must not change it.  The minimal forms leave dead phi functions in
+# the loops, whose moves must not clobber live registers.  Exits with
+# an error if anything differs.
+
+def bench_ssa_allocation(procedures=20):
+    import parser, ssa, regalloc, ir_nodes
+
+    text = cond_source() + ''.join([ nest_source(1 + n % 8, 'n%d' % n)
+                                     for n in range(procedures) ])
+
+    results = {}
+    failed = 0
+
+    print '%-12s %10s %10s' % ('Form', 'Procedures', 'Wrong')
+
+    for form in ssa.ssa_forms:
+        wrong = 0
+
+        for v in parser.load_program('<bench>', text).values():
+            ctx = ir_nodes.compile_context(v.name, False,
+                                           ssa.ssa_options(form))
+            ctx.proc = v
+            ir_nodes.enter_context(ctx)
+
+            try:
+                graph = ssa.ssa_conversion(v)
+                expected = run_ir(graph, False)
+
+                regalloc.allocate(graph)
+                actual = run_ir(graph, True)
+
+            finally:
+                ir_nodes.leave_context()
+                pass
+
+            if actual != expected or \
+               results.setdefault(v.name, expected) != expected:
+                wrong += 1
+                pass
+
+            pass
+
+        print '%-12s %10d %10d' % (form, procedures + 1, wrong)
+        failed += wrong
+        pass
+
+    if failed > 0:
+        raise SystemExit, '%d procedures were compiled wrongly' % failed
+
+    return
+
+
+# bench_deterministic()-- Compile a corpus of kernels in separate
+# processes, with different hash seeds, serially, streaming, in
+# parallel and from the assembly cache, and check that the output is
+# the same every time.  Exits with an error if anything differs.
+
+def bench_deterministic(procedures=100):
+    import shutil, subprocess
+
+    text = ''.join([ loop_source(1 + n % 12, 'k%d' % n)
+                     for n in range(procedures) ])
+
+    filename = temp_source(text)
+    directory = tempfile.mkdtemp(prefix='sse-asm')
+
+    def run(options, seed):
+        env = dict(os.environ, PYTHONHASHSEED=seed)
+        command = [ sys.executable, script('sse.py') ] + options + [ filename ]
+        p = subprocess.Popen(command, env=env, stdout=subprocess.PIPE)
+        return p.communicate()[0], p.returncode
+
+    runs = [ ('debug', [], '1'), ('debug', [], 'random'),
+             ('quiet', [ '-q' ], '1'), ('quiet', [ '-q' ], 'random'),
+             ('quiet', [ '-q', '--stream' ], 'random'),
+             ('quiet', [ '-q', '-j', '4' ], 'random'),
+             ('quiet', [ '-q', '--asm-cache', directory ], 'random'),
+             ('quiet', [ '-q', '--asm-cache', directory ], '2') ]
+
+    first = {}
+    failed = 0
+
+    for kind, options, seed in runs:
+        t, (out, status) = timed(lambda: run(options, seed), 1)
+        first.setdefault(kind, out)
+        same = out == first[kind]
+
+        if status != 0:
+            result = 'FAILED'
+
+        elif same:
+            result = 'same'
+
+        else:
+            result = 'DIFFERENT'
+            pass
+
+        print '%-30s %-7s %8.3fs  %s' % (' '.join(options) or '(serial)',
+                                         seed, t, result)
+        if result != 'same':
+            failed += 1
+            pass
+
+        pass
+
+    shutil.rmtree(directory)
+    os.remove(filename)
+
+    if failed > 0:
+        raise SystemExit, '%d runs failed or gave different output' % failed
+
+    return
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        raise SystemExit, 'usage: bench.py <name> ...'
+
+    for name in sys.argv[1:]:
+        func = globals().get('bench_' + name)
+        if func is None:
+            raise SystemExit, "Unknown benchmark '%s'" % name
+
+        func()
+        pass
+
+    pass
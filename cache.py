@@ -0,0 +1,411 @@
+# (C) 2015 Andrew Vaught
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY
+# WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+# On-disk caches for compilation results, and the serialization of
+# parsed programs that goes into them.
+
+import os, hashlib, zlib
+import cPickle
+
+from cStringIO import StringIO
+
+import kw
+
+
+compiler_version = '0.1'
+
+
+# compiler_fingerprint()-- Return a string that changes whenever the
+# compiler changes.  Besides the version, this is a hash of the
+# compiler's own source files, so that cache entries written by an
+# older compiler are never used.
+
+def compiler_fingerprint(memo=[]):
+    if len(memo) == 0:
+        import glob
+
+        h = hashlib.sha1(compiler_version)
+        directory = os.path.dirname(os.path.abspath(__file__))
+
+        for name in sorted(glob.glob(os.path.join(directory, '*.py'))):
+            h.update(open(name, 'rb').read())
+            pass
+
+        memo.append(h.hexdigest())
+        pass
+
+    return memo[0]
+
+
+# cache_key()-- Build a cache key from a list of strings.  The compiler
+# fingerprint is always part of the key.
+
+def cache_key(*parts):
+    h = hashlib.sha1(compiler_fingerprint())
+
+    for p in parts:
+        if isinstance(p, unicode):
+            p = p.encode('utf-8')
+            pass
+
+        h.update('\0%d\0' % len(p))
+        h.update(p)
+        pass
+
+    return h.hexdigest()
+
+
+
+### Serialization
+
+# Parsed programs are pickled, then compressed.  Tokens, keywords,
+# type names and intrinsics are singletons that are compared by
+# identity, so they are pickled by name and come back as the same
+# objects.
+
+shared_ids = {}
+shared_objects = {}
+
+for t in kw.token_list + [ kw.tok_eof ] + kw.keyword_list + \
+        kw.type_names + kw.intrinsic_names:
+
+    pid = '%s:%s' % (t.__class__.__name__, t.name)
+    shared_ids[id(t)] = pid
+    shared_objects[pid] = t
+    pass
+
+del t, pid
+
+
+def persistent_id(obj):
+    return shared_ids.get(id(obj))
+
+
+def persistent_load(pid):
+    return shared_objects[pid]
+
+
+# dumps()-- Serialize an object, returning a string.
+
+def dumps(obj):
+    f = StringIO()
+
+    p = cPickle.Pickler(f, cPickle.HIGHEST_PROTOCOL)
+    p.persistent_id = persistent_id
+    p.dump(obj)
+
+    return zlib.compress(f.getvalue())
+
+
+# loads()-- Reverse of dumps().
+
+def loads(data):
+    u = cPickle.Unpickler(StringIO(zlib.decompress(data)))
+    u.persistent_load = persistent_load
+    return u.load()
+
+
+
+### The cache itself
+
+# A disk_cache is a directory of files named by their keys.  Writes go
+# to a temporary file that is renamed into place, so a reader never
+# sees a partial entry and several compilers can share the directory.
+# Reading an entry touches it, and when the total size goes above
+# max_size, the least recently used entries are removed.  The total is
+# found by scanning the directory when the cache is opened, then kept
+# up to date as entries are written and removed, so that only eviction
+# scans it again.  Other compilers sharing the directory make the
+# total an estimate, which the scan corrects.
+
+class disk_cache:
+    def __init__(self, directory, max_size=64 << 20):
+        self.directory = directory
+        self.max_size = max_size
+
+        self.hits = 0
+        self.misses = 0
+
+        try:
+            os.makedirs(directory)
+
+        except OSError:
+            if not os.path.isdir(directory):
+                raise
+
+            pass
+
+        self.size = sum([ e[1] for e in self.entries() ])
+        return
+
+
+    def path(self, key):
+        return os.path.join(self.directory, key)
+
+
+# get()-- Return the data stored under a key, or None if it isn't
+# there.  If a decode function is given, it is applied to the data.
+# Entries that fail to decode are removed and count as misses.
+
+    def get(self, key, decode=None):
+        path = self.path(key)
+
+        try:
+            f = open(path, 'rb')
+            data = f.read()
+            f.close()
+
+        except IOError:
+            self.misses += 1
+            return None
+
+        if decode is not None:
+            try:
+                data = decode(data)
+
+            except Exception:
+                self.remove(path)
+                self.size -= len(data)
+                self.misses += 1
+                return None
+
+            pass
+
+        try:
+            os.utime(path, None)
+
+        except OSError:
+            pass
+
+        self.hits += 1
+        return data
+
+
+# put()-- Store data under a key, evicting entries if that takes the
+# cache over max_size.
+
+    def put(self, key, data):
+        import tempfile
+
+        path = self.path(key)
+
+        try:
+            self.size -= os.stat(path).st_size
+
+        except OSError:
+            pass
+
+        fd, temp = tempfile.mkstemp(dir=self.directory, prefix='.tmp')
+
+        try:
+            os.write(fd, data)
+            os.close(fd)
+            os.rename(temp, path)
+
+        except OSError:
+            self.remove(temp)
+            raise
+
+        self.size += len(data)
+
+        if self.size > self.max_size:
+            self.evict()
+            pass
+
+        return
+
+
+    def remove(self, path):
+        try:
+            os.remove(path)
+
+        except OSError:
+            pass
+
+        return
+
+
+# entries()-- Return a list of (mtime, size, path) for the entries in
+# the cache.  Other compilers might be removing entries at the same
+# time, so vanishing files are skipped.
+
+    def entries(self):
+        result = []
+
+        for name in os.listdir(self.directory):
+            if name.startswith('.tmp'):
+                continue
+
+            path = self.path(name)
+
+            try:
+                st = os.stat(path)
+
+            except OSError:
+                continue
+
+            result.append((st.st_mtime, st.st_size, path))
+            pass
+
+        return result
+
+
+# evict()-- Remove the least recently used entries until the cache
+# fits in three quarters of max_size, leaving the size of what remains
+# in self.size.  The slack means that a full cache is only scanned
+# once for every quarter of it that is written, not on each put().
+
+    def evict(self):
+        entries = self.entries()
+        total = sum([ e[1] for e in entries ])
+        target = self.max_size * 3 / 4
+
+        if total <= self.max_size:
+            self.size = total
+            return
+
+        entries.sort()
+
+        for mtime, size, path in entries:
+            if total <= target:
+                break
+
+            self.remove(path)
+            total -= size
+            pass
+
+        self.size = total
+        return
+
+
+    def stats(self):
+        entries = self.entries()
+
+        return { 'hits': self.hits, 'misses': self.misses,
+                 'entries': len(entries),
+                 'size': sum([ e[1] for e in entries ]) }
+
+    pass
+
+
+
+### Build state
+
+# A build_state remembers the cache entries that went into an output
+# file, in a file next to it.  It works like a disk_cache, so the
+# parser finds unchanged procedures in it the same way, and the next
+# build only compiles what changed.  Entries that a build didn't use
+# are dropped when it is saved.  Lookups that miss go on to the
+# fallback cache, if there is one, and new entries go to both.
+
+class build_state:
+    def __init__(self, path, fallback=None):
+        self.path = path
+        self.fallback = fallback
+
+        self.hits = 0
+        self.misses = 0
+        self.used = {}
+
+        try:
+            f = open(path, 'rb')
+            self.entries = cPickle.loads(zlib.decompress(f.read()))
+            f.close()
+
+        except Exception:
+            self.entries = {}
+            pass
+
+        return
+
+
+    def get(self, key, decode=None):
+        data = self.entries.get(key)
+
+        if data is None and self.fallback is not None:
+            data = self.fallback.get(key)
+            pass
+
+        if data is None:
+            self.misses += 1
+            return None
+
+        value = data
+
+        if decode is not None:
+            try:
+                value = decode(data)
+
+            except Exception:
+                self.misses += 1
+                return None
+
+            pass
+
+        self.used[key] = data
+        self.hits += 1
+        return value
+
+
+    def put(self, key, data):
+        self.used[key] = data
+
+        if self.fallback is not None:
+            self.fallback.put(key, data)
+            pass
+
+        return
+
+
+# save()-- Write the entries used by this build, replacing the file
+# atomically.
+
+    def save(self):
+        import tempfile
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, temp = tempfile.mkstemp(dir=directory, prefix='.tmp')
+
+        try:
+            os.write(fd, zlib.compress(cPickle.dumps(self.used,
+                                                     cPickle.HIGHEST_PROTOCOL)))
+            os.close(fd)
+            os.rename(temp, self.path)
+
+        except OSError:
+            os.remove(temp)
+            raise
+
+        self.entries = self.used
+        self.used = {}
+        return
+
+
+    def stats(self):
+        return { 'hits': self.hits, 'misses': self.misses,
+                 'entries': len(self.used),
+                 'size': sum([ len(d) for d in self.used.values() ]) }
+
+    pass
@@ -0,0 +1,298 @@
+# (C) 2015 Andrew Vaught
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY
+# WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+# Control flow graph of basic blocks.  A basic block is a maximal run
+# of ir_nodes that control only enters at the top and leaves at the
+# bottom: a new block starts at each label and after each jump.  The
+# blocks are linked in program order through 'next', like the nodes,
+# and have explicit lists of successor and predecessor blocks.  Each
+# node's 'block' member is the block that holds it.  Blocks are
+# numbered from zero by their 'n' member, and passes keep scratch data
+# about blocks in lists indexed by that number.
+#
+# The dominator, dominance frontier, phi placement and liveness
+# computations work on blocks, then spread their results over the
+# nodes of each block, which only takes a walk down the block.
+#
+# The dominance_tree analysis also numbers the blocks in a depth first
+# walk of the dominator tree, from one counter: 'pre' when the walk
+# enters a block and 'post' when it leaves.  A block dominates another
+# when the other's interval nests inside its own, which dominates()
+# checks in constant time.
+#
+# Within a block, a node dominates the nodes after it.  build_cfg()
+# gives the nodes of each block increasing 'order' numbers, spaced
+# order_step apart, so that dominates() compares them in constant
+# time.  insert_node() gives a new node the number halfway between its
+# neighbors, renumbering the block when there is no room left, which
+# keeps the numbers valid as passes add nodes.
+
+from ir_nodes import label, jump
+
+from passes import analysis
+
+
+order_step = 1 << 20
+
+
+class basic_block(object):
+    __slots__ = ('n', 'first', 'last', 'next', 'successors', 'predecessors',
+                 'dom', 'children', 'DF', 'live_in', 'live_out', 'pre',
+                 'post')
+
+    def __init__(self, n, first):
+        self.n = n
+        self.first = first
+        self.last = first
+        self.next = None
+
+        self.successors = []
+        self.predecessors = []
+        return
+
+
+    def successor(self):
+        return self.successors
+
+    def predecessor(self):
+        return self.predecessors
+
+
+# nodes()-- Return the nodes of the block.
+
+    def nodes(self):
+        result = []
+
+        st = self.first
+        while True:
+            result.append(st)
+            if st is self.last:
+                break
+
+            st = st.next
+            pass
+
+        return result
+
+
+    def show(self):
+        print 'Block %d: %s .. %s  succ %s  pred %s' % \
+            (self.n, self.first.n, self.last.n,
+             [ b.n for b in self.successors ],
+             [ b.n for b in self.predecessors ])
+        return
+
+    pass
+
+
+# build_cfg()-- Split a graph into basic blocks and connect them, and
+# number the nodes of each block.  Returns the list of blocks in
+# program order, the first being the entry.
+
+def build_cfg(graph):
+    blocks = []
+    b = None
+
+    order = 0
+
+    st = graph
+    while st is not None:
+        if b is None or isinstance(st, label) or isinstance(b.last, jump):
+            n = basic_block(len(blocks), st)
+
+            if b is not None:
+                b.next = n
+                pass
+
+            b = n
+            blocks.append(b)
+            order = 0
+            pass
+
+        st.block = b
+        st.order = order
+        order += order_step
+
+        b.last = st
+        st = st.next
+        pass
+
+    for b in blocks:
+        for st in b.last.successor():
+            b.successors.append(st.block)
+            st.block.predecessors.append(b)
+            pass
+
+        pass
+
+    return blocks
+
+
+# number_block()-- Number the nodes of a block again, order_step
+# apart.
+
+def number_block(b):
+    order = 0
+
+    st = b.first
+    while True:
+        st.order = order
+        order += order_step
+
+        if st is b.last:
+            break
+
+        st = st.next
+        pass
+
+    return
+
+
+# insert_node()-- Insert a node before a node that isn't a label.  The
+# new node goes in the same block, so the blocks stay valid, and it is
+# numbered between its neighbors.
+
+def insert_node(st, n):
+    st.insert_prev(n)
+
+    b = st.block
+    n.block = b
+
+    if b.first is st:
+        b.first = n
+        n.order = st.order - order_step
+        return
+
+    before = n.prev.order
+    if st.order - before < 2:
+        number_block(b)
+
+    else:
+        n.order = (before + st.order) / 2
+        pass
+
+    return
+
+
+# dominator_walk()-- Generator that walks a dominator tree depth first
+# from a block or node, without recursing.  Yields (x, False) on
+# entering each x and (x, True) on leaving it, after its subtree.
+
+def dominator_walk(root):
+    work = [ (root, False) ]
+
+    while len(work) > 0:
+        x, leaving = work.pop()
+        yield x, leaving
+
+        if not leaving:
+            work.append((x, True))
+
+            for c in reversed(x.children):
+                work.append((c, False))
+                pass
+
+            pass
+
+        pass
+
+    return
+
+
+# dominator_preorder()-- Generator for the subtree of a dominator tree
+# in preorder, each block or node before those that it dominates.
+
+def dominator_preorder(root):
+    for x, leaving in dominator_walk(root):
+        if not leaving:
+            yield x
+            pass
+
+        pass
+
+    return
+
+
+# dominator_postorder()-- Generator for the subtree of a dominator tree
+# in postorder, each block or node after those that it dominates.
+
+def dominator_postorder(root):
+    for x, leaving in dominator_walk(root):
+        if leaving:
+            yield x
+            pass
+
+        pass
+
+    return
+
+
+# number_dominator_tree()-- Number the blocks of a dominator tree with
+# their preorder and postorder intervals.  Blocks that the entry
+# doesn't reach keep the interval (-1, -1), and only dominate each
+# other.
+
+def number_dominator_tree(blocks):
+    for b in blocks:
+        b.pre = b.post = -1
+        pass
+
+    if len(blocks) == 0:
+        return
+
+    count = 0
+
+    for b, leaving in dominator_walk(blocks[0]):
+        if leaving:
+            b.post = count
+
+        else:
+            b.pre = count
+            pass
+
+        count += 1
+        pass
+
+    return
+
+
+# dominates()-- Return True if block a dominates block b, or node a
+# dominates node b, which needs the dominance_tree analysis.  Every
+# block and node dominates itself.  Nodes in different blocks are
+# answered by their blocks, nodes in the same block by their order.
+
+def dominates(a, b):
+    if not isinstance(a, basic_block):
+        if a.block is b.block:
+            return a.order <= b.order
+
+        a = a.block
+        b = b.block
+        pass
+
+    return a.pre <= b.pre and b.post <= a.post
+
+
+analysis('cfg', build_cfg)
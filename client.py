@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+
+# (C) 2015 Andrew Vaught
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY
+# WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+# Client for the compile server.  This is a drop in replacement for
+# sse.py: it takes the same arguments, writes the same output and
+# exits with the same status, but the work is done by a server that
+# already has the compiler loaded.  If no server is running, the
+# program is compiled here instead.
+#
+# Messages in both directions are a single line of JSON.  The socket
+# is named by $SSE_SOCKET, or defaults to a file in /tmp named after
+# the user.
+#
+# This module only imports what it needs to talk to the server, so
+# that starting it is cheap.
+
+import os, sys, socket, json
+
+
+# default_socket()-- Return the path of the server's socket.
+
+def default_socket():
+    return os.environ.get('SSE_SOCKET') or '/tmp/sse-%d.sock' % os.getuid()
+
+
+# send_message()-- Write a message to a file.
+
+def send_message(f, message):
+    f.write(json.dumps(message) + '\n')
+    f.flush()
+    return
+
+
+# recv_message()-- Read a message from a file, returning None at the
+# end of the file.
+
+def recv_message(f):
+    line = f.readline()
+    if line == '':
+        return None
+
+    return json.loads(line)
+
+
+# request()-- Send a request to the server and return its reply.
+# Raises socket.error if the server can't be reached.
+
+def request(message, path=None):
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+    try:
+        s.connect(path or default_socket())
+        f = s.makefile('r+b')
+
+        send_message(f, message)
+        reply = recv_message(f)
+        f.close()
+
+    finally:
+        s.close()
+        pass
+
+    if reply is None:
+        raise socket.error, 'Server closed the connection'
+
+    return reply
+
+
+# compile()-- Have the server compile program text.  The keyword
+# arguments are those of sse.options.  Returns the reply, a dictionary
+# with the 'assembly' and a list of 'procedures', or an 'error' that
+# describes a compile error.
+
+def compile(source, path=None, **options):
+    return request({ 'command': 'compile', 'source': source,
+                     'options': options }, path)
+
+
+# stats()-- Return the server's statistics.
+
+def stats(path=None):
+    return request({ 'command': 'stats' }, path)
+
+
+# main()-- Run a command line in the server.  Watching a file for
+# changes is done here, since it never finishes, and so are parallel
+# builds, since the server doesn't fork.
+
+def main(argv):
+    try:
+        if '--watch' in argv:
+            raise socket.error, 'Watching runs locally'
+
+        if [ a for a in argv[1:] if a.startswith('-j') ]:
+            raise socket.error, 'Parallel builds run locally'
+
+        reply = request({ 'command': 'run', 'argv': argv,
+                          'cwd': os.getcwd() })
+
+    except socket.error:
+        import sse
+        return sse.main(argv)
+
+    sys.stdout.write(reply['stdout'].encode('utf-8'))
+    sys.stderr.write(reply['stderr'].encode('utf-8'))
+
+    if reply['status'] != 0:
+        raise SystemExit, reply['status']
+
+    return
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -23,7 +23,7 @@
 # WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
 # POSSIBILITY OF SUCH DAMAGE.
 
-import string
+import thread, re
 
 from ir_nodes import expr_assign, expr_binary, expr_unary, expr_compare, label
 from ir_nodes import jump, integer_subreg, memory, variable, opposite_cond
@@ -86,6 +86,14 @@ unsigned_set_map = {
     expr_greater_equal:  'setae' }
 
 
+# The code sequences are built by init_sequences() the first time that
+# assemble() runs, rather than when the module is imported.
+
+cmp_map = commutative_seq = subtract_seq = unary_seq = None
+
+sequence_lock = thread.allocate_lock()
+
+
 # init_sequences()-- Initialize various code sequences.  Putting
 # things in a subroutine avoids polluting the module's name space with
 # the intermediate variables.
@@ -97,8 +105,8 @@ def init_sequences():
 
     global cmp_map, commutative_seq, subtract_seq, unary_seq
 
-    cmp_map = { 1: s2,  2: s2,  3: s1,  4: s2,
-                5: s3,  6: s1,  7: s2,  8: s2, }
+    cmap = { 1: s2,  2: s2,  3: s1,  4: s2,
+             5: s3,  6: s1,  7: s2,  8: s2, }
 
     s1  = [ 'op @3, @1' ]
     s2  = [ 'op @2, @1' ]
@@ -147,9 +155,27 @@ def init_sequences():
     unary_seq = {
         1: s1,  2: s2,  3: s2,  4: s3,  5: s4,  6: s1,  7: s4 }
 
+# cmp_map goes last, it says that the others are there.
+
+    cmp_map = cmap
     return
 
-init_sequences()
+
+def load_sequences():
+    sequence_lock.acquire()
+
+    try:
+        if cmp_map is None:
+            init_sequences()
+            pass
+
+        pass
+
+    finally:
+        sequence_lock.release()
+        pass
+
+    return
 
 
 
@@ -181,16 +207,22 @@ def get_temp_reg(t):
     raise RuntimeError, 'get_temp_reg(): Bad type'
 
 
+# replace_insn()-- Fill in the operands of an instruction template.
+# The template is scanned once, so the order of the replacements
+# doesn't matter and operands are never replaced again.
+
+operand_re = re.compile(r'@[123t]|\bop\b')
+
 def replace_insn(insn, repl):
-    for k, v in repl.items():
+    def operand(m):
+        v = repl[m.group()]
         if isinstance(v, variable):
             v = v.register
             pass
 
-        insn = string.replace(insn, k, str(v))
-        pass
+        return str(v)
 
-    return insn
+    return operand_re.sub(operand, insn)
 
 
 # classify_cmp()-- Classify a comparison expression.  Because
@@ -920,6 +952,7 @@ def test_unary(operator):
 
 def code_test():
     from ir_nodes import expr_plus, expr_minus, expr_uminus
+    load_sequences()
     test_binary(expr_minus, subtract_seq)
     test_binary(expr_plus, commutative_seq)
     test_cmp()
@@ -928,7 +961,13 @@ def code_test():
 
 
 
-def generate_assembler(graph):
+# assemble()-- Generate assembler for a flow graph, returning the list
+# of lines.
+
+def assemble(graph):
+    if cmp_map is None:
+        load_sequences()
+        pass
 
     insn_list = []
     st = graph
@@ -960,9 +999,12 @@ def generate_assembler(graph):
         st = st.next
         pass
 
-    for insn in insn_list:
+    return insn_list
+
+
+def generate_assembler(graph):
+    for insn in assemble(graph):
         print insn
         pass
 
     return
-
@@ -25,7 +25,7 @@
 
 # Intermediate representation nodes
 
-import sys
+import sys, thread
 
 from kw import constant, type_node
 
@@ -39,11 +39,176 @@ class parse_error(Exception):
     pass
 
 
+# An ordered_dict is a dictionary that remembers the order in which
+# keys were first stored, and iterates in that order.  The back end
+# keys dictionaries by nodes and variables, which hash by address, so
+# anything that walks a plain dictionary comes out in a different
+# order from one run to the next.  This is a lot lighter than
+# collections.OrderedDict, and that matters in the inner loops.
+#
+# Deleting a key leaves a tombstone in its place in the order, found
+# through the 'index' map, so that deletion takes constant time.  The
+# tombstones are swept out by the next walk of the dictionary, which
+# takes time proportional to the order anyway.
+
+class ordered_dict(dict):
+    tombstone = object()
+
+    def __init__(self, items=()):
+        dict.__init__(self)
+        self.order = []
+        self.index = {}
+        self.dead = 0
+
+        for k, v in items:
+            self[k] = v
+            pass
+
+        return
+
+
+    def __setitem__(self, k, v):
+        if k not in self:
+            self.index[k] = len(self.order)
+            self.order.append(k)
+            pass
+
+        dict.__setitem__(self, k, v)
+        return
+
+
+    def __delitem__(self, k):
+        dict.__delitem__(self, k)
+        self.order[self.index.pop(k)] = self.tombstone
+        self.dead += 1
+        return
+
+
+# live_order()-- Return the order with the tombstones swept out.
+
+    def live_order(self):
+        if self.dead > 0:
+            self.order = [ k for k in self.order
+                           if k is not self.tombstone ]
+            self.index = dict([ (k, i) for i, k in enumerate(self.order) ])
+            self.dead = 0
+            pass
+
+        return self.order
+
+
+    def __iter__(self):
+        return iter(self.live_order())
+
+    def keys(self):
+        return self.live_order()[:]
+
+    def values(self):
+        return [ dict.__getitem__(self, k) for k in self.live_order() ]
+
+    def items(self):
+        return [ (k, dict.__getitem__(self, k)) for k in self.live_order() ]
+
+    def iterkeys(self):
+        return iter(self.live_order())
+
+    def itervalues(self):
+        return iter(self.values())
+
+    def iteritems(self):
+        return iter(self.items())
+
+
+# popitem()-- Remove and return the newest item.
+
+    def popitem(self):
+        order = self.live_order()
+
+        if len(order) == 0:
+            raise KeyError, 'popitem(): dictionary is empty'
+
+        k = order.pop()
+        del self.index[k]
+        return k, dict.pop(self, k)
+
+
+    def pop(self, k, *default):
+        if k in self:
+            v = dict.__getitem__(self, k)
+            del self[k]
+            return v
+
+        return dict.pop(self, k, *default)
+
+
+    def setdefault(self, k, v=None):
+        if k not in self:
+            self[k] = v
+            pass
+
+        return dict.__getitem__(self, k)
+
+
+    def update(self, other=()):
+        if hasattr(other, 'keys'):
+            other = [ (k, other[k]) for k in other.keys() ]
+            pass
+
+        for k, v in other:
+            self[k] = v
+            pass
+
+        return
+
+
+    def clear(self):
+        dict.clear(self)
+        self.order = []
+        self.index = {}
+        self.dead = 0
+        return
+
+
+    def copy(self):
+        return self.__class__(self.items())
+
+    def __reduce__(self):
+        return self.__class__, (self.items(),)
+
+    def __repr__(self):
+        return 'ordered_dict(%r)' % self.items()
+
+    pass
+
+
+# IR classes list their members in __slots__, so that a node is a
+# small fixed record instead of carrying a dictionary around.  A long
+# procedure has hundreds of thousands of nodes, and the dictionaries
+# were most of their memory.  The compact metaclass gives subclasses
+# that add no members an empty __slots__, without which they would get
+# a dictionary back.  A member that hasn't been set raises
+# AttributeError, just like before, so hasattr() still tells whether
+# an analysis has annotated a node.  Passes keep their scratch data in
+# side tables, never on the nodes.
+
+class compact(type):
+    def __new__(cls, name, bases, members):
+        members.setdefault('__slots__', ())
+        return type.__new__(cls, name, bases, members)
+
+    pass
+
+
 # ir_nodes are expressions, labels and jumps linked together in a
 # double linked list.  The links are through the 'next' and 'prev'
-# members.
+# members.  'n' is the node's number from number_st(), 'block' is its
+# basic block, 'order' its place in the block and the rest are set by
+# the analyses.
 
-class ir_node:
+class ir_node(object):
+    __metaclass__ = compact
+    __slots__ = ('next', 'prev', 'n', 'block', 'order', 'dom', 'children',
+                 'live', 'last_used')
 
 # remove()-- Remove this node from the linked list.
 
@@ -106,6 +271,8 @@ class ir_node:
 # expression.  The branch is taken if the expression is true.
 
 class jump(ir_node):
+    __slots__ = ('label', 'cond')
+
     def __init__(self, label, cond=None):
         self.label = label
         self.cond = cond
@@ -150,6 +317,8 @@ class jump(ir_node):
 # conditionally or unconditionally.
 
 class label(ir_node):
+    __slots__ = ('name', 'defined', 'jumps', 'phi_list')
+
     def __init__(self, name):
         self.name = name
         self.defined = False
@@ -173,12 +342,111 @@ class label(ir_node):
 
 
 
-def get_temp_label(index=[0]):
-    index[0] += 1
-    return label('L.%d' % index[0])
+# A compile_context holds the state of one compilation: the counters
+# behind temporary names and the side tables that passes keep their
+# scratch data in.  If 'debug' is set, passes print what they did, and
+# 'ssa_options' are the ssa.ssa_options of the back end, or None for
+# the defaults.  Each thread has a stack of contexts, the top one being
+# current, so compilations in different threads share nothing.
+#
+# A parser has a context for the whole program, and its labels are
+# numbered over the program.  compile_procedure() pushes a context for
+# each procedure, whose labels include the procedure's name.  Names
+# made by the back end are then the same no matter which thread or
+# process compiles a procedure, or in what order.
+
+class compile_context:
+    def __init__(self, scope=None, debug=False, ssa_options=None):
+        self.scope = scope
+        self.debug = debug
+        self.ssa_options = ssa_options
+
+        self.labels = 0
+        self.temps = 0
+        self.memory = 0
+
+        self.present = {}    # Variables colored so far
+        self.count = {}      # Variants of each variable during renaming
+        self.stack = {}      # Current variant stack for renaming
+        self.proc = None     # Procedure being compiled
+        self.analyses = {}   # Valid analyses of the procedure, by name
+        self.timer = None    # passes.pass_timer measuring the passes
+        return
+
+
+    def temp_label(self):
+        self.labels += 1
+
+        if self.scope is None:
+            return label('L.%d' % self.labels)
+
+        return label('L.%s.%d' % (self.scope, self.labels))
+
+
+    def temp_var(self, var_type):
+        self.temps += 1
+        return variable('T.%d' % self.temps, var_type)
+
+
+    def memory_register(self):
+        self.memory += 1
+        return memory(self.memory)
+
+    pass
+
+
+thread_state = thread._local()
+
+
+# context_stack()-- Return the context stack of the current thread.
+# Threads start with a context of their own at the bottom.
+
+def context_stack():
+    s = getattr(thread_state, 'contexts', None)
+
+    if s is None:
+        s = thread_state.contexts = [ compile_context() ]
+        pass
+
+    return s
+
+
+def current_context():
+    return context_stack()[-1]
+
+
+def enter_context(ctx):
+    context_stack().append(ctx)
+    return
 
 
-class variable:
+def leave_context():
+    context_stack().pop()
+    return
+
+
+def get_temp_label():
+    return current_context().temp_label()
+
+
+# reserve_temp_labels()-- Make sure that temporary labels created from
+# now on are numbered above n.  Used when labels come from somewhere
+# other than get_temp_label(), like the parse cache.
+
+def reserve_temp_labels(n):
+    ctx = current_context()
+
+    if ctx.labels < n:
+        ctx.labels = n
+        pass
+
+    return
+
+
+class variable(object):
+    __slots__ = ('name', 'type', 'q_static', 'q_extern', 'initial',
+                 'register', 'interference', 'n')
+
     def __init__(self, name, var_type, initial=None,
                  q_static=None, q_extern=None):
 
@@ -217,20 +485,24 @@ class variable:
         return
 
 # next_variant()-- Return the next variant on the base variable.  The
-# variants don't have the c or stack members.  The variant is
+# variant count and stack are in the current context.  The variant is
 # automatically put on the stack.
 
     def next_variant(self):
-        self.c += 1
+        ctx = current_context()
+
+        c = ctx.count[self] = ctx.count[self] + 1
 
-        v = variable('%s.%d' % ( self.name, self.c ), self.type)
-        self.stack.append(v)
+        v = variable('%s.%d' % ( self.name, c ), self.type)
+        ctx.stack[self].append(v)
         return v
 
     pass
 
 
-class phi:
+class phi(object):
+    __slots__ = ('var', 'lhs', 'args')
+
     def __init__(self, var):
         self.var = var
         self.lhs = None
@@ -248,7 +520,9 @@ class phi:
 # Phi arguments consist of variable instances and the statement node
 # that the control associated with that variable comes from.
 
-class phi_arg:
+class phi_arg(object):
+    __slots__ = ('var', 'node')
+
     def __init__(self, var, node):
         self.var = var
         self.node = node
@@ -263,6 +537,8 @@ class phi_arg:
 # expressions.
 
 class expr(ir_node):
+    __slots__ = ('type',)
+
     def jump_opcode(self):
         return 'jnz'
 
@@ -272,6 +548,8 @@ class expr(ir_node):
 # Sub-classes of expressions
 
 class expr_assign(expr):
+    __slots__ = ('var', 'value')
+
     def __init__(self, *args):
         self.var, self.value = args
         return
@@ -313,6 +591,8 @@ class expr_assign(expr):
 # deep in the phi-merging code.
 
 class swap(expr):
+    __slots__ = ('a', 'b')
+
     def __init__(self, a, b):
         self.a = a
         self.b = b
@@ -329,6 +609,8 @@ class swap(expr):
 
 
 class expr_ternary(expr):
+    __slots__ = ('predicate', 'a', 'b')
+
     def __init__(self, *args):
         self.predicate, self.a, self.b = args
         return
@@ -385,11 +667,35 @@ class expr_ternary(expr):
 
 #########################
 
+# The type maps are filled in by init_btm() the first time a binary
+# expression needs them, rather than when the module is imported.
+
 binary_type_map = {}
 bitwise_type_map = {}
 logical_type_map = {}
 
+btm_ready = [ False ]
+btm_lock = thread.allocate_lock()
+
 def init_btm():
+    btm_lock.acquire()
+
+    try:
+        if not btm_ready[0]:
+            fill_btm()
+            btm_ready[0] = True
+            pass
+
+        pass
+
+    finally:
+        btm_lock.release()
+        pass
+
+    return
+
+
+def fill_btm():
     btm = binary_type_map
 
     for t in [ type_float8, type_float4, type_int8, type_int4, type_int2,
@@ -440,10 +746,9 @@ def init_btm():
 
     return
 
-init_btm()
-
 
 class expr_binary(expr):
+    __slots__ = ('a', 'b')
 
     type_map = { '+': binary_type_map, '-': binary_type_map,
                  '*': binary_type_map, '/': binary_type_map,
@@ -478,6 +783,10 @@ class expr_binary(expr):
         ta = self.a.type.basic_type
         tb = self.b.type.basic_type
 
+        if not btm_ready[0]:
+            init_btm()
+            pass
+
         try:
             self.type = type_node(self.type_map[self.op][ta, tb], 0)
 
@@ -839,6 +1148,8 @@ opposite_cond = {
 ################
 
 class expr_unary(expr):
+    __slots__ = ('arg',)
+
     def __init__(self, arg):
         self.arg = arg
         self.type = arg.type
@@ -894,8 +1205,7 @@ class expr_uminus(expr_unary):
         if not isinstance(self.arg, constant):
             return self
 
-        self.arg.value *= -1
-        return self.arg
+        return constant(-self.arg.value, self.arg.type)
 
     pass
 
@@ -930,8 +1240,7 @@ class expr_bitwise_not(expr_unary):
     def simplify(self):
         self.arg = a = self.arg.simplify()
         if isinstance(a, constant):
-            a.value = ~a.value
-            return self.arg
+            return constant(~a.value, a.type)
 
         return self
 
@@ -952,6 +1261,8 @@ class expr_paren(expr_unary):
 
 
 class expr_intrinsic(expr):
+    __slots__ = ('name', 'arg')
+
     def __init__(self, *args):
         self.name, self.arg = args
         return
@@ -997,8 +1308,7 @@ class expr_type_conv(expr_intrinsic):
         if not isinstance(self.arg, constant):
             return self
 
-        self.arg.type = self.type
-        return self.arg
+        return constant(self.arg.value, self.type)
 
     pass
 
@@ -1122,9 +1432,8 @@ class memory(register):
     pass
 
 
-def get_memory_register(count=[0]):
-    count[0] += 1
-    return memory(count[0])
+def get_memory_register():
+    return current_context().memory_register()
 
 
 # number_st()-- Utility for show_flowgraph that assigns statement
@@ -1159,8 +1468,8 @@ def show_flowgraph(graph):
             print '%3d  (%3d) ' % (st.n, d),
             pass
 
-        if hasattr(st, 'DF'):
-            df = ', '.join([ str(x.n) for x in st.DF ])
+        if hasattr(st, 'block') and hasattr(st.block, 'DF'):
+            df = ', '.join([ str(x.first.n) for x in st.block.DF ])
             print '[ %-15s ]' % df,
             pass
 
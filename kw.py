@@ -40,6 +40,10 @@ class token:
     pass
 
 
+# Constants from the lexer are shared by every occurrence of the same
+# literal in a compilation unit, so they are never modified in place.
+# Simplifications build new constants instead.
+
 class constant:
     def __init__(self, value, decl_type):
         self.value = value
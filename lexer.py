@@ -29,6 +29,8 @@
 # Lexical analyzer for the SSE compiler
 
 import re
+from collections import deque
+from StringIO import StringIO
 from kw import *
 
 
@@ -36,92 +38,217 @@ class lex_error(Exception):
     pass
 
 
+# scan_errors are lexical errors found by the scanner itself, as
+# opposed to syntax errors.  They are located at the scanner's
+# position rather than at the last token the parser took.
+
+class scan_error(lex_error):
+    pass
+
+
+# A compile_error is what callers see of any error in the source.  It
+# has the message and where it is, and prints as the source line with
+# a caret under the column, followed by the message.
+
+class compile_error(Exception):
+    def __init__(self, filename, line, col, msg, text=None):
+        Exception.__init__(self, msg)
+
+        self.filename = filename
+        self.line = line
+        self.col = col
+        self.msg = msg
+        self.text = text
+        return
+
+    def __str__(self):
+        result = ''
+
+        if self.text is not None:
+            result = self.text.rstrip() + '\n' + (self.col - 1) * ' ' + '^\n'
+            pass
+
+        return result + 'In line %d, column %d of %s: %s' % \
+            (self.line, self.col, self.filename, self.msg)
+
+    pass
+
+
+# A lexeme is a token along with the line and column where it starts.
+# The token itself is the 'value', which is the same object that
+# next_token() returns.
+
+class lexeme(object):
+    __slots__ = ( 'value', 'line', 'col' )
+
+    def __init__(self, value, line, col):
+        self.value = value
+        self.line = line
+        self.col = col
+        return
+
+    def __str__(self):
+        return '%s@%d:%d' % (self.value, self.line, self.col)
+
+    pass
+
+
 word_re  = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
 float_re = re.compile(r'\d+\.\d*([EeDd][+-]?\d+)?')
 int_re   = re.compile(r'\d+')
 
-# The lexer takes a file object and returns a sequence of tokens.
+
+# Master regular expression for the whole-file scanner.  Each match is
+# optional horizontal blanks followed by exactly one of the groups
+# below, and the group that matched tells what was found.  Unlike
+# eat_comment(), the non-greedy match finds the first '*/'.  A '/*'
+# that doesn't match the comment group was never closed.  Longer
+# operators come first so that digrams win over their unigram
+# prefixes.
+
+S_NEWLINE, S_LINE_COMMENT, S_COMMENT, S_OPEN_COMMENT = 1, 2, 3, 4
+S_FLOAT, S_INT, S_WORD, S_OP = 5, 6, 7, 8
+
+blanks = ' \t\r\f\v'
+
+history_size = 16
+
+master_re = re.compile(
+    r'[ \t\r\f\v]*(?:(\n)|(//[^\n]*)|(/\*.*?\*/)|(/\*)|' +
+    r'(\d+\.\d*(?:[EeDd][+-]?\d+)?)|(\d+)|([A-Za-z_][A-Za-z0-9_]*)|(' +
+    '|'.join([ re.escape(t.name)
+               for t in sorted(token_list, key=lambda t: -len(t.name)) ]) +
+    '))', re.S)
+
+
+# The lexer takes a file and returns a sequence of tokens.  In the
+# default whole-file mode, the file is read once and scanned by
+# position, without slicing strings.  The original line-at-a-time
+# mode is still available with whole_file=False.
+#
+# If 'source' is given, it is the program text itself, either as a
+# string or as a file-like object, and the filename is only used in
+# error messages.
+#
+# Identifiers and literals are interned per lexer, which is one
+# compilation unit.  Every occurrence of a name is the same word
+# instance, with an interned name string, so that namespace lookups
+# mostly compare by identity.  Every occurrence of a literal is the
+# same constant instance.
+#
+# Scanned lexemes that haven't been taken yet wait in the 'buffer'
+# deque, which gives the parser any amount of lookahead through
+# peek().  The last few lexemes taken are kept in 'history', so that
+# they can be pushed back and so that errors can point at them.
+#
+# When 'record' is a list, the tokens taken are appended to it.  The
+# parser uses this to fingerprint each procedure.
 
 class lexer:
 
-    def __init__(self, filename):
+    def __init__(self, filename, whole_file=True, source=None):
         self.filename = filename
-        
-        self.fd = open(filename, 'r')
-        self.token_queue = []
-        self.line = 0
-        self.current_line = ''
+        self.whole_file = whole_file
 
-        self.lex_map = {}     # Map characters to lexers
+        if source is None:
+            self.fd = open(filename, 'r')
 
-        for c in '0123456789':
-            self.lex_map[c] = self.parse_number
-            pass
+        elif hasattr(source, 'read'):
+            self.fd = source
+
+        elif whole_file:
+            self.fd = None
 
-        for c in 'ABCDEFGHIJKLMNOPQRSTUVWXYZ_':
-            self.lex_map[c] = self.parse_word
-            self.lex_map[c.lower()] = self.parse_word
+        else:
+            self.fd = StringIO(source)
             pass
 
-# Unigrams and digram tokens
+        self.words = dict(kw_dict)
+        self.literals = {}
+        self.int_type = type_node(type_int4, 0)
+        self.float_type = type_node(type_float4, 0)
 
-        self.uni_map = {}
-        self.di_map = {}
+        self.buffer = deque()
+        self.history = deque(maxlen=history_size)
+        self.record = None
+        self.line = 0
+        self.current_line = ''
+        self.scan = self.line_token
 
-        for t in token_list:
-            if len(t.name) == 1:
-                self.uni_map[t.name] = t
+        if whole_file:
+            if self.fd is None:
+                self.text = source
 
-                if t.name not in self.lex_map:
-                    self.lex_map[t.name] = self.parse_unigram
-                    pass
+            else:
+                self.text = self.fd.read()
+                pass
 
+            if source is None:
+                self.fd.close()
                 pass
 
-            elif len(t.name) == 2:
-                self.lex_map[t.name[0]] = self.parse_digram
+            self.pos = 0
+            self.line = 1
+            self.line_start = 0
+            self.scan = self.scan_tokens().next
+            pass
 
-                if t.name[0] not in self.di_map:
-                    self.di_map[t.name[0]] = { t.name[1]: t }
+        return
 
-                else:
-                    self.di_map[t.name[0]][t.name[1]] = t
-                    pass
 
-                pass
+# current_locus()-- Return the text of the current line and the
+# current column within it.
 
-            else:
-                raise lex_error, 'Token name with more than two characters!'
-            
+    def current_locus(self):
+        if not self.whole_file:
+            col = len(self.original_line) - len(self.current_line) + 1
+            return self.original_line, col
+
+        start = self.line_start
+        end = self.text.find('\n', start)
+        if end < 0:
+            end = len(self.text)
             pass
 
-# keywords, typenames
+        return self.text[start:end], self.pos - start + 1
 
-        self.kw_dict = {}
 
-        for t in keyword_list + type_names + intrinsic_names:
-            self.kw_dict[t.name] = t
-            pass
+# source_line()-- Return the text of a line, or None if we don't have
+# it anymore.
 
-        return
+    def source_line(self, n):
+        if self.whole_file:
+            lines = self.text.split('\n')
+            return lines[n-1] if n <= len(lines) else ''
 
+        return self.original_line if n == self.line else None
 
-    def current_locus(self):
-        col = len(self.original_line) - len(self.current_line) + 1
-        return self.current_line, col
 
+# locus()-- Return the line and column of the last token taken.
 
-# error()-- Come here to build an error message associated with the
-# current position.  Returns the string message.
+    def locus(self):
+        if len(self.history) == 0:
+            return 1, 1
+
+        lx = self.history[-1]
+        return lx.line, lx.col
+
+
+# error()-- Come here to raise a compile_error associated with the
+# current position.  Errors from the scanner are at the scanner's
+# position, other errors are at the last token taken.
 
     def error(self, msg):
-        line, col = self.current_locus()
+        if isinstance(msg, scan_error):
+            text, col = self.current_locus()
+            line = self.line
 
-        print self.original_line.rstrip()
-        print (col - 1) * ' ' + '^'
-        print 'In line %d of %s: %s' % (self.line, self.filename, msg)
+        else:
+            line, col = self.locus()
+            text = self.source_line(line)
+            pass
 
-        raise SystemExit, 1
+        raise compile_error(self.filename, line, col, str(msg), text)
 
 
 # next_line()-- Get another non-blank line if nothing is left of the
@@ -157,7 +284,7 @@ class lexer:
 
             self.current_line = ''
             if self.next_line():
-                raise lex_error, 'File ended inside comment'
+                raise scan_error, 'File ended inside comment'
 
             pass
 
@@ -168,16 +295,50 @@ class lexer:
     def parse_number(self):
         m = float_re.match(self.current_line)
         if m is not None:
-            self.current_line = self.current_line[len(m.group()):]
-            return constant(float(m.group()), type_node(type_float4, 0))
+            value = m.group()
+            self.current_line = self.current_line[len(value):]
+            return self.float_literal(value)
 
         value = int_re.match(self.current_line).group()
         self.current_line = self.current_line[len(value):]
-        return constant(int(value), type_node(type_int4, 0))
+        return self.int_literal(value)
+
+
+# int_literal(), float_literal()-- Return the interned constant for
+# the text of a literal.
+
+    def int_literal(self, value):
+        c = self.literals.get(value)
+        if c is None:
+            c = self.literals[value] = constant(int(value), self.int_type)
+            pass
+
+        return c
+
+
+    def float_literal(self, value):
+        c = self.literals.get(value)
+        if c is None:
+            c = self.literals[value] = constant(float(value), self.float_type)
+            pass
+
+        return c
+
+
+# name_token()-- Return the token for a name, which is either a
+# reserved word or the interned word instance.
+
+    def name_token(self, name):
+        t = self.words.get(name)
+        if t is None:
+            t = self.words[name] = word(intern(name))
+            pass
+
+        return t
 
 
     def parse_unigram(self):
-        t = self.uni_map[self.current_line[0]]
+        t = uni_map[self.current_line[0]]
         self.current_line = self.current_line[1:]
         return t
 
@@ -192,7 +353,7 @@ class lexer:
         a = self.current_line[0]
         b = self.current_line[1]
 
-        dg = self.di_map[a]
+        dg = di_map[a]
         if b not in dg:
             return self.parse_unigram()
 
@@ -201,27 +362,115 @@ class lexer:
 
 
 # parse_word()-- Parse a word.  Returns an instance of some sort.  If
-# the word isn't a reserved name, create a word() instance.
+# the word isn't a reserved name, it is a word() instance.
 
     def parse_word(self):
         m = word_re.match(self.current_line)
         name = m.group()
 
         self.current_line = self.current_line[len(name):]
-        return self.kw_dict.get(name, word(name))
+        return self.name_token(name)
 
 
-# next_token()-- Return the next token on the input.
+# scan_tokens()-- Generator that scans the whole-file text, one master
+# regex match per lexeme.  Nothing is copied except the text of the
+# token itself.  The position and line are kept up to date for error
+# messages.  Returns EOF forever once the text is exhausted.
 
-    def next_token(self):
-        if len(self.token_queue) > 0:
-            return self.token_queue.pop(0)
+    def scan_tokens(self):
+        text = self.text
+        words = self.words
+        literals = self.literals
+
+        pos = 0
+        line = 1
+        line_start = 0
+
+        for m in master_re.finditer(text):
+            if m.start() != pos:
+                break
+
+            self.pos = pos = m.end()
+            kind = m.lastindex
 
+            if kind == S_WORD:
+                value = m.group(S_WORD)
+                t = words.get(value)
+                if t is None:
+                    t = self.name_token(value)
+                    pass
+
+                yield lexeme(t, line, pos - len(value) - line_start + 1)
+
+            elif kind == S_OP:
+                value = m.group(S_OP)
+                yield lexeme(op_map[value], line,
+                             pos - len(value) - line_start + 1)
+
+            elif kind == S_NEWLINE:
+                self.line = line = line + 1
+                self.line_start = line_start = pos
+
+            elif kind == S_INT:
+                value = m.group(S_INT)
+                t = literals.get(value)
+                if t is None:
+                    t = self.int_literal(value)
+                    pass
+
+                yield lexeme(t, line, pos - len(value) - line_start + 1)
+
+            elif kind == S_FLOAT:
+                value = m.group(S_FLOAT)
+                t = literals.get(value)
+                if t is None:
+                    t = self.float_literal(value)
+                    pass
+
+                yield lexeme(t, line, pos - len(value) - line_start + 1)
+
+            elif kind == S_COMMENT:
+                n = m.group(S_COMMENT).count('\n')
+                if n > 0:
+                    self.line = line = line + n
+                    self.line_start = line_start = text.rfind('\n', 0, pos) + 1
+                    pass
+
+                pass
+
+            elif kind == S_OPEN_COMMENT:
+                self.pos = m.start(S_OPEN_COMMENT)
+                raise scan_error, 'File ended inside comment'
+
+            pass
+
+# Something didn't match, or we're at the end.  Only blanks may remain.
+
+        while pos < len(text) and text[pos] in blanks:
+            pos += 1
+            pass
+
+        self.pos = pos
+
+        if pos < len(text):
+            raise scan_error, "Bad character '%s' found" % text[pos]
+
+        eof = lexeme(tok_eof, line, pos - line_start + 1)
+
+        while True:
+            yield eof
+
+        return
+
+
+# line_token()-- Scan the next lexeme in line-at-a-time mode.
+
+    def line_token(self):
         while True:
             self.current_line = self.current_line.lstrip()
 
             if self.next_line():
-                return tok_eof
+                return lexeme(tok_eof, self.line, 1)
 
             if self.current_line.startswith('//'):  # End of line comment
                 self.current_line = ''
@@ -236,16 +485,92 @@ class lexer:
 # We've hit something at this point
 
         c = self.current_line[0]
-        if c not in self.lex_map:
-            raise lex_error, "Bad character '%s' found" % c
+        if c not in lex_map:
+            raise scan_error, "Bad character '%s' found" % c
+
+        col = len(self.original_line) - len(self.current_line) + 1
+        return lexeme(lex_map[c](self), self.line, col)
+
+
+# next_token()-- Return the next token on the input.
+
+    def next_token(self):
+        buf = self.buffer
+        lx = buf.popleft() if buf else self.scan()
+
+        self.history.append(lx)
+
+        if self.record is not None:
+            self.record.append(lx.value)
+            pass
 
-        return self.lex_map[c]()
+        return lx.value
 
 
-# push()-- Push a token back on the input.  Maximun of one push.
+# peek()-- Return the k-th token ahead without taking it.  peek(0) is
+# the token that the next call to next_token() returns.
+
+    def peek(self, k=0):
+        buf = self.buffer
+
+        while len(buf) <= k:
+            buf.append(self.scan())
+            pass
+
+        return buf[k].value
+
+
+# lookahead()-- Generator for the tokens ahead, without taking them.
+# Tokens that it scans wait in the buffer.
+
+    def lookahead(self):
+        buf = self.buffer
+
+        for lx in list(buf):
+            yield lx.value
+            pass
+
+        while True:
+            lx = self.scan()
+            buf.append(lx)
+            yield lx.value
+            pass
+
+        return
+
+
+# skip()-- Take n tokens that have been looked at.
+
+    def skip(self, n):
+        buf = self.buffer
+
+        for i in xrange(n):
+            self.history.append(buf.popleft())
+            pass
+
+        return
+
+
+# push()-- Push a token back on the input.  Tokens pushed back in the
+# reverse order that they were taken keep their loci.  Using peek()
+# instead is cheaper.
 
     def push(self, token):
-        self.token_queue.insert(0, token)
+        h = self.history
+
+        if len(h) > 0 and h[-1].value is token:
+            lx = h.pop()
+
+            if self.record:
+                self.record.pop()
+                pass
+
+        else:
+            line, col = self.locus()
+            lx = lexeme(token, line, col)
+            pass
+
+        self.buffer.appendleft(lx)
         return
 
 
@@ -253,12 +578,11 @@ class lexer:
 # token if it is 't', leave the input alone if not.
 
     def peek_token(self, t):
-        n = self.next_token()
-        if t == n:
-            return True
+        if self.peek() is not t:
+            return False
 
-        self.push(n)
-        return False
+        self.next_token()
+        return True
 
 
     def required_token(self, t):
@@ -271,6 +595,417 @@ class lexer:
 
 
 
+# The dispatch tables are built once, when the module is imported, and
+# are shared by all lexer instances.  frozen_dict keeps anybody from
+# modifying them by accident.
+
+class frozen_dict(dict):
+    def read_only(self, *args, **kwargs):
+        raise TypeError, 'Lexer tables are read-only'
+
+    __setitem__ = __delitem__ = clear = pop = popitem = read_only
+    setdefault = update = read_only
+
+    pass
+
+
+# init_tables()-- Build the lexer dispatch tables from the token,
+# keyword, type and intrinsic lists.  lex_map maps the first character
+# of a token to the lexer method that parses it in line mode.  uni_map
+# and di_map hold the unigram and digram tokens, kw_dict the reserved
+# words and op_map the operators for the whole-file scanner.
+
+def init_tables():
+    global lex_map, uni_map, di_map, kw_dict, op_map
+
+    lm = {}
+
+    for c in '0123456789':
+        lm[c] = lexer.parse_number
+        pass
+
+    for c in 'ABCDEFGHIJKLMNOPQRSTUVWXYZ_':
+        lm[c] = lexer.parse_word
+        lm[c.lower()] = lexer.parse_word
+        pass
+
+# Unigrams and digram tokens
+
+    um = {}
+    dm = {}
+
+    for t in token_list:
+        if len(t.name) == 1:
+            um[t.name] = t
+
+            if t.name not in lm:
+                lm[t.name] = lexer.parse_unigram
+                pass
+
+            pass
+
+        elif len(t.name) == 2:
+            lm[t.name[0]] = lexer.parse_digram
+
+            if t.name[0] not in dm:
+                dm[t.name[0]] = { t.name[1]: t }
+
+            else:
+                dm[t.name[0]][t.name[1]] = t
+                pass
+
+            pass
+
+        else:
+            raise lex_error, 'Token name with more than two characters!'
+
+        pass
+
+    for k, v in dm.items():
+        dm[k] = frozen_dict(v)
+        pass
+
+# keywords, typenames
+
+    kd = {}
+
+    for t in keyword_list + type_names + intrinsic_names:
+        kd[t.name] = t
+        pass
+
+# Operator name to token, for the whole-file scanner
+
+    om = {}
+
+    for t in token_list:
+        om[t.name] = t
+        pass
+
+    lex_map = frozen_dict(lm)
+    uni_map = frozen_dict(um)
+    di_map = frozen_dict(dm)
+    kw_dict = frozen_dict(kd)
+    op_map = frozen_dict(om)
+    return
+
+init_tables()
+
+
+# An incremental_lexer keeps the program text as a list of lines,
+# along with the tokens found on each line and whether each line ends
+# inside a /* */ comment.  After an edit, only the damaged lines are
+# scanned again, plus any following lines whose comment state
+# changed.  It is also a lexer, whose tokens come from the stored
+# lines, so the parser can run over it again after an edit.
+#
+# Lines and columns count from one, as in lexemes.  Bad characters
+# don't stop the scan, since an editor's text is often broken.  They
+# are kept per line, and are raised as scan_errors when the parser
+# gets to them.
+
+class incremental_lexer(lexer):
+
+    def __init__(self, filename, source):
+        lexer.__init__(self, filename, True, '')
+
+        if hasattr(source, 'read'):
+            source = source.read()
+            pass
+
+        self.lines = source.split('\n')
+        n = len(self.lines)
+
+        self.line_tokens = [ None ] * n
+        self.line_errors = [ None ] * n
+        self.comment_out = [ False ] * n
+
+        in_comment = False
+
+        for i in xrange(n):
+            in_comment = self.scan_line(i, in_comment)
+            pass
+
+        self.rewind()
+        return
+
+
+# scan_line()-- Scan line i, which starts inside a comment if
+# in_comment is set.  The line's tokens are stored as (token, column)
+# pairs.  Returns True if the line ends inside a comment.
+
+    def scan_line(self, i, in_comment):
+        text = self.lines[i]
+        words = self.words
+        literals = self.literals
+
+        tokens = []
+        errors = None
+        pos = 0
+
+        if in_comment:
+            n = text.find('*/')
+            if n < 0:
+                text = ''
+
+            else:
+                pos = n + 2
+                in_comment = False
+                pass
+
+            pass
+
+        while True:
+            for m in master_re.finditer(text, pos):
+                if m.start() != pos:
+                    break
+
+                pos = m.end()
+                kind = m.lastindex
+
+                if kind == S_WORD:
+                    value = m.group(S_WORD)
+                    t = words.get(value)
+                    if t is None:
+                        t = self.name_token(value)
+                        pass
+
+                    tokens.append((t, pos - len(value) + 1))
+
+                elif kind == S_OP:
+                    value = m.group(S_OP)
+                    tokens.append((op_map[value], pos - len(value) + 1))
+
+                elif kind == S_INT:
+                    value = m.group(S_INT)
+                    t = literals.get(value)
+                    if t is None:
+                        t = self.int_literal(value)
+                        pass
+
+                    tokens.append((t, pos - len(value) + 1))
+
+                elif kind == S_FLOAT:
+                    value = m.group(S_FLOAT)
+                    t = literals.get(value)
+                    if t is None:
+                        t = self.float_literal(value)
+                        pass
+
+                    tokens.append((t, pos - len(value) + 1))
+
+                elif kind == S_OPEN_COMMENT:
+                    in_comment = True
+                    pos = len(text)
+                    break
+
+                pass
+
+            while pos < len(text) and text[pos] in blanks:
+                pos += 1
+                pass
+
+            if pos >= len(text):
+                break
+
+            if errors is None:
+                errors = []
+                pass
+
+            errors.append((pos + 1, "Bad character '%s' found" % text[pos]))
+            pos += 1
+            pass
+
+        self.line_tokens[i] = tokens
+        self.line_errors[i] = errors
+        self.comment_out[i] = in_comment
+        return in_comment
+
+
+# rewind()-- Start the token stream over from the top, discarding any
+# lookahead.
+
+    def rewind(self):
+        self.buffer.clear()
+        self.history.clear()
+        self.scan = self.stored_tokens().next
+        return
+
+
+# stored_tokens()-- Generator that returns the stored lexemes in
+# order, raising a scan_error when it gets to a bad character or to
+# the end of the file inside a comment.
+
+    def stored_tokens(self):
+        for i, tokens in enumerate(self.line_tokens):
+            line = i + 1
+            errors = self.line_errors[i]
+
+            for t, col in tokens:
+                if errors and errors[0][0] < col:
+                    break
+
+                yield lexeme(t, line, col)
+                pass
+
+            if errors:
+                self.line, self.pos = line, errors[0][0]
+                raise scan_error, errors[0][1]
+
+            pass
+
+        line = len(self.lines)
+
+        if self.comment_out[-1]:
+            self.line, self.pos = line, len(self.lines[-1]) + 1
+            raise scan_error, 'File ended inside comment'
+
+        eof = lexeme(tok_eof, line, len(self.lines[-1]) + 1)
+
+        while True:
+            yield eof
+
+        return
+
+
+    def current_locus(self):
+        return self.lines[self.line-1], self.pos
+
+
+    def source_line(self, n):
+        return self.lines[n-1] if n <= len(self.lines) else ''
+
+
+# tokens()-- Return a list of all lexemes.
+
+    def tokens(self):
+        result = []
+
+        for i, tokens in enumerate(self.line_tokens):
+            result.extend([ lexeme(t, i+1, col) for t, col in tokens ])
+            pass
+
+        return result
+
+
+# errors()-- Return a list of (line, column, message) for the bad
+# characters in the text.
+
+    def errors(self):
+        result = []
+
+        for i, errors in enumerate(self.line_errors):
+            if errors:
+                result.extend([ (i+1, col, msg) for col, msg in errors ])
+                pass
+
+            pass
+
+        return result
+
+
+    def source_text(self):
+        return '\n'.join(self.lines)
+
+
+# edit()-- Replace the text from (start_line, start_col) up to but not
+# including (end_line, end_col) with new_text.  Returns the changed
+# token span as (first, removed, inserted), meaning that 'removed'
+# tokens starting at index 'first' in the old token list were replaced
+# by the 'inserted' list of lexemes.  Tokens after the span are the
+# same, but move down by however many lines were added.  The token
+# stream is rewound.
+
+    def edit(self, start_line, start_col, end_line, end_col, new_text):
+        s = start_line - 1
+        e = end_line - 1
+
+        if not (0 <= s <= e < len(self.lines)):
+            raise ValueError, 'Edit outside of the text'
+
+        text = self.lines[s][:start_col-1] + new_text + \
+            self.lines[e][end_col-1:]
+
+        new_lines = text.split('\n')
+        delta = len(new_lines) - (e - s + 1)
+
+        first = sum([ len(t) for t in self.line_tokens[:s] ])
+
+# Old tokens of the damaged lines, with their lines relative to the
+# start of the edit.
+
+        old = []
+        for i in xrange(s, e+1):
+            old.extend([ (t, i-s, col) for t, col in self.line_tokens[i] ])
+            pass
+
+        old_state = self.comment_out[e]
+
+        self.lines[s:e+1] = new_lines
+        self.line_tokens[s:e+1] = [ None ] * len(new_lines)
+        self.line_errors[s:e+1] = [ None ] * len(new_lines)
+        self.comment_out[s:e+1] = [ False ] * len(new_lines)
+
+# Rescan the new lines, then keep going while the comment state coming
+# into a line differs from what it was before.
+
+        end = s + len(new_lines)
+        state = self.comment_out[s-1] if s > 0 else False
+
+        i = s
+        while i < len(self.lines):
+            if i >= end:
+                if state == old_state:
+                    break
+
+                old_state = self.comment_out[i]
+                old.extend([ (t, i-s-delta, col)
+                             for t, col in self.line_tokens[i] ])
+                pass
+
+            state = self.scan_line(i, state)
+            i += 1
+            pass
+
+        new = []
+        for k in xrange(s, i):
+            new.extend([ (t, k-s, col) for t, col in self.line_tokens[k] ])
+            pass
+
+# Trim the tokens that didn't change from both ends of the span.
+# Tokens at the end are compared relative to the end of the edit.
+
+        p = 0
+        limit = min(len(old), len(new))
+
+        while p < limit and old[p][0] is new[p][0] and \
+                old[p][1:] == new[p][1:]:
+            p += 1
+            pass
+
+        q = 0
+        limit -= p
+
+        while q < limit:
+            a = old[len(old) - q - 1]
+            b = new[len(new) - q - 1]
+
+            if a[0] is not b[0] or a[2] != b[2] or a[1] + delta != b[1]:
+                break
+
+            q += 1
+            pass
+
+        inserted = [ lexeme(t, line+s+1, col)
+                     for t, line, col in new[p:len(new)-q] ]
+
+        self.rewind()
+        return first + p, len(old) - p - q, inserted
+
+    pass
+
+
+
+
 def test_lexer():
     import sys
 
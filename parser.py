@@ -32,7 +32,13 @@ from ir_nodes import *
 from types import ListType
 
 import lexer, ssa, regalloc, codegen
-import sys
+import sys, re
+
+from collections import deque
+from StringIO import StringIO
+
+from cache import cache_key, dumps, loads
+from passes import run_pass, pass_timer
 
 
 class procedure:
@@ -44,6 +50,7 @@ class procedure:
                             variable('.retval', decl_type)
 
         self.done_label = get_temp_label()
+        self.assembly = None
         return
 
 
@@ -75,7 +82,7 @@ class procedure:
 
 class block:
     def __init__(self, parent):
-        self.namespace = {}
+        self.namespace = ordered_dict()
         self.body = []
         self.parent = parent
         return
@@ -203,6 +210,46 @@ class stmt_do:
 
 
 
+# Expression operator tables.  Binary operators map to their standard
+# C precedence level and the node that they build.  All of them are
+# left associative.  Prefix operators are level 2.
+
+binary_ops = {
+    tok_star:         (3, expr_mult),
+    tok_slash:        (3, expr_quotient),
+    tok_mod:          (3, expr_modulus),
+
+    tok_plus:         (4, expr_plus),
+    tok_minus:        (4, expr_minus),
+
+    tok_lshift:       (5, expr_lshift),
+    tok_rshift:       (5, expr_rshift),
+
+    tok_greater:      (6, expr_greater),
+    tok_greater_eq:   (6, expr_greater_equal),
+    tok_less:         (6, expr_less),
+    tok_less_eq:      (6, expr_less_equal),
+
+    tok_equal:        (7, expr_equal),
+    tok_not_equal:    (7, expr_not_equal),
+
+    tok_bit_and:      (8, expr_bitwise_and),
+    tok_caret:        (9, expr_bitwise_xor),
+    tok_bit_or:       (10, expr_bitwise_or),
+    tok_logical_and:  (11, expr_logical_and),
+    tok_logical_or:   (12, expr_logical_or),
+}
+
+prefix_ops = {
+    tok_plus:         expr_uplus,
+    tok_minus:        expr_uminus,
+    tok_star:         expr_load,
+    tok_logical_not:  expr_logical_not,
+    tok_bit_not:      expr_bitwise_not,
+}
+
+
+
 # Main parser
 
 class parser:
@@ -231,7 +278,7 @@ class parser:
 
 ### Expression parsers.  The numbers are the standard C precedence levels.
 
-    def parse_expr_1(self):
+    def parse_primary(self):
         t = self.lexer.next_token()
 
         if isinstance(t, word):
@@ -266,198 +313,71 @@ class parser:
         raise parse_error, 'Syntax error in expression'
 
 
-    def parse_expr_2(self):
-        t = self.lexer.next_token()
-
-        try:
-            cons = {
-                tok_plus: expr_uplus,  tok_minus:       expr_uminus,
-                tok_star: expr_load,   tok_logical_not: expr_logical_not,
-                tok_bit_not: expr_bitwise_not, }[t]
-
-            e = cons(self.parse_expr_2())
-
-        except KeyError:
-            self.lexer.push(t)
-            e = self.parse_expr_1()
-            pass
-
-        return e
+# parse_unary()-- Parse a primary with any number of prefix operators
+# in front of it.
 
-
-    def parse_expr_3(self):
-        a = self.parse_expr_2()
+    def parse_unary(self):
+        lexer = self.lexer
+        ops = []
 
         while True:
-            t = self.lexer.next_token()
-
-            try:
-                cons = {
-                    tok_star: expr_mult,  tok_slash: expr_quotient,
-                    tok_mod:  expr_modulus,  }[t]
-
-            except KeyError:
+            cons = prefix_ops.get(lexer.peek())
+            if cons is None:
                 break
 
-            a = cons(a, self.parse_expr_2())
+            lexer.next_token()
+            ops.append(cons)
             pass
 
-        self.lexer.push(t)
-        return a
-
-
-    def parse_expr_4(self):
-        a = self.parse_expr_3()
-
-        while True:
-            t = self.lexer.next_token()
-
-            try:
-                cons = {
-                    tok_plus: expr_plus,  tok_minus: expr_minus }[t]
-
-            except KeyError:
-                break
+        e = self.parse_primary()
 
-            a = cons(a, self.parse_expr_3())
+        while ops:
+            e = ops.pop()(e)
             pass
 
-        self.lexer.push(t)
-        return a
-
-
-    def parse_expr_5(self):
-        a = self.parse_expr_4()
-
-        while True:
-            t = self.lexer.next_token()
-
-            try:
-                cons = {
-                    tok_lshift: expr_lshift,  tok_rshift: expr_rshift }[t]
-
-            except KeyError:
-                break
-
-            a = cons(a, self.parse_expr_4())
-            pass
-
-        self.lexer.push(t)
-        return a
-
-
-    def parse_expr_6(self):
-        a = self.parse_expr_5()
-
-        while True:
-            t = self.lexer.next_token()
-
-            try:
-                cons = {
-                    tok_greater:     expr_greater,
-                    tok_greater_eq:  expr_greater_equal,
-                    tok_less:        expr_less,
-                    tok_less_eq:     expr_less_equal }[t]
-
-            except KeyError:
-                break
-
-            a = cons(a, self.parse_expr_5())
-            pass
+        return e
 
-        self.lexer.push(t)
-        return a
 
+# parse_binary()-- Precedence climbing over the binary operators.
+# Parses a unary expression followed by any operators whose level is
+# at most 'limit'.  The right operand of an operator at level n can
+# only contain operators that bind tighter, which makes everything
+# left associative.
 
-    def parse_expr_7(self):
-        a = self.parse_expr_6()
+    def parse_binary(self, limit):
+        peek = self.lexer.peek
+        a = self.parse_unary()
 
         while True:
-            t = self.lexer.next_token()
-
-            try:
-                cons = {
-                    tok_equal:      expr_equal,
-                    tok_not_equal:  expr_not_equal }[t]
-
-            except KeyError:
-                break
-
-            a = cons(a, self.parse_expr_6())
-            pass
+            op = binary_ops.get(peek())
+            if op is None or op[0] > limit:
+                return a
 
-        self.lexer.push(t)
-        return a
-
-
-    def parse_expr_8(self):
-        a = self.parse_expr_7()
-
-        while self.lexer.peek_token(tok_bit_and):
-            a = expr_bitwise_and(a, self.parse_expr_7())
+            self.lexer.next_token()
+            a = op[1](a, self.parse_binary(op[0] - 1))
             pass
 
-        return a
-
-
-    def parse_expr_9(self):
-        a = self.parse_expr_8()
-
-        while self.lexer.peek_token(tok_caret):
-            a = expr_bitwise_xor(a, self.parse_expr_8())
-            pass
-
-        return a
-
-
-    def parse_expr_10(self):
-        a = self.parse_expr_9()
-
-        while self.lexer.peek_token(tok_bit_or):
-            a = expr_bitwise_or(a, self.parse_expr_9())
-            pass
-
-        return a
-
-
-    def parse_expr_11(self):
-        a = self.parse_expr_10()
-
-        while self.lexer.peek_token(tok_logical_and):
-            a = expr_logical_and(a, self.parse_expr_10())
-            pass
-
-        return a
-
-
-    def parse_expr_12(self):
-        a = self.parse_expr_11()
-
-        while self.lexer.peek_token(tok_logical_or):
-            a = expr_logical_or(a, self.parse_expr_11())
-            pass
-
-        return a
+        return
 
 
-    def parse_expr_13(self):
-        e = self.parse_expr_12()
+    def parse_ternary(self):
+        e = self.parse_binary(12)
         if not self.lexer.peek_token(tok_question):
             return e
 
-        a = self.parse_expr_13()
+        a = self.parse_ternary()
 
         if not self.lexer.peek_token(tok_colon):
             raise parse_error, 'Missing : after ?'
 
-        b = self.parse_expr_13()
+        b = self.parse_ternary()
         return expr_ternary(e, a, b)
 
 
-    def parse_expr_14(self):
-        e = self.parse_expr_13()
+    def parse_assignment(self):
+        e = self.parse_ternary()
         while self.lexer.peek_token(tok_assign):
-            e = expr_assign(e, self.parse_expr_13())
+            e = expr_assign(e, self.parse_ternary())
             pass
 
         return e
@@ -466,7 +386,7 @@ class parser:
 # parse_expr()-- Parse an expression.
 
     def parse_expr(self):
-        e = self.parse_expr_14()
+        e = self.parse_assignment()
         return e.simplify()
 
 
@@ -768,19 +688,16 @@ class parser:
 # keyword statement.
 
     def parse_statement(self):
-        t = self.lexer.next_token()
+        t = self.lexer.peek()
         if t in self.parse_map:
+            self.lexer.next_token()
             return self.parse_map[t](t)
 
-        if isinstance(t, word):
-            u = self.lexer.next_token()
-            if u == tok_colon:
-                return self.define_label(t.name)
-
-            self.lexer.push(u)
-            pass
+        if isinstance(t, word) and self.lexer.peek(1) is tok_colon:
+            self.lexer.next_token()
+            self.lexer.next_token()
+            return self.define_label(t.name)
 
-        self.lexer.push(t)
         e = self.parse_expr()
 
         if self.lexer.next_token() != tok_semi:
@@ -838,10 +755,10 @@ class parser:
 
     def parse_dummy_arglist(self):
         if self.lexer.peek_token(tok_rparen):
-            return []
+            return {}
 
         n = 0
-        args = {}
+        args = ordered_dict()
 
         while True:
             t = self.lexer.next_token()
@@ -894,7 +811,7 @@ class parser:
         self.current_block = None
         self.current_proc.block = self.parse_block()
 
-        return
+        return self.current_proc
 
 
 # parse_global_var_decl()-- Parse a global variable declaration.
@@ -929,8 +846,103 @@ class parser:
         return
 
 
-# parse_global_var_or_proc()-- A global variable or a procedure.  This
-# is either
+# Each procedure has a fingerprint, which is a hash of its tokens and
+# of the declarations of the global variables that it names.  Comments
+# and layout don't change it, and neither do changes to other
+# procedures or to globals that it doesn't use.  'declarations' maps
+# the name of each global variable to the text of its declaration.
+
+# declared()-- Note the global variables declared by the tokens of a
+# declaration.
+
+    def declared(self, tokens):
+        text = None
+
+        for t in tokens:
+            if isinstance(t, word) and t.name not in self.declarations and \
+               isinstance(self.global_namespace.get(t.name), variable):
+
+                if text is None:
+                    text = token_text(tokens)
+                    pass
+
+                self.declarations[t.name] = text
+                pass
+
+            pass
+
+        return
+
+
+    def fingerprint(self, tokens):
+        names = set([ t.name for t in tokens
+                      if isinstance(t, word) and t.name in self.declarations ])
+
+        return cache_key('procedure', token_text(tokens),
+                         *[ self.declarations[n] for n in sorted(names) ])
+
+
+# cached_procedure()-- If the next declaration is a procedure whose
+# assembler is in the assembly cache, skip over it and return a
+# procedure that only has its assembler.  Returns None otherwise,
+# leaving the tokens to be parsed.
+
+    def cached_procedure(self):
+        tokens = []
+        depth = 0
+
+        for t in self.lexer.lookahead():
+            tokens.append(t)
+            n = len(tokens)
+
+            if (n == 1 and not isinstance(t, type_name)) or \
+               (n == 2 and not isinstance(t, word)) or \
+               (n == 3 and t is not tok_lparen) or t is tok_eof:
+                return None
+
+            if t is tok_lbrace:
+                depth += 1
+
+            elif t is tok_rbrace:
+                depth -= 1
+                if depth <= 0:
+                    break
+
+                pass
+
+            elif t is tok_semi and depth == 0:
+                return None
+
+            pass
+
+        if depth < 0 or tokens[1].name in self.global_namespace:
+            return None
+
+        fingerprint = self.fingerprint(tokens)
+
+        entry = self.asm_cache.get(assembly_key(fingerprint, self.ssa_opts),
+                                   loads)
+        if entry is None:
+            return None
+
+        self.lexer.skip(len(tokens))
+
+        p = procedure(tokens[1].name, type_node(tokens[0], 0))
+        self.global_namespace[p.name] = p
+
+        labels, insns = entry
+        base = label_base(p)
+        reserve_temp_labels(base + labels - 1)
+
+        p.fingerprint = fingerprint
+        p.labels = labels
+        p.assembly = [ relabel(insn, base) for insn in insns ]
+
+        return p
+
+
+# parse_global_var_or_proc()-- A global variable or a procedure.
+# Returns the procedure, or None for variables.  This is either
 #   [ qualifier ] <type> <name> [ = <expr> ] [ , <name> [ = expr ] ] ';'
 #   [ qualifier ] <type> <name> '(' [ arglist ] ')' '{' <proc body> '}'
 
@@ -984,10 +996,9 @@ class parser:
             raise parse_error, 'STATIC declaration not allowed for procedure'
 
         else:
-            self.parse_procedure(decl_type, name)
-            pass
+            return self.parse_procedure(decl_type, name.name)
 
-        return
+        return None
 
 
     def show(self):
@@ -1000,9 +1011,20 @@ class parser:
         return
 
 
-    def __init__(self, filename):
-        self.lexer = lexer.lexer(filename)
-        self.global_namespace = {}
+# If a lexer is given, tokens come from it instead, which lets an
+# incremental_lexer be parsed again after an edit.  With stream set,
+# nothing is parsed until the caller runs procedures().  With an
+# assembly cache, procedures that are in it under ssa_opts aren't
+# parsed at all.
+
+    def __init__(self, filename, source=None, lex=None, stream=False,
+                 asm_cache=None, ssa_opts=None):
+        self.lexer = lexer.lexer(filename, source=source) if lex is None else lex
+        self.asm_cache = asm_cache
+        self.ssa_opts = ssa_opts
+        self.context = compile_context()
+        self.global_namespace = ordered_dict()
+        self.declarations = {}
         self.current_block = None
 
         self.break_label = None
@@ -1021,15 +1043,63 @@ class parser:
             self.parse_map[t] = self.parse_type_decl
             pass
 
-        try:
-            while not self.lexer.peek_token(tok_eof):
-                self.parse_global_var_or_proc()
+        if not stream:
+            for p in self.procedures():
                 pass
 
             pass
 
-        except (lexer.lex_error, parse_error), msg:
-            self.error(msg)
+        return
+
+
+# procedures()-- Generator that parses the program one global
+# declaration at a time, yielding each procedure as soon as its body
+# is finished.  The parser's context is only current while it is
+# parsing, not while the caller has a procedure.
+#
+# 'labels' is the number of labels that parsing a procedure made.
+
+    def procedures(self):
+        while True:
+            enter_context(self.context)
+            self.lexer.record = []
+            first_label = self.context.labels
+            p = None
+
+            try:
+                if self.lexer.peek_token(tok_eof):
+                    break
+
+                if self.asm_cache is not None:
+                    p = self.cached_procedure()
+                    pass
+
+                if p is None:
+                    p = self.parse_global_var_or_proc()
+
+                    if p is None:
+                        self.declared(self.lexer.record)
+
+                    else:
+                        p.fingerprint = self.fingerprint(self.lexer.record)
+                        p.labels = self.context.labels - first_label
+                        pass
+
+                    pass
+
+            except (lexer.lex_error, parse_error), msg:
+                self.error(msg)
+
+            finally:
+                self.lexer.record = None
+                leave_context()
+                pass
+
+            if p is not None:
+                self.current_proc = None
+                yield p
+                pass
+
             pass
 
         return
@@ -1039,29 +1109,360 @@ class parser:
 
 
 
+# token_text()-- Return a string that spells out a list of tokens.
+
+def token_text(tokens):
+    result = []
+
+    for t in tokens:
+        if isinstance(t, constant):
+            result.append('$%r' % t.value)
+
+        else:
+            result.append(t.name)
+            pass
+
+        pass
+
+    return ' '.join(result)
+
+
+
+### Assembly cache
+
+# The assembler of each procedure can be cached on disk under the
+# procedure's fingerprint.  When the parser finds a procedure in the
+# cache, it skips over it without parsing it.  Labels made by the
+# parser are numbered over the whole program, so they are stored
+# relative to the procedure's done_label, which is the first label it
+# made, and are renumbered when an entry is used.  The debugging
+# output of the passes isn't cached, so the cache is only used
+# without debug.
+
+label_re = re.compile(r'\bL\.(\d+)\b')
+
+
+# relabel()-- Add an offset to the number of each parser label in an
+# assembler line.
+
+def relabel(insn, offset):
+    return label_re.sub(lambda m: 'L.%d' % (int(m.group(1)) + offset), insn)
+
+
+def label_base(v):
+    return int(v.done_label.name[2:])
+
+
+# assembly_key()-- Return the cache key of a procedure's assembler.
+# Besides the fingerprint, the key has the ssa.ssa_options that the
+# procedure is compiled with, None being the defaults.
+
+def assembly_key(fingerprint, ssa_opts=None):
+    if ssa_opts is None:
+        ssa_opts = ssa.ssa_options()
+        pass
+
+    return cache_key('assembly', fingerprint, *ssa_opts.key())
+
+
+# cached_assembly()-- Look up the assembler of a parsed procedure,
+# setting its 'assembly' if it is in the cache.
+
+def cached_assembly(v, cache, ssa_opts=None):
+    entry = cache.get(assembly_key(v.fingerprint, ssa_opts), loads)
+
+    if entry is not None:
+        base = label_base(v)
+        v.assembly = [ relabel(insn, base) for insn in entry[1] ]
+        pass
+
+    return
+
+
+def cache_assembly(cache, fingerprint, base, labels, insns, ssa_opts=None):
+    insns = [ relabel(insn, -base) for insn in insns ]
+    cache.put(assembly_key(fingerprint, ssa_opts), dumps((labels, insns)))
+    return
+
+
+# compile_procedure()-- Run a procedure through the back end, returning
+# a list of assembler lines.  The back end runs in a context of its
+# own, so procedures can be compiled in separate threads.  With debug
+# set, the passes print what they are doing.  Procedures that came
+# from the assembly cache aren't compiled again, and if a cache is
+# given, the assembler of the others is stored in it, debug or not.  If a
+# passes.pass_timer is given, the passes are measured into it.
+# 'ssa_opts' are the ssa.ssa_options to compile with, or None for the
+# defaults.
+
+def compile_procedure(v, debug=False, cache=None, timer=None, ssa_opts=None):
+    if v.assembly is not None:
+        return v.assembly
+
+    if cache is not None:
+        insns = compile_procedure(v, debug, None, timer, ssa_opts)
+        cache_assembly(cache, v.fingerprint, label_base(v), v.labels, insns,
+                       ssa_opts)
+        return insns
+
+    ctx = compile_context(v.name, debug, ssa_opts)
+    ctx.proc = v
+    ctx.timer = timer
+
+    enter_context(ctx)
+
+    if debug:
+        print 'Procedure'
+        pass
+
+    try:
+        graph = ssa.ssa_conversion(v)
+        regalloc.allocate(graph)
+        return run_pass('assemble', codegen.assemble, graph)
+
+    finally:
+        leave_context()
+        pass
+
+    return
+
+
 def generate_code(v):
-    print 'Procedure'
-    graph = ssa.ssa_conversion(v)
-    regalloc.allocate(graph)
-    codegen.generate_assembler(graph)
+    for insn in compile_procedure(v, True):
+        print insn
+        pass
+
+    return
+
+
+# stream_procedures()-- Generator for the procedures of a program,
+# which are parsed one at a time.  Once the caller asks for the next
+# procedure, the last one is released, leaving only its name and type
+# in the namespace.  Memory then tracks the largest procedure instead
+# of the size of the file.
+
+def stream_procedures(filename, source=None, asm_cache=None, ssa_opts=None):
+    p = parser(filename, source, stream=True, asm_cache=asm_cache,
+               ssa_opts=ssa_opts)
+
+    for v in p.procedures():
+        yield v
+
+        v.block = v.args = v.return_var = v.done_label = None
+        pass
+
     return
 
 
+# An output_buffer collects printed output.  Like a real file, and
+# unlike a plain StringIO, writing to it turns off the pending space
+# from a print statement that ended with a comma.
+
+class output_buffer(StringIO):
+    def write(self, s):
+        self.softspace = 0
+        StringIO.write(self, s)
+        return
+
+    pass
+
+
+# compile_shipped()-- Compile a pickled procedure in a worker
+# process.  Returns the procedure's name, anything the back end
+# printed, so that the parent can write it out in order, the assembler
+# and the pass timer's records, if timing.
+
+def compile_shipped(data, debug, timing=False, ssa_opts=None):
+    out = sys.stdout
+    sys.stdout = output_buffer()
+
+    try:
+        v = loads(data)
+        timer = pass_timer() if timing else None
+        insns = compile_procedure(v, debug, None, timer, ssa_opts)
+
+        return v.name, sys.stdout.getvalue(), insns, \
+            None if timer is None else timer.records
+
+    finally:
+        sys.stdout = out
+        pass
+
+    return
 
-import sys
 
-if len(sys.argv) < 2:
-    raise SystemExit, 'No filename'
+# A finished_result stands in for the result of a worker when a
+# procedure comes from the assembly cache.
 
-p = parser(sys.argv[1])
+class finished_result:
+    def __init__(self, value):
+        self.value = value
+        return
 
-for v in p.global_namespace.values():
-    if isinstance(v, procedure):
-        generate_code(v)
+    def ready(self):
+        return True
 
-    else:
-        pass    # Dump varable def
+    def get(self):
+        return self.value
 
     pass
 
 
+# compile_parallel()-- Generator that compiles the procedures of a
+# program in a pool of worker processes.  The parent parses, shipping
+# each procedure to a worker as soon as it is finished, and yields
+# (name, output, assembler) in source order.  Only a few procedures
+# per worker are in flight at once.  With an assembly cache, the
+# parent stores what the workers return, and with a pass timer, the
+# workers' measurements are added to it.  The workers compile with
+# ssa_opts.
+
+def compile_parallel(filename, jobs, source=None, debug=False, cache=None,
+                     timer=None, ssa_opts=None):
+    import multiprocessing
+
+    pool = multiprocessing.Pool(jobs)
+    pending = deque()
+
+    def finish():
+        r, store = pending.popleft()
+        name, out, insns, records = r.get()
+
+        if store is not None:
+            cache_assembly(*(store + (insns, ssa_opts)))
+            pass
+
+        if records is not None:
+            timer.extend(records)
+            pass
+
+        return name, out, insns
+
+    try:
+        for v in stream_procedures(filename, source, cache, ssa_opts):
+            if v.assembly is not None:
+                pending.append((finished_result((v.name, '', v.assembly,
+                                                 None)), None))
+
+            else:
+                r = pool.apply_async(compile_shipped, (dumps(v), debug,
+                                                       timer is not None,
+                                                       ssa_opts))
+                store = None if cache is None else \
+                        (cache, v.fingerprint, label_base(v), v.labels)
+
+                pending.append((r, store))
+                pass
+
+            while len(pending) > 4*jobs or (pending and pending[0][0].ready()):
+                yield finish()
+                pass
+
+            pass
+
+        while pending:
+            yield finish()
+            pass
+
+        pool.close()
+
+    finally:
+        pool.terminate()
+        pool.join()
+        pass
+
+    return
+
+
+# reserve_program_labels()-- After loading a program from the parse
+# cache, make sure that new temporary labels don't collide with the
+# ones in the program.
+
+def reserve_program_labels(namespace):
+    n = 0
+
+    for v in namespace.values():
+        if isinstance(v, procedure):
+            n = max(n, label_base(v) + v.labels - 1)
+            pass
+
+        pass
+
+    reserve_temp_labels(n)
+    return
+
+
+# load_program()-- Parse a program, returning its global namespace.
+# If a parse cache is given, the namespace is looked up by the hash of
+# the source text, skipping the lexer and parser entirely on a hit.
+# Procedures are then looked up in the assembly cache, if there is
+# one, as the parser would have.  The procedures that the parser found
+# there have no body, so the parse cache is keyed on ssa_opts too.
+
+def load_program(filename, source=None, cache=None, asm_cache=None,
+                 ssa_opts=None):
+    if cache is None:
+        return parser(filename, source, asm_cache=asm_cache,
+                      ssa_opts=ssa_opts).global_namespace
+
+    if source is None:
+        source = open(filename, 'r').read()
+
+    elif hasattr(source, 'read'):
+        source = source.read()
+        pass
+
+    if ssa_opts is None:
+        ssa_opts = ssa.ssa_options()
+        pass
+
+    key = cache_key('parse', source, *ssa_opts.key())
+
+    namespace = cache.get(key, loads)
+    if namespace is not None:
+        reserve_program_labels(namespace)
+
+        for v in namespace.values():
+            if asm_cache is not None and isinstance(v, procedure) and \
+               v.assembly is None:
+                cached_assembly(v, asm_cache, ssa_opts)
+                pass
+
+            pass
+
+        return namespace
+
+    namespace = parser(filename, source, asm_cache=asm_cache,
+                       ssa_opts=ssa_opts).global_namespace
+    cache.put(key, dumps(namespace))
+
+    return namespace
+
+
+# compile_source()-- Compile program text without going through the
+# filesystem.  The text can be a string or a file-like object.
+# Returns the assembler as a string.  See sse.compile() for the full
+# library interface.
+
+def compile_source(text, filename='<string>', cache=None):
+    namespace = load_program(filename, text, cache)
+    result = []
+
+    for v in namespace.values():
+        if isinstance(v, procedure):
+            result.extend(compile_procedure(v))
+            pass
+
+        pass
+
+    return ''.join([ insn + '\n' for insn in result ])
+
+
+# The command line is in sse.py.  Running it from there rather than
+# from __main__ also makes the classes in pickled programs belong to
+# the parser module.
+
+if __name__ == '__main__':
+    import sse
+    sse.main(sys.argv)
+    pass
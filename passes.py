@@ -0,0 +1,385 @@
+# (C) 2015 Andrew Vaught
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY
+# WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+# Pass manager.  A pipeline is a list of (name, function, requires,
+# preserves), run in order over the flow graph of a procedure.  Each
+# function is called with the first node of the graph.  If it returns
+# a node, that node is the new start of the graph, anything else is
+# ignored.  The pipelines themselves are ssa.ssa_passes and
+# regalloc.regalloc_passes, which can be edited to add, remove or
+# reorder passes.
+#
+# Analyses, like the dominators or liveness, annotate the nodes of the
+# graph.  Each is registered by name with analysis(), along with the
+# analyses that it needs.  Before a pass runs, the analyses that it
+# requires are computed, unless they are still valid from earlier.
+# Afterwards, the analyses that it doesn't preserve are invalidated,
+# along with anything that was computed from them.  A pass that
+# doesn't change the graph preserves all_analyses.  The valid
+# analyses of the procedure being compiled are kept in its compile
+# context.
+#
+# If the compile context has a pass_timer, each pass is measured: wall
+# time, growth of the process's peak memory and the number of nodes
+# and variables in the graph before and after.  Python 2 has no
+# tracemalloc, so the memory figure is the peak resident set size from
+# getrusage().  It only ever goes up, and the pass that pushed it up
+# is the one that used the memory.  An analysis that a pass requires
+# while it runs gets a record of its own, and its time and memory are
+# taken out of the pass's record, so that each is only counted once.
+
+import sys, time, resource
+
+from ir_nodes import ir_node, expr_assign, jump, label, swap, current_context
+
+
+# run_pass()-- Run a single pass over a graph, returning whatever the
+# pass returns.
+
+def run_pass(name, func, graph):
+    timer = current_context().timer
+
+    if timer is None:
+        return func(graph)
+
+    entered = time.time()
+    nodes, variables = graph_size(graph)
+    peak = peak_memory()
+
+    timer.nested.append([ 0.0, 0 ])
+    start = time.time()
+
+    try:
+        r = func(graph)
+
+    finally:
+        elapsed = time.time() - start
+        nested_time, nested_memory = timer.nested.pop()
+        pass
+
+    if isinstance(r, ir_node):
+        graph = r
+        pass
+
+    after = graph_size(graph)
+    after_peak = peak_memory()
+
+    timer.add(record(current_context().scope, name, elapsed - nested_time,
+                     after_peak - peak - nested_memory, after_peak, nodes,
+                     after[0], variables, after[1]))
+
+    if len(timer.nested) > 0:
+        outer = timer.nested[-1]
+        outer[0] += time.time() - entered
+        outer[1] += after_peak - peak
+        pass
+
+    return r
+
+
+# run_passes()-- Run a pipeline over a graph, returning the new start
+# of the graph.
+
+def run_passes(pipeline, graph):
+    for name, func, requires, preserves in pipeline:
+        for a in requires:
+            require(a, graph)
+            pass
+
+        r = run_pass(name, func, graph)
+
+        if isinstance(r, ir_node):
+            graph = r
+            pass
+
+        invalidate(preserves)
+        pass
+
+    return graph
+
+
+
+### Analyses
+
+all_analyses = '*'
+
+analyses = {}
+
+
+# analysis()-- Register an analysis.  The function is called with the
+# graph and what it returns is kept as the result of the analysis.
+
+def analysis(name, func, requires=()):
+    analyses[name] = func, requires
+    return
+
+
+# require()-- Compute an analysis of a graph if it isn't valid,
+# returning its result.
+
+def require(name, graph):
+    valid = current_context().analyses
+
+    if name not in valid:
+        func, requires = analyses[name]
+
+        for a in requires:
+            require(a, graph)
+            pass
+
+        valid[name] = run_pass(name, func, graph)
+        pass
+
+    return valid[name]
+
+
+# is_valid()-- Return True if an analysis is valid.  Passes that keep
+# an analysis up to date as they go check this.
+
+def is_valid(name):
+    return name in current_context().analyses
+
+
+# invalidate()-- Invalidate the analyses that aren't preserved, and
+# any that depend on them.
+
+def invalidate(preserves):
+    if preserves is all_analyses:
+        return
+
+    valid = current_context().analyses
+
+    for name in valid.keys():
+        if name not in preserves:
+            del valid[name]
+            pass
+
+        pass
+
+    changed = True
+
+    while changed:
+        changed = False
+
+        for name in valid.keys():
+            for a in analyses[name][1]:
+                if a not in valid and name in valid:
+                    del valid[name]
+                    changed = True
+                    pass
+
+                pass
+
+            pass
+
+        pass
+
+    return
+
+
+# peak_memory()-- Return the peak resident set size of the process in
+# kilobytes.
+
+def peak_memory():
+    kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    if sys.platform == 'darwin':
+        kb = kb >> 10
+        pass
+
+    return kb
+
+
+# graph_size()-- Return the number of nodes in a graph and the number
+# of distinct variables that they mention.
+
+def graph_size(graph):
+    nodes = 0
+    variables = {}
+
+    st = graph
+    while st is not None:
+        nodes += 1
+
+        if isinstance(st, expr_assign):
+            st.used_vars(variables)
+
+        elif isinstance(st, jump) and st.cond is not None:
+            st.cond.used_vars(variables)
+
+        elif isinstance(st, swap):
+            variables[st.a] = True
+            variables[st.b] = True
+
+        elif isinstance(st, label):
+            for p in st.phi_list:
+                variables[p.var if p.lhs is None else p.lhs] = True
+
+                for arg in p.args:
+                    variables[arg.var] = True
+                    pass
+
+                pass
+
+            pass
+
+        st = st.next
+        pass
+
+    return nodes, len(variables)
+
+
+
+# A record is the measurement of one pass over one procedure.
+# 'memory' is how much the pass raised the peak memory of the process
+# and 'peak' is the peak after the pass, both in kilobytes.
+
+class record:
+    def __init__(self, procedure, name, seconds, memory, peak, nodes_before,
+                 nodes_after, variables_before, variables_after):
+
+        self.procedure = procedure
+        self.name = name
+        self.seconds = seconds
+        self.memory = memory
+        self.peak = peak
+        self.nodes_before = nodes_before
+        self.nodes_after = nodes_after
+        self.variables_before = variables_before
+        self.variables_after = variables_after
+        return
+
+
+    def json(self):
+        return dict(self.__dict__)
+
+    pass
+
+
+# A pass_timer collects records.  Records made in worker processes
+# are sent back to the parent and merged with extend().  'nested' has
+# the time and memory of the passes run inside each pass that is
+# running.
+
+class pass_timer:
+    def __init__(self):
+        self.records = []
+        self.nested = []
+        return
+
+
+    def add(self, r):
+        self.records.append(r)
+        return
+
+
+    def extend(self, records):
+        self.records.extend(records)
+        return
+
+
+# summary()-- Return a list of per-pass totals, in the order that the
+# passes first ran.  Each is a dictionary, which also names the
+# procedure on which the pass took the longest.
+
+    def summary(self):
+        passes = {}
+        order = []
+
+        for r in self.records:
+            s = passes.get(r.name)
+
+            if s is None:
+                s = passes[r.name] = {
+                    'name': r.name, 'calls': 0, 'seconds': 0.0, 'memory': 0,
+                    'peak': 0, 'nodes_before': 0, 'nodes_after': 0,
+                    'variables_before': 0, 'variables_after': 0,
+                    'slowest': r.procedure, 'slowest_seconds': r.seconds }
+
+                order.append(s)
+                pass
+
+            s['calls'] += 1
+            s['seconds'] += r.seconds
+            s['memory'] += r.memory
+            s['peak'] = max(s['peak'], r.peak)
+
+            for k in [ 'nodes_before', 'nodes_after', 'variables_before',
+                       'variables_after' ]:
+                s[k] += getattr(r, k)
+                pass
+
+            if r.seconds > s['slowest_seconds']:
+                s['slowest'] = r.procedure
+                s['slowest_seconds'] = r.seconds
+                pass
+
+            pass
+
+        return order
+
+
+# report()-- Return the summary as a table.
+
+    def report(self):
+        summary = self.summary()
+        total = sum([ s['seconds'] for s in summary ]) or 1.0
+
+        lines = [ '%-20s %6s %10s %6s %9s %10s %17s %17s  %s'
+                  % ('Pass', 'Calls', 'Time (s)', '%', 'Mem (KB)',
+                     'Peak (KB)', 'Nodes in/out', 'Vars in/out',
+                     'Slowest') ]
+
+        for s in summary:
+            s = dict(s)
+            s['percent'] = 100.0 * s['seconds'] / total
+            s['nodes'] = '%d/%d' % (s['nodes_before'], s['nodes_after'])
+            s['variables'] = '%d/%d' % (s['variables_before'],
+                                        s['variables_after'])
+
+            lines.append('%(name)-20s %(calls)6d %(seconds)10.4f '
+                         '%(percent)6.1f %(memory)9d %(peak)10d %(nodes)17s '
+                         '%(variables)17s  %(slowest)s' % s)
+            pass
+
+        lines.append('%-20s %6s %10.4f' % ('Total', '',
+                                           sum([ s['seconds']
+                                                 for s in summary ])))
+
+        return '\n'.join(lines) + '\n'
+
+
+# json()-- Return the summary and the individual records as JSON
+# text.
+
+    def json(self):
+        import json
+
+        return json.dumps({ 'passes': self.summary(),
+                            'records': [ r.json() for r in self.records ] },
+                          indent=1, separators=(',', ': '),
+                          sort_keys=True) + '\n'
+
+    pass
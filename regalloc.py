@@ -28,13 +28,17 @@
 
 from ir_nodes import expr, swap, expr_assign, label, jump, show_flowgraph
 from ir_nodes import get_temp_label, invert_condition, integer_register
+from ir_nodes import get_memory_register, current_context
 
 from ir_nodes import reg_a, reg_b, reg_c, reg_d, reg_src, reg_dst, reg_base
 from ir_nodes import reg_8, reg_9, reg_10, reg_11, reg_12, reg_13, reg_14
 from ir_nodes import reg_15, xmm0, xmm1, xmm2, xmm3, xmm4, xmm5, xmm6, xmm7
 from ir_nodes import xmm8, xmm9, xmm10, xmm11, xmm12, xmm13, xmm14, xmm15
 
-from ir_nodes import memory, integer_subreg
+from ir_nodes import memory, integer_subreg, ordered_dict
+
+from passes import run_passes, analysis, require, all_analyses
+from cfg import dominator_postorder
 
 from kw import type_int8, type_int4, type_int2, type_int1, type_uint8
 from kw import type_uint4, type_uint2, type_uint1, type_float4, type_float8
@@ -63,71 +67,92 @@ def show_live(st, info):
     return
 
 
-# liveness()-- Compute the list of live variables for each node.
-# There are specific algorithms for ssa, but we use the more general
-# algorithm.  The algorithm works by first setting the live-list for
-# all nodes to the empty list. Variables that are used in a node must
-# be live in predecessor nodes, unless the predecessor sets that
-# variable.  Liveness flows from a use backwards.  Since nodes can be
-# reached by successors on different paths, more than one pass through
-# the flow graph is often necessary.
-
-# We implement this by a stack of 'walkers'.  Each walker is a
-# two-tuple of an ir_node and a list of live variables.  Walkers are
-# popped off the stack and add their live variables to the ir_node,
-# All nodes must be visited at least once.  After that, Walkers which
-# don't add any new information are dropped.  Walkers that do add new
-# information have any assignment variables removed and propagate
-# multiple new walkers to predecessor ir_nodes, When the stack is
-# empty, we're done.
+# block_liveness()-- Compute the sets of variables live into and out
+# of each block, as its live_in and live_out members.  There are
+# specific algorithms for ssa, but we use the more general algorithm,
+# which also works before the graph is in ssa form.  Each block gets
+# the set of variables that it uses before setting them and the set
+# that it sets.  The variables live out of a block are those live into
+# its successors, plus the arguments of phi functions of successors
+# that come from the block.  Liveness flows backwards, so the blocks
+# are visited in reverse order until nothing changes.
 
-# The live[] list indicates live variables immediately preceding the
-# statement that it lives on.
+def block_liveness(graph):
+    blocks = require('cfg', graph)
 
-def liveness(graph):
+    uses = []
+    defs = []
+    phi_out = []
 
-    tail = None
-    st = graph
-    while st is not None:
-        tail = st
-        st.live = {}
-        st.mark = False
-        st = st.next
-        pass
+    for b in blocks:
+        u, d = block_uses(b)
+        uses.append(u)
+        defs.append(d)
 
-    stack = [ (tail, [] ) ]
+        b.live_in = u
+        b.live_out = set()
+        phi_out.append(set())
+        pass
 
-    while len(stack) > 0:
-        st, info = stack.pop()
+    for b in blocks:
+        if isinstance(b.first, label):
+            for phi_node in b.first.phi_list:
+                for arg in phi_node.args:
+                    phi_out[arg.node.block.n].add(arg.var)
+                    pass
 
-        if isinstance(st, label):
-            liveness_label(st, info, stack)
+                pass
 
-        else:
-            liveness_regular(st, info, stack)
             pass
 
         pass
 
-# Remove the mark member
+    changed = True
+
+    while changed:
+        changed = False
+
+        for b in reversed(blocks):
+            live = set(phi_out[b.n])
+
+            for s in b.successors:
+                live |= s.live_in
+                pass
+
+            if live != b.live_out:
+                b.live_out = live
+                b.live_in = uses[b.n] | (live - defs[b.n])
+                changed = True
+                pass
+
+            pass
 
-    st = graph
-    while st is not None:
-        st.live = st.live.keys()
-        del st.mark
-        st = st.next
         pass
 
     return
 
 
-# liveness_regular()-- process a non-label node for liveness.
+# liveness()-- Compute the list of live variables for each node, by a
+# walk up each block from the variables live out of it.
 
-def liveness_regular(st, info, stack):
+# The live[] list indicates live variables immediately preceding the
+# statement that it lives on.  For a label with phi functions, it
+# doesn't have the variables that the phi functions set, but does have
+# the arguments that come from the node before the label.
 
-# Add used-variables to the live list.
+def liveness(graph):
+    for b in require('cfg', graph):
+        node_liveness(b)
+        pass
+
+    return
 
-    used = {}
+
+# used_set()-- Return the variables used by a node, in a dictionary
+# that remembers their order.
+
+def used_set(st):
+    used = ordered_dict()
 
     if isinstance(st, expr_assign):
         st.value.used_vars(used)
@@ -136,94 +161,86 @@ def liveness_regular(st, info, stack):
         st.cond.used_vars(used)
         pass
 
-    for v in used.keys():
-        if v not in info:
-            info.append(v)
-            pass
-
-        pass
-
-# Remove set variables from the live list
+    return used
 
-    if isinstance(st, expr_assign):
-        if st.var in info:
-            info.remove(st.var)
-            pass
 
-        pass
+# block_uses()-- Return the set of variables that a block uses before
+# setting them and the set of variables that it sets.  The phi
+# functions of a label set their variables on entry to the block.
 
-# Update the current node
+def block_uses(b):
+    uses = set()
+    defs = set()
 
-    changed = False
+    for st in reversed(b.nodes()):
+        if isinstance(st, label):
+            for phi_node in st.phi_list:
+                uses.discard(phi_node.lhs)
+                defs.add(phi_node.lhs)
+                pass
 
-    for v in info:
-        if v in st.live:
             continue
 
-        st.live[v] = True
-        changed = True
-        pass
-
-    if changed or (not st.mark):
-        st.mark = True
-
-        for st in st.predecessor():
-            stack.append((st, info[:]))
+        if isinstance(st, expr_assign):
+            uses.discard(st.var)
+            defs.add(st.var)
             pass
 
+        uses.update(used_set(st))
         pass
 
-    return
+    return uses, defs
 
 
-# liveness_label()-- Process liveness for a phi node.  Very different
-# than other nodes.  We don't worry about stopping walkers, just
-# spawning them.
+# node_liveness()-- Walk up a block from its live-out variables,
+# setting the live[] list of each node.  The variables live out of the
+# block are listed by name, so that the lists come out the same from
+# one run to the next.
 
-def liveness_label(st, info, stack):
+def node_liveness(b):
+    info = sorted(b.live_out, key=lambda v: v.name)
+    present = set(info)
 
-    for phi_node in st.phi_list:
-        v = phi_node.lhs
-        if v in info:
-            info.remove(v)
-            pass
+    for st in reversed(b.nodes()):
+        if isinstance(st, label):
+            for phi_node in st.phi_list:
+                v = phi_node.lhs
+                if v in present:
+                    info.remove(v)
+                    present.discard(v)
+                    pass
 
-        pass
+                pass
 
-    for v in info:
-        if v not in st.live:
-            st.live[v] = True
-            pass
+            live = info[:]
 
-        pass        
+            for phi_node in st.phi_list:
+                for arg in phi_node.args:
+                    if arg.node is st.prev and arg.var not in live:
+                        live.append(arg.var)
+                        pass
 
-    pred = st.predecessor()
+                    pass
 
-    for phi_node in st.phi_list:
-        for arg in phi_node.args:
-            if arg.node is st.prev:
-                st.live[arg.var] = True
                 pass
 
-            new_info = info[:]
-            if arg.var not in new_info:
-                new_info.append(arg.var)
-                pass
+            st.live = live
+            continue
 
-            stack.append((arg.node, new_info))
+        if isinstance(st, expr_assign) and st.var in present:
+            info.remove(st.var)
+            present.discard(st.var)
+            pass
 
-            if arg.node in pred:
-                pred.remove(arg.node)
+        for v in used_set(st):
+            if v not in present:
+                info.append(v)
+                present.add(v)
                 pass
 
             pass
 
-        pass
-
-# Add predecessors that aren't phi functions
-
-    for st in pred:
-        stack.append((st, info))
+        st.live = info[:]
         pass
 
     return
@@ -237,7 +254,7 @@ def last_use(graph):
 
     st = graph
     while st is not None:
-        used = {}
+        used = ordered_dict()
 
         if isinstance(st, expr_assign):
             st.value.used_vars(used)
@@ -275,8 +292,18 @@ def last_use(graph):
 # interferes[] list on each variable.  Returns a list of live
 # variables.
 
+# A variable that is assigned and never used isn't live anywhere, but
+# the assignment still writes its register, so it interferes with the
+# variables live after the assignment.  Without that, the assignment
+# could land on a register that is in use.  The same goes for a phi
+# function whose result is dead: phi_merge() still moves into its
+# register on each entry to the label, so it interferes with what is
+# live after the label and with the other dead results there.  The
+# phi arguments needn't interfere, as the moves on an edge read all of
+# them before writing.
+
 def interference_graph(graph):
-    result = {}
+    result = ordered_dict()
 
     st = graph
     while st is not None:
@@ -290,7 +317,7 @@ def interference_graph(graph):
     result = result.keys()
 
     for v in result:
-        v.interference = {}
+        v.interference = ordered_dict()
         pass
 
     st = graph
@@ -307,7 +334,50 @@ def interference_graph(graph):
         st = st.next
         pass
 
-    for v in result:
+    known = set(result)
+    dead = []
+
+    def add_dead(v, live):
+        if v not in known:
+            known.add(v)
+            v.interference = ordered_dict()
+            dead.append(v)
+            pass
+
+        for a in live:
+            if a is not v:
+                v.interference[a] = True
+                a.interference[v] = True
+                pass
+
+            pass
+
+        return
+
+    st = graph
+    while st is not None:
+        if isinstance(st, expr_assign) and st.next is not None and \
+               st.var not in st.next.live:
+            add_dead(st.var, st.next.live)
+
+        elif isinstance(st, label) and st.next is not None:
+            after = st.next.live
+            dead_phis = [ p.lhs for p in st.phi_list if p.lhs not in after ]
+
+            for v in dead_phis:
+                add_dead(v, [])
+                pass
+
+            for v in dead_phis:
+                add_dead(v, after + dead_phis)
+                pass
+
+            pass
+
+        st = st.next
+        pass
+
+    for v in result + dead:
         v.interference = v.interference.keys()
         pass
 
@@ -315,7 +385,7 @@ def interference_graph(graph):
 
 
 def show_interference(graph):
-    variables = {}
+    variables = ordered_dict()
     st = graph
 
     while st is not None:
@@ -340,21 +410,20 @@ def show_interference(graph):
 
 # var_dominance()-- Create a list of variable dominance order.  This
 # means traversing the dominance tree, adding variable definitions in
-# post-order.  This forms a perfect elimination order for coloring,
+# post-order.  This forms a perfect elimination order for coloring.
 
-def var_dominance(st):
+def var_dominance(graph):
     result = []
 
-    for child in st.children:
-        result += var_dominance(child)
-        pass
+    for st in dominator_postorder(graph):
+        if isinstance(st, expr_assign):
+            result.append(st.var)
 
-    if isinstance(st, expr_assign):
-        result.append(st.var)
+        elif isinstance(st, label):
+            for p in st.phi_list:
+                result.append(p.lhs)
+                pass
 
-    elif isinstance(st, label):
-        for p in st.phi_list:
-            result.append(p.lhs)
             pass
 
         pass
@@ -366,6 +435,8 @@ def var_dominance(st):
 # memory registers not re-used like machine registers are.
 
 def pick_register(v):
+    ctx = current_context()
+    present = ctx.present
     bt = v.type.basic_type
 
     if bt in [ type_int8, type_int4, type_int2, type_int1,
@@ -384,8 +455,11 @@ def pick_register(v):
         raise RuntimeError, 'pick_register(): Unknown type'
 
     for w in v.interference:
-        print w.name
-        if w.present and (not isinstance(w.register, memory)):
+        if ctx.debug:
+            print w.name
+            pass
+
+        if present.get(w) and (not isinstance(w.register, memory)):
             r = w.register
 
             if isinstance(r, integer_subreg):
@@ -415,8 +489,9 @@ def color_graph(graph):
     peo = var_dominance(graph)
 #    print 'Elimination order', [ v.name for v in peo ]
 
+    present = current_context().present
+
     for v in peo:
-        v.present = False
         if not hasattr(v, 'interference'):
             v.interference = []
             pass
@@ -428,13 +503,10 @@ def color_graph(graph):
     for v in peo:
         v.register = pick_register(v)
 #        print 'reg', v.name, '->', v.register 
-        v.present = True
-        pass
-
-    for v in peo:
-        del v.present
+        present[v] = True
         pass
 
+    present.clear()
     return
 
 
@@ -462,7 +534,7 @@ def phi_merge(graph):
 # along to merge_single_entry().
 
 def merge_label(st):
-    entry = {}
+    entry = ordered_dict()
 
     for phi in st.phi_list:
         for arg in phi.args:
@@ -495,9 +567,12 @@ def merge_label(st):
 
 def merge_single_entry(st, entry, plist):
 
-    print '-------'
-    for a, b in plist:
-        print '%s (%s) -> %s (%s)' % (a.name, a.register, b.name, b.register)
+    if current_context().debug:
+        print '-------'
+        for a, b in plist:
+            print '%s (%s) -> %s (%s)' % (a.name, a.register, b.name, b.register)
+            pass
+
         pass
 
     instructions = merge_instructions(plist)
@@ -537,14 +612,18 @@ def merge_single_entry(st, entry, plist):
 # L2:
 
         new_label = get_temp_label()
-        new_label.insert_next(entry)
+        new_label.defined = True
 
-        jump(entry.label).inset_next(entry)
+        entry.insert_next(new_label)
+        entry.insert_next(jump(entry.label))
 
-        for n in instructions:
+        for n in reversed(instructions):
             entry.insert_next(n)
             pass
 
+        entry.label.jumps.remove(entry)
+        new_label.jumps.append(entry)
+
         entry.label = new_label
         entry.cond = invert_condition(entry.cond)
         pass
@@ -556,11 +635,42 @@ def merge_single_entry(st, entry, plist):
 # 'from' vector and a 'to' vector.  We look at the register entries
 # but generate instructions in terms of variables.
 
+# The assignments happen all at once.  One whose destination register
+# isn't the source of another can be done as a plain move, and doing it
+# can free up others.  What is left after that are cycles, where each
+# destination is the source of another, which are done by swapping.
+
 def merge_instructions(plist):
     if len(plist) == 1:
         a, b = plist[0]
         return [ expr_assign(b, a) ]
 
+    moves = []
+    changed = True
+
+    while changed:
+        changed = False
+
+        for a, b in plist:
+            sources = [ c.register for c, d in plist if c is not a ]
+
+            if b.register not in sources:
+                moves.append(expr_assign(b, a))
+                plist = [ t for t in plist if t != (a, b) ]
+                changed = True
+                break
+
+            pass
+
+        pass
+
+    return moves + merge_swaps(plist)
+
+
+# merge_swaps()-- Do assignments that permute registers with a
+# sequence of swaps.
+
+def merge_swaps(plist):
     v_from = []
     v_to = []
 
@@ -607,13 +717,36 @@ def merge_instructions(plist):
 # allocate()-- Allocate registes
 
 def allocate(graph):
-    liveness(graph)
-    last_use(graph)
-    interference_graph(graph) 
-    show_flowgraph(graph)
-#    show_interference(graph)
-    color_graph(graph)
-    phi_merge(graph)
+    run_passes(regalloc_passes, graph)
+    return
+
+
+# show_graph()-- Show the flow graph with its liveness information, if
+# debugging.
 
+def show_graph(graph):
+    if current_context().debug:
+        show_flowgraph(graph)
+        pass
+
+#    show_interference(graph)
     return
 
+
+# The analyses computed here, and the passes that allocate() runs.
+# Coloring walks the dominator tree left by the ssa conversion.  The
+# last uses are kept on the nodes for the code generator, which runs
+# after phi_merge() has invalidated everything.
+
+analysis('block_liveness', block_liveness,     [ 'cfg' ])
+analysis('liveness',       liveness,           [ 'block_liveness' ])
+analysis('interference',   interference_graph, [ 'liveness' ])
+
+regalloc_passes = [
+    ('last_use',       last_use,   [ 'liveness' ], all_analyses),
+    ('show_flowgraph', show_graph, [ 'liveness', 'interference' ],
+                                   all_analyses),
+    ('color_graph',    color_graph, [ 'dominance_tree', 'interference' ],
+                                    all_analyses),
+    ('phi_merge',      phi_merge,  [], []) ]
+
@@ -0,0 +1,460 @@
+#!/usr/bin/env python
+
+# (C) 2015 Andrew Vaught
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY
+# WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+# Compile server.  This keeps a compiler with its tables built resident
+# and compiles programs for clients that connect over a Unix domain
+# socket, so that they don't pay for starting Python and loading the
+# compiler.  Each connection is served in its own thread, since the
+# compiler's state is kept per thread.
+#
+# Requests are the messages of client.py:
+#
+#     { 'command': 'run', 'argv': [...], 'cwd': dir }
+#         Run the command line in argv.  The reply has the 'stdout'
+#         and 'stderr' that sse.py would have written and its exit
+#         'status'.
+#
+#     { 'command': 'compile', 'source': text, 'options': {...} }
+#         Compile program text, with the keyword arguments of
+#         sse.options that are in request_options.  The reply has the
+#         'assembly', a list of [name, assembler lines] 'procedures'
+#         and, for a program with an error, an 'error' that describes
+#         it.
+#
+#     { 'command': 'stats' }
+#         Return the server's statistics.
+#
+#     { 'command': 'shutdown' }
+#         Stop the server.
+#
+# A reply with a 'failure' means that the request itself was bad, or
+# that the server failed while handling it.  The server never forks,
+# since forking a process with running threads isn't safe, so it
+# compiles with one process whatever the client asks for.
+
+import os, sys, time, socket, threading, traceback
+import SocketServer
+
+from collections import deque
+
+import sse
+import parser
+import ir_nodes
+import codegen
+
+from lexer import compile_error
+from client import default_socket, send_message, recv_message, request
+
+
+# Program compiled when the server starts, so that everything the
+# compiler builds on first use is built before the first request.
+
+warm_program = '''
+int4 warm(int4 n) {
+    int4 c, d;
+
+    c = 10;
+    d = 0;
+    while(c > 0) {
+        d = d + c;
+        c = c - 1;
+    }
+
+    return d;
+}
+'''
+
+
+# The compiler prints what it writes, so sys.stdout and sys.stderr are
+# replaced with a thread_output.  Threads that are serving a request
+# write to that request's buffers, other threads write to the real
+# file.  The print statement keeps its softspace flag on the file, so
+# it has to be per thread as well.
+
+class thread_output(object):
+    def __init__(self, f):
+        self.f = f
+        self.local = threading.local()
+        return
+
+    def target(self):
+        b = getattr(self.local, 'buffer', None)
+        return self.f if b is None else b
+
+    def write(self, s):
+        self.target().write(s)
+        return
+
+    def writelines(self, lines):
+        self.target().writelines(lines)
+        return
+
+    def flush(self):
+        self.target().flush()
+        return
+
+    def get_softspace(self):
+        return getattr(self.target(), 'softspace', 0)
+
+    def set_softspace(self, value):
+        self.target().softspace = value
+        return
+
+    softspace = property(get_softspace, set_softspace)
+
+
+# capture()-- Start collecting the current thread's output.
+
+    def capture(self):
+        self.local.buffer = parser.output_buffer()
+        return
+
+
+# release()-- Stop collecting the current thread's output and return
+# it.
+
+    def release(self):
+        b = self.local.buffer
+        self.local.buffer = None
+        return b.getvalue()
+
+    pass
+
+
+# Request statistics.  The finishing times and latencies of the last
+# 'window' requests are kept.  The rate is over the last 'period'
+# seconds and the percentiles are over the whole window.
+
+class server_stats:
+    def __init__(self, window=10000, period=60.0):
+        self.lock = threading.Lock()
+        self.start = time.time()
+        self.period = period
+        self.requests = 0
+        self.errors = 0
+        self.recent = deque(maxlen=window)
+        return
+
+
+    def record(self, latency, error):
+        self.lock.acquire()
+
+        try:
+            self.requests += 1
+            self.errors += error
+            self.recent.append((time.time(), latency))
+
+        finally:
+            self.lock.release()
+            pass
+
+        return
+
+
+# percentile()-- Return the p'th percentile of a sorted list.
+
+    def percentile(self, values, p):
+        if len(values) == 0:
+            return 0.0
+
+        i = int(round(p / 100.0 * (len(values) - 1)))
+        return values[i]
+
+
+    def report(self):
+        self.lock.acquire()
+
+        try:
+            recent = list(self.recent)
+            requests, errors = self.requests, self.errors
+
+        finally:
+            self.lock.release()
+            pass
+
+        now = time.time()
+        uptime = now - self.start
+        period = min(self.period, uptime)
+
+        count = len([ t for t, latency in recent if t >= now - period ])
+        latencies = sorted([ latency for t, latency in recent ])
+
+        return { 'requests': requests, 'errors': errors, 'uptime': uptime,
+                 'requests_per_second': count / period,
+                 'p50_ms': 1000 * self.percentile(latencies, 50),
+                 'p99_ms': 1000 * self.percentile(latencies, 99) }
+
+
+    def __str__(self):
+        return ('%(requests)d requests (%(errors)d failed) in %(uptime).1fs, '
+                '%(requests_per_second).1f requests/s, '
+                'p50 %(p50_ms).2fms, p99 %(p99_ms).2fms' % self.report())
+
+    pass
+
+
+
+### Requests
+
+# run_command()-- Run a command line as sse.py would.
+
+def run_command(msg):
+    sys.stdout.capture()
+    sys.stderr.capture()
+
+    status = 0
+
+    try:
+        sse.main(['sse'] + msg['argv'][1:], msg['cwd'])
+
+    except SystemExit, e:
+        if e.code is None:
+            status = 0
+
+        elif isinstance(e.code, int):
+            status = e.code
+
+        else:
+            sys.stderr.write('%s\n' % e.code)
+            status = 1
+            pass
+
+        pass
+
+    except Exception:
+        traceback.print_exc()
+        status = 1
+        pass
+
+    out = sys.stdout.release()
+    err = sys.stderr.release()
+
+    return { 'stdout': out, 'stderr': err, 'status': status }
+
+
+# The options that a compile request may give, with their types.
+# The caches are the server's business, not the client's, and jobs is
+# accepted but always taken as 1.
+
+request_options = {
+    'filename': basestring,
+    'stream':   bool,
+    'jobs':     int,
+
+    'ssa_form':         basestring,
+    'phi_engine':       basestring,
+    'dominator_engine': basestring,
+    'iterative_limit':  int,
+}
+
+
+# compile_request()-- Compile program text.  Bad options, including
+# settings that the back end doesn't know, get a failure reply.
+
+def compile_request(msg):
+    options = msg.get('options', {})
+
+    if not isinstance(options, dict):
+        return { 'failure': 'Compile options must be a dictionary' }
+
+    for k, v in options.items():
+        t = request_options.get(k)
+
+        if t is None:
+            return { 'failure': "Unknown compile option '%s'" % k }
+
+        if not isinstance(v, t):
+            return { 'failure': "Bad value %s for compile option '%s'"
+                     % (v, k) }
+
+        pass
+
+    opts = sse.options(**dict([ (str(k), v) for k, v in options.items() ]))
+
+    opts.filename = opts.filename.encode('utf-8')
+    opts.debug = False
+    opts.jobs = 1
+
+    try:
+        r = sse.compile(msg['source'].encode('utf-8'), opts)
+
+    except ValueError, e:
+        return { 'failure': str(e) }
+
+    except compile_error, e:
+        return { 'error': { 'filename': e.filename, 'line': e.line,
+                            'col': e.col, 'msg': e.msg, 'message': str(e) } }
+
+    return { 'assembly': r.assembly, 'procedures': r.procedures }
+
+
+class request_handler(SocketServer.StreamRequestHandler):
+    def handle(self):
+        msg = recv_message(self.rfile)
+        if msg is None:
+            return
+
+        start = time.time()
+        command = msg.get('command')
+        error = False
+
+        try:
+            if command == 'run':
+                reply = run_command(msg)
+                error = reply['status'] != 0
+
+            elif command == 'compile':
+                reply = compile_request(msg)
+                error = 'error' in reply
+
+            elif command == 'stats':
+                send_message(self.wfile, self.server.stats.report())
+                return
+
+            elif command == 'shutdown':
+                send_message(self.wfile, {})
+                threading.Thread(target=self.server.shutdown).start()
+                return
+
+            else:
+                reply = { 'failure': 'Unknown command %r' % command }
+                pass
+
+        except Exception:
+            reply = { 'failure': traceback.format_exc() }
+            pass
+
+        if 'failure' in reply:
+            error = True
+            pass
+
+        self.server.stats.record(time.time() - start, error)
+        send_message(self.wfile, reply)
+        return
+
+    pass
+
+
+class compile_server(SocketServer.ThreadingMixIn,
+                     SocketServer.UnixStreamServer):
+
+    daemon_threads = True
+
+    def __init__(self, path):
+        SocketServer.UnixStreamServer.__init__(self, path, request_handler)
+        self.stats = server_stats()
+        return
+
+    pass
+
+
+# warm_up()-- Build the compiler's tables.
+
+def warm_up():
+    ir_nodes.init_btm()
+    codegen.load_sequences()
+    sse.compile(warm_program)
+    return
+
+
+# remove_stale_socket()-- Remove a socket left behind by a server that
+# is no longer running.  Raises SystemExit if a server is answering on
+# it.
+
+def remove_stale_socket(path):
+    if not os.path.exists(path):
+        return
+
+    try:
+        request({ 'command': 'stats' }, path)
+
+    except (socket.error, ValueError):
+        os.remove(path)
+        return
+
+    raise SystemExit, 'A server is already running on %s' % path
+
+
+def main(argv):
+    import argparse, signal
+
+    ap = argparse.ArgumentParser(prog=argv[0],
+                                 description='SSE-C compile server')
+
+    ap.add_argument('--socket', metavar='PATH', default=default_socket(),
+                    help='Listen on PATH instead of $SSE_SOCKET or %s'
+                    % default_socket())
+    ap.add_argument('--stats-interval', metavar='SECONDS', type=float,
+                    default=0, help='Report statistics on stderr this often')
+
+    args = ap.parse_args(argv[1:])
+
+    warm_up()
+
+    sys.stdout = thread_output(sys.stdout)
+    sys.stderr = thread_output(sys.stderr)
+
+    remove_stale_socket(args.socket)
+    server = compile_server(args.socket)
+
+    def stop(signum, frame):
+        threading.Thread(target=server.shutdown).start()
+        return
+
+    signal.signal(signal.SIGTERM, stop)
+
+    if args.stats_interval > 0:
+        def reporter():
+            while True:
+                time.sleep(args.stats_interval)
+                sys.stderr.write('%s\n' % server.stats)
+                pass
+
+            return
+
+        t = threading.Thread(target=reporter)
+        t.daemon = True
+        t.start()
+        pass
+
+    sys.stderr.write('Serving on %s\n' % args.socket)
+
+    try:
+        server.serve_forever()
+
+    except KeyboardInterrupt:
+        pass
+
+    server.server_close()
+    os.remove(args.socket)
+
+    sys.stderr.write('%s\n' % server.stats)
+    return
+
+
+if __name__ == '__main__':
+    main(sys.argv)
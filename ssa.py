@@ -25,10 +25,16 @@
 # POSSIBILITY OF SUCH DAMAGE.
 
 
+import heapq
+
 from ir_nodes import jump, label, ir_node, expr_assign, expr_binary
 from ir_nodes import expr, phi, phi_arg, constant, variable, expr_ternary
 from ir_nodes import expr_compare, expr_unary, expr_intrinsic, show_flowgraph
-from ir_nodes import invert_condition
+from ir_nodes import invert_condition, current_context, ordered_dict
+
+from passes import run_pass, run_passes, analysis, require, is_valid
+from cfg import insert_node, number_dominator_tree, dominator_preorder
+from regalloc import block_uses
 
 ### Subroutines for converting the flow graph to SSA form.
 
@@ -196,9 +202,42 @@ def remove_dead_code(st):
 # get_temp_var()-- Get a temporary variable of the same type as the
 # passed one.
 
-def get_temp_var(var_type, index=[0]):
-    index[0] += 1
-    return variable('T.%d' % index[0], var_type)
+def get_temp_var(var_type):
+    return current_context().temp_var(var_type)
+
+
+# insert_before()-- Insert a new node before a node that isn't a
+# label, keeping the blocks and dominator analyses up to date if they
+# are valid.  The new node goes in the old node's block, so the
+# dominators and frontiers of the blocks don't change.  The old node's
+# only predecessor is now the new node, so the new node takes its
+# place in the dominator tree of the nodes, with the old node as its
+# only child.
+
+def insert_before(st, n):
+    if is_valid('cfg'):
+        insert_node(st, n)
+
+    else:
+        st.insert_prev(n)
+        pass
+
+    if is_valid('dominators'):
+        n.dom = st.dom
+        st.dom = n
+        pass
+
+    if is_valid('dominance_tree'):
+        n.children = [ st ]
+
+        if n.dom is not None:
+            c = n.dom.children
+            c[c.index(st)] = n
+            pass
+
+        pass
+
+    return
 
 
 # ssa_expr0()-- Recursive function for expanding an expression node
@@ -216,13 +255,13 @@ def ssa_expr0(e, st):
 
         if not isinstance(e.a, ( constant, variable )):
             t = get_temp_var(e.a.type)
-            st.insert_prev(expr_assign(t, e.a))
+            insert_before(st, expr_assign(t, e.a))
             e.a = t
             pass
 
         if not isinstance(e.b, ( constant, variable )):
             t = get_temp_var(e.b.type)
-            st.insert_prev(expr_assign(t, e.b))
+            insert_before(st, expr_assign(t, e.b))
             e.b = t
             pass
 
@@ -241,7 +280,7 @@ def ssa_expr0(e, st):
 
         if not isinstance(e.arg, ( constant, variable )):
             t = get_temp_var(e.arg.type)
-            st.insert_prev(expr_assign(t, e.arg))
+            insert_before(st, expr_assign(t, e.arg))
             e.arg = t
             pass
 
@@ -282,231 +321,587 @@ def ssa_expr(st):
 # to n.  The algorithm is given by "A Fast Algorithm for Finding
 # Dominators in a Flowgraph", by Lengauer and Tarjan in "ACM
 # Transactions on Programming Languages and Systems" v1 n1 July 1979,
-# p121-141.
+# p121-141.  This is the sophisticated version of the algorithm,
+# whose LINK keeps the trees of the forest balanced, so that the whole
+# computation takes O(E alpha(E, V)) time.  With only path compression
+# it takes O(E log V).
 #
 # Our implementation is a class that takes the input flowgraph as
-# input, creates a bunch of its own auxiliarly data structures,
-# determines the tree and then adds members to the flowgraph nodes.
-# Arrays in the original paper are implemented as temporary members in
-# the original nodes.  After exit, the auxiliary structures vanish
-# leaving the augmented flowgraph.
+# input, determines the tree and then sets the 'dom' member of each
+# node.  The arrays of the original paper are lists indexed by depth
+# first number, the side tables being dropped when the class is done.
+# Only the node number translation needs the nodes themselves, through
+# their 'n' members, which must be numbered densely from zero.  The
+# nodes are anything that have a successor() method, which the compiler
+# uses for basic blocks.
 
 class find_dominators:
-    def __init__(self, graph):
+    def __init__(self, graph, count):
         if graph is None:
             return
 
-        self.graph = graph
+# The number table translates a node's 'n' to its depth first number,
+# which is zero for a node that hasn't been reached.  The vertex list
+# translates back, 1-based.
 
-        st = graph
-        while st is not None:
-            st.bucket = []
-            st.pred = []
-            st.semi = 0
-            st.ancestor = None
-            st.d_label = st
-            st.size = 1
-            st.child = 0
-
-            st = st.next
-            pass
-
-# The vertex dictionary translates vertex number to the vertex, 1-based.
-
-        self.vertex = {}
+        self.number = [ 0 ] * count
+        self.vertex = [ None ]
+        self.parent = [ 0 ]
+        self.pred = [ None ]
         self.n = 0
-        self.graph.parent = None
-        self.depth_first_search(self.graph)
+        self.depth_first_search(graph, 0)
 
-        i = self.n
+# Vertex zero is the paper's dummy vertex, with a size and semi of
+# zero, that ends the child chains.
 
-        while i >= 2:
-            w = self.vertex[i]
+        n = self.n
+        semi = self.semi = range(n+1)
+        self.ancestor = [ 0 ] * (n+1)
+        self.d_label = range(n+1)
+        self.child = [ 0 ] * (n+1)
+        self.size = [ 0 ] + [ 1 ] * n
 
-            for v in w.pred:
+        bucket = [ [] for i in xrange(n+1) ]
+        dom = [ 0 ] * (n+1)
+        parent = self.parent
+
+        for w in xrange(n, 1, -1):
+            for v in self.pred[w]:
                 u = self.EVAL(v)
-                if u.semi < w.semi:
-                    w.semi = u.semi
+                if semi[u] < semi[w]:
+                    semi[w] = semi[u]
                     pass
 
-                self.vertex[w.semi].bucket.append(w)
-                self.LINK(w.parent, w)
-
-                while w.parent.bucket:
-                    v = w.parent.bucket.pop(0)
-                    u = self.EVAL(v)
+                pass
 
-                    v.dom = u if u.semi < v.semi else w.parent
-                    pass
+            bucket[semi[w]].append(w)
+            self.LINK(parent[w], w)
 
+            p = parent[w]
+            for v in bucket[p]:
+                u = self.EVAL(v)
+                dom[v] = u if semi[u] < semi[v] else p
                 pass
 
-            i = i - 1
+            bucket[p] = []
             pass
 
-        i = 2
-        while i <= self.n:
-            w = self.vertex[i]
-            if w.dom is not self.vertex[w.semi]:
-                w.dom = w.dom.dom
+        vertex = self.vertex
+        graph.dom = None
+
+        for w in xrange(2, n+1):
+            if dom[w] != semi[w]:
+                dom[w] = dom[dom[w]]
                 pass
 
-            i = i + 1
+            vertex[w].dom = vertex[dom[w]]
             pass
 
-        self.graph.dom = None
-
-        self.cleanup()
         return
 
 
-# depth_first_search()-- Depth first search of the flow graph.
-# Python's limit of 1000 frames limits statement chains in program
-# units to this much as well.
+# number_vertex()-- Give a node the next depth first number.
 
-    def depth_first_search(self, v):
+    def number_vertex(self, v, parent):
         self.n += 1
-        self.vertex[self.n] = v
-        v.semi = self.n
 
-        for w in v.successor():
-            if w.semi == 0:
-                w.parent = v
-                self.depth_first_search(w)
+        self.number[v.n] = self.n
+        self.vertex.append(v)
+        self.parent.append(parent)
+        self.pred.append([])
+        return self.n
+
+
+# depth_first_search()-- Depth first search of the flow graph.  The
+# search keeps its own stack of the nodes being visited, each with an
+# iterator over the successors still to look at, so that it isn't
+# limited by the depth of Python's stack.
+
+    def depth_first_search(self, v, parent):
+        number = self.number
+        pred = self.pred
+
+        stack = [ (self.number_vertex(v, parent), iter(v.successor())) ]
+
+        while len(stack) > 0:
+            i, successors = stack[-1]
+
+            for w in successors:
+                if number[w.n] == 0:
+                    j = self.number_vertex(w, i)
+                    pred[j].append(i)
+                    stack.append((j, iter(w.successor())))
+                    break
+
+                pred[number[w.n]].append(i)
+                pass
+
+            else:
+                stack.pop()
                 pass
 
-            w.pred.append(v)
             pass
 
         return
 
 
-# compress()-- The compress() function.
+# compress()-- The compress() function.  The recursive version
+# compresses the path above a node before the node itself, so this
+# climbs to the top of the path first, then works back down.
 
     def compress(self, v):
-        if v.ancestor.ancestor is None:
-            return
+        ancestor = self.ancestor
+        d_label = self.d_label
+        semi = self.semi
+
+        path = []
+
+        while ancestor[ancestor[v]] != 0:
+            path.append(v)
+            v = ancestor[v]
+            pass
 
-        self.compress(v.ancestor)
-        if v.ancestor.d_label.semi < v.d_label.semi:
-            v.d_label = v.ancestor.d_label
+        for v in reversed(path):
+            a = ancestor[v]
+            if semi[d_label[a]] < semi[d_label[v]]:
+                d_label[v] = d_label[a]
+                pass
+
+            ancestor[v] = ancestor[a]
             pass
 
-        v.ancestor = v.ancestor.ancestor
         return
 
 
+# EVAL()-- Return a vertex of minimum semidominator on the path from
+# the root of v's tree in the forest down to v, not counting the root.
+# The d_label of a vertex is only right relative to its tree, so the
+# label of v's ancestor is checked as well.
+
     def EVAL(self, v):
-        if v.ancestor is None:
-            return v
+        ancestor = self.ancestor
+        d_label = self.d_label
+
+        if ancestor[v] == 0:
+            return d_label[v]
 
         self.compress(v)
-        return v.d_label
 
+        a = d_label[ancestor[v]]
+        u = d_label[v]
+
+        return u if self.semi[a] >= self.semi[u] else a
+
+
+# LINK()-- Add the tree rooted at w to the forest as a child of v.
+# The subtree of w is first rebalanced along its chain of children,
+# then the smaller of the two trees is hung below the larger.
 
     def LINK(self, v, w):
-        w.ancestor = v
+        semi = self.semi
+        d_label = self.d_label
+        child = self.child
+        size = self.size
+        ancestor = self.ancestor
+
+        s = w
+        while semi[d_label[w]] < semi[d_label[child[s]]]:
+            if size[s] + size[child[child[s]]] >= 2 * size[child[s]]:
+                ancestor[child[s]] = s
+                child[s] = child[child[s]]
+
+            else:
+                size[child[s]] = size[s]
+                ancestor[s] = child[s]
+                s = child[s]
+                pass
+
+            pass
+
+        d_label[s] = d_label[w]
+        size[v] += size[w]
+
+        if size[v] < 2 * size[w]:
+            s, child[v] = child[v], s
+            pass
+
+        while s != 0:
+            ancestor[s] = v
+            s = child[s]
+            pass
+
         return
 
-# cleanup()-- Remove unneeded members from graph nodes.
+    pass
 
-    def cleanup(self):
-        st = self.graph
 
-        while st is not None:
-            del st.parent, st.semi, st.pred, st.bucket, st.d_label
-            del st.ancestor, st.size, st.child
-            st = st.next
+# iterative_dominators()-- Find the immediate dominators of the nodes
+# of a graph by the iterative method of Cooper, Harvey and Kennedy in
+# "A Simple, Fast Dominance Algorithm".  The nodes are visited in
+# reverse postorder, each node's dominator being the intersection of
+# the dominators of its predecessors, until nothing changes.  Nodes
+# are numbered by postorder, so that the intersection walks up the
+# tree from whichever side has the smaller number.  Takes the same
+# arguments and sets the same 'dom' members as find_dominators.
+
+def iterative_dominators(graph, count):
+    if graph is None:
+        return
+
+    number = [ -1 ] * count
+    visited = [ False ] * count
+    vertex = []
+    pred = []
+
+# Depth first search for the postorder, keeping a stack of nodes with
+# iterators over their successors.  Predecessors are recorded by the
+# node's 'n', then translated to postorder numbers.
+
+    by_n = [ [] for i in xrange(count) ]
+
+    visited[graph.n] = True
+    stack = [ (graph, iter(graph.successor())) ]
+
+    while len(stack) > 0:
+        v, successors = stack[-1]
+
+        for w in successors:
+            by_n[w.n].append(v.n)
+
+            if not visited[w.n]:
+                visited[w.n] = True
+                stack.append((w, iter(w.successor())))
+                break
+
+            pass
+
+        else:
+            stack.pop()
+            number[v.n] = len(vertex)
+            vertex.append(v)
             pass
 
+        pass
+
+    for v in vertex:
+        pred.append([ number[p] for p in by_n[v.n] ])
+        pass
+
+    n = len(vertex)
+    root = n - 1
+
+    dom = [ -1 ] * n
+    dom[root] = root
+
+    changed = True
+
+    while changed:
+        changed = False
+
+        for b in xrange(root - 1, -1, -1):
+            new_dom = -1
+
+            for p in pred[b]:
+                if dom[p] == -1:
+                    continue
+
+                if new_dom == -1:
+                    new_dom = p
+                    continue
+
+                f1 = p
+                f2 = new_dom
+
+                while f1 != f2:
+                    while f1 < f2:
+                        f1 = dom[f1]
+                        pass
+
+                    while f2 < f1:
+                        f2 = dom[f2]
+                        pass
+
+                    pass
+
+                new_dom = f1
+                pass
+
+            if dom[b] != new_dom:
+                dom[b] = new_dom
+                changed = True
+                pass
+
+            pass
+
+        pass
+
+    graph.dom = None
+
+    for b in xrange(root):
+        vertex[b].dom = vertex[dom[b]]
+        pass
+
+    return
+
+
+# The dominators analysis runs one of these engines on the blocks of a
+# procedure, as named by the dominator_engine of its ssa_options.  The
+# iterative engine is faster on the graphs that programs have, but the
+# number of passes that it takes can grow with the size of the graph,
+# as it does on irreducible ladders.  Lengauer-Tarjan's bound doesn't
+# depend on the shape, so 'auto' only uses the iterative engine on
+# graphs of fewer than iterative_limit blocks.  bench.py dominators
+# measures both.
+
+dominator_engines = {
+    'lengauer_tarjan':       find_dominators,
+    'cooper_harvey_kennedy': iterative_dominators,
+}
+
+
+# ssa_options are the settings of the back end that say how a
+# procedure is put into ssa form.  A compile_context carries them, so
+# that compilations in different threads or processes can use
+# different settings.  Unknown names raise ValueError.
+
+class ssa_options:
+    def __init__(self, ssa_form='minimal', phi_engine='cytron',
+                 dominator_engine='auto', iterative_limit=500):
+
+        if ssa_form not in ssa_forms:
+            raise ValueError, 'Unknown ssa form ' + repr(ssa_form)
+
+        if phi_engine not in phi_engines:
+            raise ValueError, 'Unknown phi engine ' + repr(phi_engine)
+
+        if dominator_engine != 'auto' and \
+           dominator_engine not in dominator_engines:
+            raise ValueError, 'Unknown dominator engine ' + \
+                repr(dominator_engine)
+
+        self.ssa_form = ssa_form
+        self.phi_engine = phi_engine
+        self.dominator_engine = dominator_engine
+        self.iterative_limit = iterative_limit
         return
 
+
+# key()-- Return the settings as strings, for cache keys.  The engines
+# are meant to give the same code, but keying on them keeps a bug in
+# one from reaching the builds that use another.
+
+    def key(self):
+        return [ self.ssa_form, self.phi_engine, self.dominator_engine,
+                 str(self.iterative_limit) ]
+
     pass
 
 
+# current_options()-- Return the ssa_options of the current context.
+
+def current_options():
+    opts = current_context().ssa_options
+    return ssa_options() if opts is None else opts
+
+
+# dominator_engine_for()-- Return the dominator engine to use on a
+# graph of a number of nodes, under some ssa_options.
+
+def dominator_engine_for(count, opts=None):
+    if opts is None:
+        opts = current_options()
+        pass
+
+    if opts.dominator_engine != 'auto':
+        return dominator_engines[opts.dominator_engine]
+
+    if count < opts.iterative_limit:
+        return iterative_dominators
+
+    return find_dominators
+
+
+
 # The next few subroutines come from "Efficiently computing static
 # single assignment form and the control dependence graph", by Cytron
 # et al in "ACM Transactions on Programming Languages and Systems" v13
 # n4, October 1991 p451-490.
 
 
-# dominance_tree()-- Given flowgraph nodes with immediate dominators,
-# compute the dominator tree.  The 'children' list contains the list
-# of nodes that are dominated by that node.
+# dominators()-- Find the immediate dominator of each block, then of
+# each node.  The first node of a block is immediately dominated by the
+# last node of the block's immediate dominator, and the other nodes by
+# the node before them.
 
-def dominance_tree(graph):
+def dominators(graph):
+    blocks = require('cfg', graph)
+    if len(blocks) == 0:
+        return
 
-    st = graph
-    while st is not None:
-        st.children = []
-        st = st.next
+    for b in blocks:
+        b.dom = None
         pass
 
-    st = graph
-    while st is not None:
-        if st.dom is not None:
-            st.dom.children.append(st)
+    dominator_engine_for(len(blocks))(blocks[0], len(blocks))
+
+    for b in blocks:
+        b.first.dom = None if b.dom is None else b.dom.last
+
+        st = b.first
+        while st is not b.last:
+            st.next.dom = st
+            st = st.next
             pass
 
-        st = st.next
         pass
 
     return
 
 
-# dominance_frontier()-- Recursive function for computing the
-# dominance frontier of each node.  The DF is computed via a bottom-up
-# traversal of the dominator tree.
+# dominance_tree()-- Given blocks and nodes with immediate dominators,
+# compute the dominator trees of both.  The 'children' list contains
+# the list of blocks or nodes that are immediately dominated by that
+# block or node.  The blocks are numbered for cfg.dominates().
 
-def dominance_frontier(x):
+def dominance_tree(graph):
+    blocks = require('cfg', graph)
 
-    for child in x.children:
-        dominance_frontier(child)
+    for b in blocks:
+        b.children = []
         pass
 
-    df = {}   # Dictionary avoids problem with duplicates
+    for b in blocks:
+        if b.dom is not None:
+            b.dom.children.append(b)
+            pass
+
+        pass
 
-    for y in x.successor():
-        if y.dom is not x:
-            df[y] = True
+    for b in blocks:
+        st = b.first
+        while st is not b.last:
+            st.children = [ st.next ]
+            st = st.next
             pass
 
+        b.last.children = [ c.first for c in b.children ]
         pass
 
-    for z in x.children:
-        for y in z.DF:
-            if y.dom is not x:
-                df[y] = True
+    number_dominator_tree(blocks)
+    return
+
+
+# dominance_frontier()-- Compute the dominance frontier of each block.
+# Only a block with several predecessors can be in a frontier.  It is
+# in the frontier of each block from a predecessor up the dominator
+# tree to its own immediate dominator, not including that.  This is
+# the method of Cooper, Harvey and Kennedy in "A Simple, Fast
+# Dominance Algorithm", which gives the same frontiers as walking the
+# dominator tree bottom-up as in Cytron et al.  A block only goes in
+# frontiers while its own predecessors are walked, so if it already
+# ends a runner's frontier, an earlier walk went on from there to the
+# immediate dominator, and this one can stop.
+
+def dominance_frontier(graph):
+    block_frontiers(require('cfg', graph))
+    return
+
+
+# block_frontiers()-- Set the DF list of each of a list of blocks whose
+# immediate dominators are known.
+
+def block_frontiers(blocks):
+    for b in blocks:
+        b.DF = []
+        pass
+
+    for b in blocks:
+        for p in b.predecessors:
+            runner = p
+
+            while runner is not None and runner is not b.dom:
+                if len(runner.DF) > 0 and runner.DF[-1] is b:
+                    break
+
+                runner.DF.append(b)
+                runner = runner.dom
                 pass
 
             pass
 
         pass
 
-    x.DF = df.keys()
     return
 
 
-# place_phi()-- Place phi functions in the flow graph using the
-# dominance frontiers.  Returns a list of variables in use by the
-# program.
+# The ssa_form of the ssa_options says which phi functions place_phi()
+# places.  'minimal' is the ssa form of Cytron et al, with a phi
+# function for a variable at every block in the iterated dominance
+# frontier of its assignments, whether or not the variable is used
+# after that.  'semi_pruned' only places phi functions for variables
+# that are used in some block before being set there, as a variable
+# that never is can't be live into any block.  'pruned' only places a
+# phi function where its variable is live into the block, which takes
+# the block liveness of the graph before renaming.  The variables that
+# the pruned forms leave out are dead where their phi functions would
+# have gone.  The register allocator still gives a dead phi result a
+# register of its own, so the forms differ in the moves and registers
+# they need, not in what the program computes.
+
+ssa_forms = [ 'minimal', 'semi_pruned', 'pruned' ]
+
+
+# nonlocal_names()-- Return the set of variables that some block uses
+# before setting them.
+
+def nonlocal_names(blocks):
+    names = set()
+
+    for b in blocks:
+        names |= block_uses(b)[0]
+        pass
+
+    return names
+
+
+# place_phi()-- Place phi functions in the flow graph with the engine
+# and in the ssa form named by the current ssa_options.  Phi functions
+# go on the label that starts a block.  Returns a list of variables in
+# use by the program.
 
 def place_phi(graph):
-    iter_count = 0
+    blocks = require('cfg', graph)
+    opts = current_options()
+    ssa_form = opts.ssa_form
+    phi_engine = opts.phi_engine
+
+    pruned = ssa_form == 'pruned'
+    if pruned:
+        require('block_liveness', graph)
+        pass
+
+    names = None
+    if ssa_form == 'semi_pruned':
+        names = nonlocal_names(blocks)
+        pass
+
+    if phi_engine == 'cytron':
+        require('dominance_frontier', graph)
+        pass
+
     assignments = {}
-    variables = {}
+    variables = ordered_dict()
 
     st = graph
     while st is not None:
-        st.has_already = 0
-        st.work = 0
-
         if isinstance(st, expr_assign):  # Create assignments map
-            if st.var in assignments:
-                assignments[st.var].append(st)
+            a = assignments.get(st.var)
 
-            else:
-                assignments[st.var] = [ st ]
+            if a is None:
+                assignments[st.var] = [ st.block ]
+
+            elif a[-1] is not st.block:
+                a.append(st.block)
                 pass
 
             pass
@@ -523,37 +918,195 @@ def place_phi(graph):
 
 #    print 'Assignments:'
 #    for k, v in assignments.items():
-#        print 'Variable', k.name, '@', [ st.n for st in v ]
+#        print 'Variable', k.name, '@', [ b.n for b in v ]
 #        pass
 #
 #    print 'Variables used:', [ v.name for v in variables ]
 
-    w = {}
+    engine = phi_engines[phi_engine](blocks)
 
     for v in variables:
-        iter_count += 1
-        for x in assignments[v]:
-            x.work = iter_count
+        if names is not None and v not in names:
+            continue
+
+        for y in engine.place(assignments[v]):
+            if pruned and v not in y.live_in:
+                continue
+
+            y.first.phi_list.append(phi(v))
+            pass
+
+        pass
+
+    return variables
+
+
+# Phi engines find the blocks that need a phi function for a variable,
+# the iterated dominance frontier of the blocks that assign it.  An
+# engine is made for the blocks of a graph, then its place() method is
+# called with the blocks that assign each variable, returning the
+# blocks that need a phi function.  The pruned form then drops the
+# blocks where the variable isn't live in, where a phi function would
+# be dead.  Each variable's phi functions are appended in the order of the
+# variables, so both engines give the same phi lists.
+#
+# 'cytron' is the worklist over dominance frontiers of Cytron et al.
+# The frontiers can take space quadratic in the number of blocks, as
+# on nested loops.  'dj_graph' is the method of Sreedhar and Gao in "A
+# Linear Time Algorithm for Placing phi-Nodes", POPL 1995, which walks
+# the dominator tree and the join edges of the flow graph instead, and
+# never builds the frontiers.  The phi_engine of the ssa_options picks
+# one, and bench.py phi_engines compares the two.
+
+
+# The 'cytron' engine.  The frontiers are the dominance_frontier
+# analysis, which place_phi() requires.  The has_already[] and work[]
+# side tables hold the number of the last call that put a block in the
+# result and in the worklist, so that they never need to be cleared.
+
+class frontier_placement:
+    def __init__(self, blocks):
+        self.has_already = [ 0 ] * len(blocks)
+        self.work = [ 0 ] * len(blocks)
+        self.iter_count = 0
+        return
+
+
+    def place(self, defs):
+        self.iter_count += 1
+        iter_count = self.iter_count
+
+        has_already = self.has_already
+        work = self.work
+
+        result = []
+        w = ordered_dict()
+
+        for x in defs:
+            work[x.n] = iter_count
             w[x] = True
             pass
 
         while len(w) > 0:
             x = w.popitem()[0]
             for y in x.DF:
-                if y.has_already < iter_count:
-                    y.phi_list.append(phi(v))
-                    y.has_already = iter_count
-                    if y.work < iter_count:
-                        y.work = iter_count
+                if has_already[y.n] < iter_count:
+                    result.append(y)
+                    has_already[y.n] = iter_count
+                    if work[y.n] < iter_count:
+                        work[y.n] = iter_count
                         w[y] = True
                         pass
 
                     pass
                 pass
             pass
-        pass
 
-    return variables
+        return result
+
+    pass
+
+
+# The 'dj_graph' engine.  The DJ graph is the dominator tree (its
+# D edges) plus the flow graph edges x -> y where x isn't the immediate
+# dominator of y (its J edges).  The blocks that assign a variable go
+# in a 'piggy bank', a heap ordered by depth in the dominator tree.
+# The deepest block is taken out and the subtree that it dominates is
+# walked.  A J edge from the subtree to a block no deeper than the
+# root of the walk leaves the root's dominance, so its target needs a
+# phi function, and goes in the bank itself.  Blocks are only walked
+# once for each variable, so each call takes time linear in the size
+# of the graph.
+
+class dj_placement:
+    def __init__(self, blocks):
+        count = len(blocks)
+
+        self.blocks = blocks
+        self.level = [ 0 ] * count
+        self.j_edges = [ [ s for s in b.successors if s.dom is not b ]
+                         for b in blocks ]
+
+        self.visited = [ 0 ] * count
+        self.in_phi = [ 0 ] * count
+        self.alpha = [ 0 ] * count
+        self.iter_count = 0
+
+        if count > 0:
+            for b in dominator_preorder(blocks[0]):
+                for c in b.children:
+                    self.level[c.n] = self.level[b.n] + 1
+                    pass
+
+                pass
+
+            pass
+
+        return
+
+
+    def place(self, defs):
+        self.iter_count += 1
+        iter_count = self.iter_count
+
+        level = self.level
+        j_edges = self.j_edges
+        visited = self.visited
+        in_phi = self.in_phi
+        alpha = self.alpha
+
+        result = []
+        bank = []
+
+        for x in defs:
+            alpha[x.n] = iter_count
+            heapq.heappush(bank, (-level[x.n], x.n))
+            pass
+
+        while len(bank) > 0:
+            root_level, n = heapq.heappop(bank)
+            root_level = -root_level
+
+            visited[n] = iter_count
+            stack = [ self.blocks[n] ]
+
+            while len(stack) > 0:
+                y = stack.pop()
+
+                for z in j_edges[y.n]:
+                    if level[z.n] <= root_level and in_phi[z.n] != iter_count:
+                        in_phi[z.n] = iter_count
+                        result.append(z)
+
+                        if alpha[z.n] != iter_count:
+                            heapq.heappush(bank, (-level[z.n], z.n))
+                            pass
+
+                        pass
+
+                    pass
+
+                for c in y.children:
+                    if visited[c.n] != iter_count:
+                        visited[c.n] = iter_count
+                        stack.append(c)
+                        pass
+
+                    pass
+
+                pass
+
+            pass
+
+        return result
+
+    pass
+
+
+phi_engines = {
+    'cytron':   frontier_placement,
+    'dj_graph': dj_placement,
+}
 
 
 # replace_vars()-- Top level variable replacement.  Returns the new
@@ -572,12 +1125,13 @@ def replace_vars(e, repl):
 # assignment.
 
 def replace_rhs(e):
+    stack = current_context().stack
     repl = {}
     e.used_vars(repl)
 
     for v in repl.keys():
-        if len(v.stack) > 0:
-            repl[v] = v.stack[-1]
+        if len(stack[v]) > 0:
+            repl[v] = stack[v][-1]
 
         else:
             del repl[v]
@@ -588,10 +1142,43 @@ def replace_rhs(e):
     return replace_vars(e, repl)
 
 
-# rename0()-- Recursive function for renaming ssa variables.  The
-# recursion follows the dominance tree.
+# rename0()-- Rename the ssa variables of a graph.  This walks the
+# dominance tree, keeping its own stack instead of recursing.  The
+# variables that a node defines are pushed on the work stack before its
+# children, so that their variants are popped once the walk has left
+# the node's subtree.
 
-def rename0(st):
+def rename0(graph):
+    stack = current_context().stack
+    work = [ graph ]
+
+    while len(work) > 0:
+        st = work.pop()
+
+        if isinstance(st, list):
+            for v in st:
+                stack[v].pop()
+                pass
+
+            continue
+
+        lhs_vars = rename_node(st, stack)
+
+        if len(lhs_vars) > 0:
+            work.append(lhs_vars)
+            pass
+
+        work.extend(reversed(st.children))
+        pass
+
+    return
+
+
+# rename_node()-- Rename the variables of a single node, and add its
+# arguments to the phi functions of the labels that follow it.
+# Returns the variables that the node pushed variants of.
+
+def rename_node(st, stack):
     lhs_vars = []
 
     if isinstance(st, expr_assign):
@@ -620,58 +1207,40 @@ def rename0(st):
     for y in st.successor():
         if isinstance(y, label):
             for p in y.phi_list:
-                p.args.append(phi_arg(p.var.stack[-1], st))
+                p.args.append(phi_arg(stack[p.var][-1], st))
                 pass
 
             pass
         pass
 
-    for y in st.children:
-        rename0(y)
-        pass
-
-    for v in lhs_vars:
-        v.stack.pop()
-        pass
-
-    return
+    return lhs_vars
 
 
 # rename_variables()-- Rename variables, give each variable assignment
 # a version number.
 
 def rename_variables(graph, variables):
+    ctx = current_context()
+
     for v in variables:
-        v.c = 0
-        v.stack = []
+        ctx.count[v] = 0
+        ctx.stack[v] = []
         pass
 
     rename0(graph)
 
-    for v in variables:
-        del v.c, v.stack
-        pass
-
+    ctx.count.clear()
+    ctx.stack.clear()
     return
 
 
-# ssa_conversion()-- Preform some initial optimization of the parsed
-# IR, then convert it to ssa form.
-
-def ssa_conversion(proc):
-    st = proc.block.flatten0()
-
-    st = label_optimize(st)
-    st = jump_optimize(st)
-    st = label_optimize(st)
-    st = remove_dead_code(st)
-
-    find_dominators(st)
-    dominance_tree(st)
-    dominance_frontier(st)
+# ssa_rename()-- Place phi functions and rename the variables of the
+# procedure being compiled, including any arguments that aren't used.
 
+def ssa_rename(st):
     variables = place_phi(st)
-    for v in proc.args.values():
+
+    for v in current_context().proc.args.values():
         if v not in variables:
             variables.append(v)
             pass
@@ -679,7 +1248,33 @@ def ssa_conversion(proc):
         pass
 
     rename_variables(st, variables)
-    st = ssa_expr(st)
+    return
+
+
+# The analyses computed here, and the passes that ssa_conversion()
+# runs.  Renaming and expanding expressions keep the blocks and the
+# dominator analyses valid, so the register allocator uses them as
+# they are.
 
-    return st
+analysis('dominators',         dominators,         [ 'cfg' ])
+analysis('dominance_tree',     dominance_tree,     [ 'dominators' ])
+analysis('dominance_frontier', dominance_frontier, [ 'dominators' ])
+
+dominance = [ 'cfg', 'dominators', 'dominance_tree', 'dominance_frontier' ]
+
+ssa_passes = [
+    ('label_optimize',   label_optimize,   [], []),
+    ('jump_optimize',    jump_optimize,    [], []),
+    ('label_optimize',   label_optimize,   [], []),
+    ('remove_dead_code', remove_dead_code, [], []),
+    ('ssa_rename',       ssa_rename,       dominance[:-1], dominance),
+    ('ssa_expr',         ssa_expr,         [], dominance) ]
+
+
+# ssa_conversion()-- Preform some initial optimization of the parsed
+# IR, then convert it to ssa form.
+
+def ssa_conversion(proc):
+    st = run_pass('flatten', lambda st: proc.block.flatten0(), None)
+    return run_passes(ssa_passes, st)
 
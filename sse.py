@@ -0,0 +1,447 @@
+#!/usr/bin/env python
+
+# (C) 2015 Andrew Vaught
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY
+# WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+# Library interface and command line for the SSE-C compiler.
+#
+#     import sse
+#
+#     r = sse.compile(text, sse.options(filename='kernel.sse'))
+#     sys.stdout.write(r.assembly)
+#
+# Nothing is printed unless debug is set in the options.  Errors in
+# the source raise lexer.compile_error.  Importing the compiler does
+# no work beyond defining things, the tables that the compiler needs
+# are built the first time that they are used.
+
+import os, sys, time
+
+import parser, ssa
+
+from lexer import compile_error
+from cache import disk_cache, build_state
+from passes import pass_timer
+
+
+# Compilation options.  With a parse_cache directory, parsed programs
+# are cached there, and with an asm_cache directory, the assembler of
+# each procedure is cached there, each cache taking up to cache_size
+# megabytes.  The assembly cache isn't used with debug, since what the
+# passes print isn't cached.  The state of a build() is kept either
+# way, and a debug build only prints the procedures that it compiles.
+# 'stream' compiles each procedure as soon as it is parsed, and with
+# jobs > 1, procedures are compiled in that many processes.  With
+# time_passes, each pass of the back end is measured.  The rest are
+# the settings of ssa.ssa_options.
+
+class options:
+    def __init__(self, filename='<string>', parse_cache=None, cache_size=64,
+                 stream=False, jobs=1, debug=False, asm_cache=None,
+                 time_passes=False, ssa_form='minimal', phi_engine='cytron',
+                 dominator_engine='auto', iterative_limit=500):
+
+        self.filename = filename
+        self.parse_cache = parse_cache
+        self.asm_cache = asm_cache
+        self.cache_size = cache_size
+        self.stream = stream
+        self.jobs = jobs
+        self.debug = debug
+        self.time_passes = time_passes
+        self.ssa_form = ssa_form
+        self.phi_engine = phi_engine
+        self.dominator_engine = dominator_engine
+        self.iterative_limit = iterative_limit
+        return
+
+    pass
+
+
+# The result of a compilation.  'procedures' is a list of (name,
+# assembler lines) and 'assembly' is the whole assembler text.  The
+# cache statistics are None if the cache wasn't used, and pass_timer
+# is None unless the passes were timed.
+
+class result:
+    def __init__(self, procedures, cache_stats=None, asm_cache_stats=None,
+                 pass_timer=None):
+        self.procedures = procedures
+        self.assembly = ''.join([ insn + '\n'
+                                  for name, insns in procedures
+                                  for insn in insns ])
+
+        self.cache_stats = cache_stats
+        self.asm_cache_stats = asm_cache_stats
+        self.pass_timer = pass_timer
+        return
+
+    pass
+
+
+# open_cache()-- Return the parse cache called for by the options, or
+# None.
+
+def open_cache(opts):
+    if opts.parse_cache is None:
+        return None
+
+    if opts.stream or opts.jobs > 1:
+        raise ValueError, 'The parse cache only works when compiling serially'
+
+    return disk_cache(opts.parse_cache, opts.cache_size << 20)
+
+
+# open_asm_cache()-- Return the assembly cache called for by the
+# options, or None.  There is none with debug, since what the passes
+# print isn't cached.
+
+def open_asm_cache(opts):
+    if opts.asm_cache is None or opts.debug:
+        return None
+
+    return disk_cache(opts.asm_cache, opts.cache_size << 20)
+
+
+# ssa_options()-- Return the ssa.ssa_options called for by the
+# options.
+
+def ssa_options(opts):
+    return ssa.ssa_options(opts.ssa_form, opts.phi_engine,
+                           opts.dominator_engine, opts.iterative_limit)
+
+
+# procedures()-- Generator that compiles a program, yielding the name
+# and assembler of each procedure.  If source is None, the program is
+# read from the file named in the options.  If a pass timer is given,
+# the passes are measured into it.
+
+def procedures(source, opts, cache=None, asm_cache=None, timer=None):
+    ssa_opts = ssa_options(opts)
+
+    if opts.jobs > 1:
+        for name, out, insns in parser.compile_parallel(opts.filename,
+                                                        opts.jobs, source,
+                                                        opts.debug,
+                                                        asm_cache, timer,
+                                                        ssa_opts):
+            sys.stdout.write(out)
+            yield name, insns
+            pass
+
+        return
+
+    if opts.stream:
+        for v in parser.stream_procedures(opts.filename, source, asm_cache,
+                                          ssa_opts):
+            yield v.name, parser.compile_procedure(v, opts.debug, asm_cache,
+                                                   timer, ssa_opts)
+            pass
+
+        return
+
+    namespace = parser.load_program(opts.filename, source, cache, asm_cache,
+                                    ssa_opts)
+
+    for v in namespace.values():
+        if isinstance(v, parser.procedure):
+            yield v.name, parser.compile_procedure(v, opts.debug, asm_cache,
+                                                   timer, ssa_opts)
+            pass
+
+        pass
+
+    return
+
+
+# compile()-- Compile program text, which is a string or a file-like
+# object.  Returns a result.
+
+def compile(source, opts=None):
+    if opts is None:
+        opts = options()
+        pass
+
+    cache = open_cache(opts)
+    asm_cache = open_asm_cache(opts)
+    timer = pass_timer() if opts.time_passes else None
+    procs = list(procedures(source, opts, cache, asm_cache, timer))
+
+    return result(procs, None if cache is None else cache.stats(),
+                  None if asm_cache is None else asm_cache.stats(), timer)
+
+
+# write_program()-- Compile a program the way the command line does,
+# printing the assembler of each procedure as soon as it is done.
+
+def write_program(source, opts, cache=None, asm_cache=None, timer=None):
+    for name, insns in procedures(source, opts, cache, asm_cache, timer):
+        for insn in insns:
+            print insn
+            pass
+
+        pass
+
+    return
+
+
+# build()-- Compile the file named in the options into an assembler
+# file.  The procedures that went into it are remembered in a state
+# file next to it, and on the next build, only procedures whose
+# fingerprint changed are compiled, the rest being spliced in from
+# last time.  Returns the number of procedures compiled and the total.
+
+def build(opts, output, source=None, cache=None, asm_cache=None, timer=None):
+    state = build_state(output + '.state', asm_cache)
+    procs = list(procedures(source, opts, cache, state, timer))
+
+    text = ''.join([ insn + '\n' for name, insns in procs for insn in insns ])
+
+    temp = output + '.tmp'
+    f = open(temp, 'w')
+    f.write(text)
+    f.close()
+    os.rename(temp, output)
+
+    state.save()
+    return state.misses, len(procs)
+
+
+# watch()-- Build whenever the source file changes, until interrupted.
+# Errors are reported, and the next change is waited for.
+
+def watch(opts, output, cache=None, asm_cache=None, interval=0.5):
+    last = None
+
+    while True:
+        try:
+            st = os.stat(opts.filename)
+            current = st.st_mtime, st.st_size
+
+        except OSError:
+            current = None
+            pass
+
+        if current is not None and current != last:
+            last = current
+            start = time.time()
+
+            try:
+                compiled, total = build(opts, output, None, cache, asm_cache)
+
+            except compile_error, e:
+                print e
+
+            else:
+                sys.stderr.write('%s: compiled %d of %d procedures '
+                                 'in %.3fs\n' % (output, compiled, total,
+                                                  time.time() - start))
+                pass
+
+            pass
+
+        time.sleep(interval)
+        pass
+
+    return
+
+
+# option_parser()-- Return the command line parser.  Other front ends
+# to the compiler add their own arguments to it.
+
+def option_parser(prog):
+    import argparse
+
+    ap = argparse.ArgumentParser(prog=prog, description='SSE-C compiler')
+
+    ap.add_argument('filename')
+    ap.add_argument('--parse-cache', metavar='DIR',
+                    help='Cache parsed programs in DIR')
+    ap.add_argument('--asm-cache', metavar='DIR',
+                    help='Cache the assembler of each procedure in DIR')
+    ap.add_argument('--cache-size', metavar='MB', type=int, default=64,
+                    help='Size limit of each cache directory')
+    ap.add_argument('--cache-stats', action='store_true',
+                    help='Report cache statistics on stderr')
+    ap.add_argument('--stream', action='store_true',
+                    help='Compile each procedure as soon as it is parsed')
+    ap.add_argument('-j', metavar='N', type=int, default=1, dest='jobs',
+                    help='Compile procedures in N processes')
+    ap.add_argument('-o', metavar='FILE', dest='output',
+                    help='Write the assembler to FILE, only compiling the '
+                    'procedures that changed since the last build')
+    ap.add_argument('--watch', action='store_true',
+                    help='Build FILE again whenever the source changes')
+    ap.add_argument('-q', '--quiet', action='store_true',
+                    help='Only write the assembler, without the passes\' '
+                    'debugging output')
+    ap.add_argument('--time-passes', action='store_const', const='text',
+                    help='Report the time, memory and graph size of each '
+                    'pass on stderr')
+    ap.add_argument('--time-passes-json', action='store_const', const='json',
+                    dest='time_passes',
+                    help='Like --time-passes, but report in JSON')
+    ap.add_argument('--ssa-form', default='minimal', choices=ssa.ssa_forms,
+                    help='Which phi functions to place: all of those of '
+                    'minimal ssa form, or only those of variables that '
+                    'may be live')
+    ap.add_argument('--phi-engine', default='cytron',
+                    choices=sorted(ssa.phi_engines),
+                    help='How to place phi functions')
+    ap.add_argument('--dominator-engine', default='auto',
+                    choices=[ 'auto' ] + sorted(ssa.dominator_engines),
+                    help='How to find dominators, by default picking an '
+                    'engine by the size of each procedure')
+
+    return ap
+
+
+# parse_options()-- Parse a command line, returning the arguments and
+# the compiler options that they call for.
+
+def parse_options(ap, argv):
+    args = ap.parse_args(argv[1:])
+
+    if args.jobs < 1:
+        ap.error('-j needs at least one process')
+
+    if args.watch and args.output is None:
+        ap.error('--watch needs an output file')
+
+    opts = options(args.filename, args.parse_cache, args.cache_size,
+                   args.stream, args.jobs, not args.quiet, args.asm_cache,
+                   args.time_passes is not None, args.ssa_form,
+                   args.phi_engine, args.dominator_engine)
+
+    return args, opts
+
+
+# report_passes()-- Write the pass timings on stderr, if there are
+# any, in the format asked for.
+
+def report_passes(args, timer):
+    if timer is not None:
+        sys.stderr.write(timer.json() if args.time_passes == 'json'
+                         else timer.report())
+        pass
+
+    return
+
+
+# main()-- Command line entry point.  The compile server runs this on
+# behalf of its clients, passing the client's working directory as
+# cwd.  Relative paths are taken relative to that directory, while
+# messages still show the file name as it was given.  The server
+# can't fork worker processes, so -j only works on the command line.
+
+def main(argv, cwd=None):
+    ap = option_parser(argv[0])
+    args, opts = parse_options(ap, argv)
+
+    if cwd is not None and opts.jobs > 1:
+        ap.error('-j only works on the command line')
+        pass
+
+    source = None
+
+    if cwd is not None:
+        source = open(os.path.join(cwd, opts.filename)).read()
+
+        if opts.parse_cache is not None:
+            opts.parse_cache = os.path.join(cwd, opts.parse_cache)
+            pass
+
+        if opts.asm_cache is not None:
+            opts.asm_cache = os.path.join(cwd, opts.asm_cache)
+            pass
+
+        pass
+
+    try:
+        cache = open_cache(opts)
+
+    except ValueError, msg:
+        ap.error(msg)
+        pass
+
+    asm_cache = open_asm_cache(opts)
+    timer = pass_timer() if opts.time_passes else None
+
+    if args.output is not None:
+        output = args.output if cwd is None else os.path.join(cwd, args.output)
+
+        if args.watch:
+            if cwd is not None:
+                ap.error('--watch only works on the command line')
+                pass
+
+            try:
+                watch(opts, output, cache, asm_cache)
+
+            except KeyboardInterrupt:
+                pass
+
+            return
+
+        try:
+            build(opts, output, source, cache, asm_cache, timer)
+
+        except compile_error, e:
+            print e
+            raise SystemExit, 1
+
+        report_passes(args, timer)
+        return
+
+    try:
+        write_program(source, opts, cache, asm_cache, timer)
+
+    except compile_error, e:
+        print e
+        raise SystemExit, 1
+
+    report_passes(args, timer)
+
+    if args.cache_stats:
+        for name, c in [ ('parse', cache), ('assembly', asm_cache) ]:
+            if c is not None:
+                stats = c.stats()
+                stats['name'] = name
+
+                sys.stderr.write('%(name)s cache: %(hits)d hits, '
+                                 '%(misses)d misses, %(entries)d entries, '
+                                 '%(size)d bytes\n' % stats)
+                pass
+
+            pass
+
+        pass
+
+    return
+
+
+if __name__ == '__main__':
+    main(sys.argv)
+    pass